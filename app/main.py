@@ -1,5 +1,4 @@
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from app.database import engine, Base, get_db, SessionLocal
 from app.routers import books, marketing, settings, video, crm, webhook, youtube, book_factory, auth, diagnostics, hotmart, music
@@ -7,7 +6,11 @@ from dotenv import load_dotenv
 import os
 from contextlib import asynccontextmanager
 from app.services.monitor_service import monitor_service
-from sqlalchemy import text, inspect
+from app.services import job_queue, render_profile
+from app.services.eta_model import eta_model
+from app.services.storage import StorageStaticFiles
+from sqlalchemy import text
+from app.migrations import run_migrations
 from app.models import User
 from app.routers.auth import get_password_hash
 
@@ -17,116 +20,9 @@ load_dotenv()
 # Create tables
 Base.metadata.create_all(bind=engine)
 
-def run_migrations(engine):
-    try:
-        inspector = inspect(engine)
-        if "books" in inspector.get_table_names():
-            columns = [c["name"] for c in inspector.get_columns("books")]
-            if "cover_image_base64" not in columns:
-                print("Migrating: Adding missing column cover_image_base64 to books table...")
-                with engine.connect() as conn:
-                    conn.execute(text("ALTER TABLE books ADD COLUMN cover_image_base64 TEXT"))
-                    conn.commit()
-            else:
-                print("Migration: Column cover_image_base64 already exists.")
-        
-        # Check if users table exists (create_all should handle, but just in case)
-        if "users" not in inspector.get_table_names():
-             print("Migration: Creating users table...")
-             Base.metadata.create_all(bind=engine)
-        else:
-            # Check for must_change_password column
-            user_columns = [c["name"] for c in inspector.get_columns("users")]
-            if "must_change_password" not in user_columns:
-                print("Migrating: Adding missing column must_change_password to users table...")
-                with engine.connect() as conn:
-                    conn.execute(text("ALTER TABLE users ADD COLUMN must_change_password BOOLEAN DEFAULT 0"))
-                    conn.commit()
-
-            # Check for ScheduledVideo new columns
-            if "scheduled_videos" in inspector.get_table_names():
-                sv_columns = [c["name"] for c in inspector.get_columns("scheduled_videos")]
-                with engine.connect() as conn:
-                    if "progress" not in sv_columns:
-                        print("Migrating: Adding progress to scheduled_videos...")
-                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN progress INTEGER DEFAULT 0"))
-                    if "publish_at" not in sv_columns:
-                        print("Migrating: Adding publish_at to scheduled_videos...")
-                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN publish_at TIMESTAMP"))
-                    if "auto_post" not in sv_columns:
-                        print("Migrating: Adding auto_post to scheduled_videos...")
-                        # Use FALSE for compatibility with both SQLite and PostgreSQL
-                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN auto_post BOOLEAN DEFAULT FALSE"))
-                    if "youtube_video_id" not in sv_columns:
-                        print("Migrating: Adding youtube_video_id to scheduled_videos...")
-                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN youtube_video_id TEXT"))
-                    if "uploaded_at" not in sv_columns:
-                        print("Migrating: Adding uploaded_at to scheduled_videos...")
-                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN uploaded_at TIMESTAMP"))
-                    if "updated_at" not in sv_columns:
-                        print("Migrating: Adding updated_at to scheduled_videos...")
-                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN updated_at TIMESTAMP"))
-
-                    if "voice_style" not in sv_columns:
-                        print("Migrating: Adding voice_style to scheduled_videos...")
-                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN voice_style VARCHAR DEFAULT 'human'"))
-                    
-                    if "voice_gender" not in sv_columns:
-                        print("Migrating: Adding voice_gender to scheduled_videos...")
-                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN voice_gender VARCHAR DEFAULT 'female'"))
-                        
-                    conn.commit()
-
-            # Check for Settings new columns
-            if "settings" in inspector.get_table_names():
-                settings_columns = [c["name"] for c in inspector.get_columns("settings")]
-                with engine.connect() as conn:
-                    if "gemini_api_key" not in settings_columns:
-                        print("Migrating: Adding gemini_api_key to settings...")
-                        conn.execute(text("ALTER TABLE settings ADD COLUMN gemini_api_key TEXT"))
-                
-                    if "deepseek_api_key" not in settings_columns:
-                        print("Migrating: Adding deepseek_api_key to settings...")
-                        conn.execute(text("ALTER TABLE settings ADD COLUMN deepseek_api_key TEXT"))
-                
-                    if "groq_api_key" not in settings_columns:
-                        print("Migrating: Adding groq_api_key to settings...")
-                        conn.execute(text("ALTER TABLE settings ADD COLUMN groq_api_key TEXT"))
-                    
-                    if "anthropic_api_key" not in settings_columns:
-                        print("Migrating: Adding anthropic_api_key to settings...")
-                        conn.execute(text("ALTER TABLE settings ADD COLUMN anthropic_api_key TEXT"))
-
-                    if "mistral_api_key" not in settings_columns:
-                        print("Migrating: Adding mistral_api_key to settings...")
-                        conn.execute(text("ALTER TABLE settings ADD COLUMN mistral_api_key TEXT"))
-
-                    if "openrouter_api_key" not in settings_columns:
-                        print("Migrating: Adding openrouter_api_key to settings...")
-                        conn.execute(text("ALTER TABLE settings ADD COLUMN openrouter_api_key TEXT"))
-
-                    if "ai_provider" not in settings_columns:
-                        print("Migrating: Adding ai_provider to settings...")
-                        conn.execute(text("ALTER TABLE settings ADD COLUMN ai_provider TEXT DEFAULT 'openai'"))
-                    
-                    # Hotmart Integration
-                    if "hotmart_client_id" not in settings_columns:
-                        print("Migrating: Adding hotmart_client_id to settings...")
-                        conn.execute(text("ALTER TABLE settings ADD COLUMN hotmart_client_id TEXT"))
-                    if "hotmart_client_secret" not in settings_columns:
-                        print("Migrating: Adding hotmart_client_secret to settings...")
-                        conn.execute(text("ALTER TABLE settings ADD COLUMN hotmart_client_secret TEXT"))
-                    if "hotmart_access_token" not in settings_columns:
-                        print("Migrating: Adding hotmart_access_token to settings...")
-                        conn.execute(text("ALTER TABLE settings ADD COLUMN hotmart_access_token TEXT"))
-                    if "hotmart_token_expires_at" not in settings_columns:
-                        print("Migrating: Adding hotmart_token_expires_at to settings...")
-                        conn.execute(text("ALTER TABLE settings ADD COLUMN hotmart_token_expires_at TIMESTAMP"))
-                    conn.commit()
-
-
-    except Exception as e:
-        print(f"Migration warning: {e}")
+# Fila, uploads e monitoramento dentro do processo web (padrão, free tier).
+# Com um worker separado (python -m app.worker), use EMBEDDED_WORKER=false: a API só enfileira.
+EMBEDDED_WORKER = os.getenv("EMBEDDED_WORKER", "true").lower() not in ("0", "false", "no")
 
 def create_default_user():
     db = SessionLocal()
@@ -161,24 +57,21 @@ async def lifespan(app: FastAPI):
     # Create default user
     create_default_user()
     
+    # Perfil de render (renders sob demanda rodam neste processo mesmo sem o worker embutido)
+    render_profile.start_autotune()
+
     # Start Monitor Service
-    monitor_service.start()
+    if EMBEDDED_WORKER:
+        monitor_service.start()
+    else:
+        print("EMBEDDED_WORKER desativado: renders e uploads ficam a cargo de app.worker.")
+        # ETAs das rotas (admissão, agenda): sem o job do monitor, o ajuste roda aqui
+        eta_model.start_refit_loop()
     
-    # RECOVERY: Reset any stuck 'processing' videos to 'queued'
-    # This handles cases where the server crashed (OOM) during processing
+    # RECOVERY: Return 'processing' videos whose lease expired (server crashed/OOM) to 'queued'.
+    # Videos still leased by another live worker are left alone.
     try:
-        from app.models import ScheduledVideo
-        db = SessionLocal()
-        try:
-            stuck_videos = db.query(ScheduledVideo).filter(ScheduledVideo.status == "processing").all()
-            if stuck_videos:
-                print(f"Startup Recovery: Found {len(stuck_videos)} stuck videos. Resetting to 'queued'.")
-                for vid in stuck_videos:
-                    vid.status = "queued"
-                    vid.progress = 0 # Reset progress to avoid UI confusion
-                db.commit()
-        finally:
-            db.close()
+        job_queue.reclaim_expired()
     except Exception as e:
         print(f"Startup Recovery Error: {e}")
     
@@ -194,7 +87,7 @@ app = FastAPI(
 )
 
 # Montar arquivos estáticos
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+app.mount("/static", StorageStaticFiles(directory="app/static"), name="static")
 
 @app.get("/")
 async def read_root():
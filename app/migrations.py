@@ -0,0 +1,177 @@
+"""
+Migrações do esquema (colunas adicionadas depois que as tabelas existiam).
+
+Ficam fora de app.main para o worker (python -m app.worker) migrar o banco
+sem importar os routers nem montar a aplicação FastAPI.
+"""
+from sqlalchemy import text, inspect
+from app.database import Base
+
+
+def run_migrations(engine):
+    try:
+        inspector = inspect(engine)
+        if "books" in inspector.get_table_names():
+            columns = [c["name"] for c in inspector.get_columns("books")]
+            if "cover_image_base64" not in columns:
+                print("Migrating: Adding missing column cover_image_base64 to books table...")
+                with engine.connect() as conn:
+                    conn.execute(text("ALTER TABLE books ADD COLUMN cover_image_base64 TEXT"))
+                    conn.commit()
+            else:
+                print("Migration: Column cover_image_base64 already exists.")
+        
+        # Check if users table exists (create_all should handle, but just in case)
+        if "users" not in inspector.get_table_names():
+             print("Migration: Creating users table...")
+             Base.metadata.create_all(bind=engine)
+        else:
+            # Check for must_change_password column
+            user_columns = [c["name"] for c in inspector.get_columns("users")]
+            if "must_change_password" not in user_columns:
+                print("Migrating: Adding missing column must_change_password to users table...")
+                with engine.connect() as conn:
+                    conn.execute(text("ALTER TABLE users ADD COLUMN must_change_password BOOLEAN DEFAULT 0"))
+                    conn.commit()
+
+            # Check for ScheduledVideo new columns
+            if "scheduled_videos" in inspector.get_table_names():
+                sv_columns = [c["name"] for c in inspector.get_columns("scheduled_videos")]
+                with engine.connect() as conn:
+                    if "progress" not in sv_columns:
+                        print("Migrating: Adding progress to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN progress INTEGER DEFAULT 0"))
+                    if "publish_at" not in sv_columns:
+                        print("Migrating: Adding publish_at to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN publish_at TIMESTAMP"))
+                    if "auto_post" not in sv_columns:
+                        print("Migrating: Adding auto_post to scheduled_videos...")
+                        # Use FALSE for compatibility with both SQLite and PostgreSQL
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN auto_post BOOLEAN DEFAULT FALSE"))
+                    if "youtube_video_id" not in sv_columns:
+                        print("Migrating: Adding youtube_video_id to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN youtube_video_id TEXT"))
+                    if "uploaded_at" not in sv_columns:
+                        print("Migrating: Adding uploaded_at to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN uploaded_at TIMESTAMP"))
+                    if "updated_at" not in sv_columns:
+                        print("Migrating: Adding updated_at to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN updated_at TIMESTAMP"))
+
+                    if "voice_style" not in sv_columns:
+                        print("Migrating: Adding voice_style to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN voice_style VARCHAR DEFAULT 'human'"))
+                    
+                    if "voice_gender" not in sv_columns:
+                        print("Migrating: Adding voice_gender to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN voice_gender VARCHAR DEFAULT 'female'"))
+
+                    if "degradations" not in sv_columns:
+                        print("Migrating: Adding degradations to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN degradations TEXT"))
+
+                    if "lease_owner" not in sv_columns:
+                        print("Migrating: Adding lease columns to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN lease_owner VARCHAR"))
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN lease_expires_at TIMESTAMP"))
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN heartbeat_at TIMESTAMP"))
+                        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_scheduled_videos_lease_owner ON scheduled_videos (lease_owner)"))
+
+                    if "started_at" not in sv_columns:
+                        print("Migrating: Adding started_at to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN started_at TIMESTAMP"))
+
+                    if "progress_message" not in sv_columns:
+                        print("Migrating: Adding progress_message to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN progress_message VARCHAR"))
+
+                    if "peak_rss_mb" not in sv_columns:
+                        print("Migrating: Adding peak_rss_mb and exit_cause to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN peak_rss_mb INTEGER"))
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN exit_cause VARCHAR"))
+
+                    if "upload_session_uri" not in sv_columns:
+                        print("Migrating: Adding resumable upload columns to scheduled_videos...")
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN upload_session_uri VARCHAR"))
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN upload_offset BIGINT"))
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN upload_size BIGINT"))
+                        conn.execute(text("ALTER TABLE scheduled_videos ADD COLUMN upload_started_at TIMESTAMP"))
+                        
+                    conn.commit()
+
+            # Check for Settings new columns
+            if "settings" in inspector.get_table_names():
+                settings_columns = [c["name"] for c in inspector.get_columns("settings")]
+                with engine.connect() as conn:
+                    if "gemini_api_key" not in settings_columns:
+                        print("Migrating: Adding gemini_api_key to settings...")
+                        conn.execute(text("ALTER TABLE settings ADD COLUMN gemini_api_key TEXT"))
+                
+                    if "deepseek_api_key" not in settings_columns:
+                        print("Migrating: Adding deepseek_api_key to settings...")
+                        conn.execute(text("ALTER TABLE settings ADD COLUMN deepseek_api_key TEXT"))
+                
+                    if "groq_api_key" not in settings_columns:
+                        print("Migrating: Adding groq_api_key to settings...")
+                        conn.execute(text("ALTER TABLE settings ADD COLUMN groq_api_key TEXT"))
+                    
+                    if "anthropic_api_key" not in settings_columns:
+                        print("Migrating: Adding anthropic_api_key to settings...")
+                        conn.execute(text("ALTER TABLE settings ADD COLUMN anthropic_api_key TEXT"))
+
+                    if "mistral_api_key" not in settings_columns:
+                        print("Migrating: Adding mistral_api_key to settings...")
+                        conn.execute(text("ALTER TABLE settings ADD COLUMN mistral_api_key TEXT"))
+
+                    if "openrouter_api_key" not in settings_columns:
+                        print("Migrating: Adding openrouter_api_key to settings...")
+                        conn.execute(text("ALTER TABLE settings ADD COLUMN openrouter_api_key TEXT"))
+
+                    if "ai_provider" not in settings_columns:
+                        print("Migrating: Adding ai_provider to settings...")
+                        conn.execute(text("ALTER TABLE settings ADD COLUMN ai_provider TEXT DEFAULT 'openai'"))
+                    
+                    # Hotmart Integration
+                    if "hotmart_client_id" not in settings_columns:
+                        print("Migrating: Adding hotmart_client_id to settings...")
+                        conn.execute(text("ALTER TABLE settings ADD COLUMN hotmart_client_id TEXT"))
+                    if "hotmart_client_secret" not in settings_columns:
+                        print("Migrating: Adding hotmart_client_secret to settings...")
+                        conn.execute(text("ALTER TABLE settings ADD COLUMN hotmart_client_secret TEXT"))
+                    if "hotmart_access_token" not in settings_columns:
+                        print("Migrating: Adding hotmart_access_token to settings...")
+                        conn.execute(text("ALTER TABLE settings ADD COLUMN hotmart_access_token TEXT"))
+                    if "hotmart_token_expires_at" not in settings_columns:
+                        print("Migrating: Adding hotmart_token_expires_at to settings...")
+                        conn.execute(text("ALTER TABLE settings ADD COLUMN hotmart_token_expires_at TIMESTAMP"))
+                    conn.commit()
+
+            # Check for VideoTask new columns (previsão de ETA)
+            if "video_tasks" in inspector.get_table_names():
+                task_columns = [c["name"] for c in inspector.get_columns("video_tasks")]
+                with engine.connect() as conn:
+                    if "predicted_seconds" not in task_columns:
+                        print("Migrating: Adding predicted_seconds to video_tasks...")
+                        conn.execute(text("ALTER TABLE video_tasks ADD COLUMN predicted_seconds FLOAT"))
+                    if "started_at" not in task_columns:
+                        print("Migrating: Adding started_at to video_tasks...")
+                        conn.execute(text("ALTER TABLE video_tasks ADD COLUMN started_at TIMESTAMP"))
+                    if "payload" not in task_columns:
+                        print("Migrating: Adding queue columns to video_tasks...")
+                        conn.execute(text("ALTER TABLE video_tasks ADD COLUMN payload TEXT"))
+                        conn.execute(text("ALTER TABLE video_tasks ADD COLUMN lease_owner VARCHAR"))
+                        conn.execute(text("ALTER TABLE video_tasks ADD COLUMN lease_expires_at TIMESTAMP"))
+                        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_video_tasks_lease_owner ON video_tasks (lease_owner)"))
+                    conn.commit()
+
+            if "media_assets" in inspector.get_table_names() and engine.dialect.name == "postgresql":
+                size_column = next(c for c in inspector.get_columns("media_assets") if c["name"] == "size_bytes")
+                if str(size_column["type"]).upper() == "INTEGER":
+                    with engine.connect() as conn:
+                        # INTEGER estoura em vídeos acima de 2 GB
+                        print("Migrating: Widening media_assets.size_bytes to BIGINT...")
+                        conn.execute(text("ALTER TABLE media_assets ALTER COLUMN size_bytes TYPE BIGINT"))
+                        conn.commit()
+
+    except Exception as e:
+        print(f"Migration warning: {e}")
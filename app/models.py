@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime, ForeignKey, Boolean, UniqueConstraint, BigInteger
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime
@@ -128,6 +128,7 @@ class ScheduledVideo(Base):
     
     # New fields for progress and scheduling
     progress = Column(Integer, default=0)
+    progress_message = Column(String, nullable=True) # Etapa atual do render (ProgressReporter)
     publish_at = Column(DateTime, nullable=True)
     auto_post = Column(Boolean, default=False)
     voice_style = Column(String, default="human")
@@ -135,6 +136,20 @@ class ScheduledVideo(Base):
     youtube_video_id = Column(String, nullable=True)
     uploaded_at = Column(DateTime, nullable=True)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    degradations = Column(Text, nullable=True) # JSON: etapas que estouraram o orçamento e o fallback usado
+    # Posse do render (job_queue): worker dono, validade do lease e último heartbeat
+    lease_owner = Column(String, nullable=True, index=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True) # Início do render atual (base do tempo restante previsto)
+    # Resultado do render isolado (render_sandbox): pico de memória e causa da saída do processo
+    peak_rss_mb = Column(Integer, nullable=True)
+    exit_cause = Column(String, nullable=True) # completed, render_error, memory_limit, cpu_limit, wall_timeout, killed
+    # Sessão de upload resumível do YouTube: continua do último byte confirmado após falha ou reinício
+    upload_session_uri = Column(String, nullable=True)
+    upload_offset = Column(BigInteger, nullable=True)
+    upload_size = Column(BigInteger, nullable=True) # Tamanho do arquivo quando a sessão foi aberta
+    upload_started_at = Column(DateTime, nullable=True)
 
 class User(Base):
     __tablename__ = "users"
@@ -165,3 +180,110 @@ class ChannelReport(Base):
     # Status
     status = Column(String, default="generated")
 
+
+class VideoTask(Base):
+    """Tarefas de geração sob demanda (task_manager), visíveis a todos os workers"""
+    __tablename__ = "video_tasks"
+
+    id = Column(String, primary_key=True, index=True) # uuid
+    batch_id = Column(String, ForeignKey("video_task_batches.id"), nullable=True, index=True)
+    position = Column(Integer, default=0) # Ordem do item dentro do lote
+    title = Column(String, nullable=True)
+    status = Column(String, default="pending") # pending, processing, completed, failed
+    progress = Column(Integer, default=0)
+    message = Column(Text, nullable=True)
+    result = Column(Text, nullable=True) # JSON
+    predicted_seconds = Column(Float, nullable=True) # Duração prevista do render (eta_model)
+    started_at = Column(DateTime, nullable=True) # Quando a tarefa passou a "processing"
+    # Itens de lote renderizados pela fila (job_queue): parâmetros do render e posse do worker
+    payload = Column(Text, nullable=True) # JSON
+    lease_owner = Column(String, nullable=True, index=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, index=True) # Base do TTL
+
+class VideoTaskBatch(Base):
+    __tablename__ = "video_task_batches"
+
+    id = Column(String, primary_key=True, index=True) # uuid
+    status = Column(String, default="pending")
+    message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, index=True)
+
+class RenderTelemetry(Base):
+    """Duração por etapa de cada render (alimenta o modelo de ETA em eta_model)"""
+    __tablename__ = "render_telemetry"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String) # scheduled, task, batch
+    video_id = Column(Integer, nullable=True, index=True)
+    task_id = Column(String, nullable=True)
+    renderer = Column(String, index=True)
+    status = Column(String) # completed, failed
+    # Características do job
+    scene_count = Column(Integer)
+    text_chars = Column(Integer)
+    width = Column(Integer)
+    height = Column(Integer)
+    duration_seconds = Column(Float, nullable=True) # Duração do vídeo gerado
+    # Tempo gasto (segundos)
+    stage_script = Column(Float, default=0)
+    stage_images = Column(Float, default=0)
+    stage_tts = Column(Float, default=0)
+    stage_music = Column(Float, default=0)
+    stage_encode = Column(Float, default=0)
+    total_seconds = Column(Float)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+
+class JobStage(Base):
+    """Etapa persistida do pipeline de um vídeo agendado (DAG em job_stages)"""
+    __tablename__ = "job_stages"
+    __table_args__ = (UniqueConstraint("video_id", "name", name="uq_job_stages_video_name"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(Integer, ForeignKey("scheduled_videos.id", ondelete="CASCADE"), index=True)
+    name = Column(String) # script, images, tts, music, encode, upload
+    status = Column(String, default="pending") # pending, running, completed, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, nullable=True) # Backoff da próxima tentativa
+    output = Column(Text, nullable=True) # JSON com o resultado da etapa (caminhos, roteiro...)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class MediaAsset(Base):
+    """Vídeo gerado, sondado uma única vez com ffprobe (catálogo de /youtube/videos, ver media_catalog)"""
+    __tablename__ = "media_assets"
+
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String, unique=True, index=True) # /static/videos/...
+    source = Column(String, index=True) # scheduled, task, batch, request, clip
+    video_id = Column(Integer, nullable=True, index=True) # ScheduledVideo de origem
+    task_id = Column(String, nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    codec = Column(String, nullable=True)
+    poster_url = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+
+class QueueSignal(Base):
+    """Versão da fila de renderização, incrementada ao enfileirar em um processo sem despachante (ver job_queue.signal_changed)"""
+    __tablename__ = "queue_signals"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True)
+    version = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class ApiQuotaUsage(Base):
+    """Unidades da cota diária da YouTube Data API consumidas por dia do Pacífico (ver youtube_quota)"""
+    __tablename__ = "api_quota_usage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(String, unique=True, index=True) # YYYY-MM-DD no fuso America/Los_Angeles
+    units = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -8,6 +8,7 @@ import requests
 from pydantic import BaseModel
 from app.services.book_assembler import BookAssembler
 from app.services.ai_generator import AIContentGenerator
+from app.services import storage
 from app.database import get_db
 from app.models import Book, BookDraft
 from sqlalchemy.orm import Session
@@ -199,6 +200,7 @@ async def generate_covers(request: GenerateCoverRequest):
                         file_path = os.path.join(COVERS_DIR, filename)
                         with open(file_path, "wb") as out_file:
                             shutil.copyfileobj(response.raw, out_file)
+                        storage.persist(file_path)
                         saved_urls.append(f"/static/covers/{filename}")
                     else:
                         saved_urls.append(url)
@@ -227,7 +229,7 @@ def resolve_cover_path(filename: str) -> Optional[str]:
         clean_name = clean_name.replace("/static/", "", 1)
     
     p2 = os.path.join("app", "static", clean_name)
-    if os.path.exists(p2):
+    if storage.ensure_local(p2):
         return p2
         
     return None
@@ -412,6 +414,7 @@ async def generate_from_draft(draft_id: int, db: Session = Depends(get_db)):
         output_file = assembler.create_book(book_data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao gerar PDF: {e}")
+    storage.persist(output_file)
 
     try:
         new_book = Book(
@@ -461,6 +464,7 @@ async def generate_book_pdf(request: BookGenerationRequest, db: Session = Depend
     }
     
     output_file = assembler.create_book(book_data)
+    storage.persist(output_file)
     
     # Save to Database for "Meus Livros"
     try:
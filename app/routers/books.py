@@ -12,6 +12,8 @@ from fastapi.responses import FileResponse, Response
 from app.services.book_assembler import BookAssembler
 
 import base64
+import asyncio
+from app.services import storage
 
 router = APIRouter(prefix="/books", tags=["Books"])
 
@@ -37,9 +39,10 @@ async def create_book(
         safe_filename = get_safe_filename(file.filename)
         file_location = os.path.join(upload_dir, safe_filename)
         
-        content = await file.read()
+        # Copia em blocos: o PDF não é carregado inteiro em memória
         with open(file_location, "wb") as buffer:
-            buffer.write(content)
+            shutil.copyfileobj(file.file, buffer)
+        await asyncio.to_thread(storage.persist, file_location)
         
         # Caminho relativo para acesso via web
         file_path = f"/static/books/{safe_filename}"
@@ -57,6 +60,7 @@ async def create_book(
         # Save to disk
         with open(cover_location, "wb") as buffer:
             buffer.write(content)
+        await asyncio.to_thread(storage.persist, cover_location)
         cover_image_url = f"/static/covers/{safe_covername}"
         
         # Save to Base64
@@ -121,9 +125,9 @@ async def update_book(
         safe_filename = get_safe_filename(file.filename)
         file_location = os.path.join(upload_dir, safe_filename)
         
-        content = await file.read()
         with open(file_location, "wb") as buffer:
-            buffer.write(content)
+            shutil.copyfileobj(file.file, buffer)
+        await asyncio.to_thread(storage.persist, file_location)
         db_book.file_path = f"/static/books/{safe_filename}"
 
     if cover_file:
@@ -136,6 +140,7 @@ async def update_book(
         
         with open(cover_location, "wb") as buffer:
             buffer.write(content)
+        await asyncio.to_thread(storage.persist, cover_location)
         db_book.cover_image_url = f"/static/covers/{safe_covername}"
         
         # Save to Base64
@@ -192,7 +197,7 @@ def get_book_cover(book_id: int, db: Session = Depends(get_db)):
         cover_rel = db_book.cover_image_url.lstrip("/")
         cover_path = os.path.join("app", cover_rel) if cover_rel else None
         
-        if cover_path and os.path.exists(cover_path):
+        if cover_path and storage.ensure_local(cover_path):
             # Determina tipo MIME pela extensão
             ext = os.path.splitext(cover_path)[1].lower()
             media_type = {
@@ -212,8 +217,8 @@ def get_book_cover(book_id: int, db: Session = Depends(get_db)):
 def download_book(book_id: int, db: Session = Depends(get_db)):
     """
     Faz o download do PDF do livro.
-    - Se o arquivo existir no disco, retorna direto.
-    - Se não existir (ex: Render reiniciou), tenta REGERAR o PDF a partir do conteúdo salvo em full_text.
+    - Se o arquivo existir no disco ou no armazenamento durável, retorna direto.
+    - Se não existir (ex: Render reiniciou sem armazenamento durável), tenta REGERAR o PDF a partir do conteúdo salvo em full_text.
     """
     db_book = db.query(Book).filter(Book.id == book_id).first()
     if not db_book:
@@ -224,7 +229,7 @@ def download_book(book_id: int, db: Session = Depends(get_db)):
     abs_path = os.path.join("app", rel_path) if rel_path else None
 
     # Se o arquivo ainda existir, devolve direto
-    if abs_path and os.path.exists(abs_path):
+    if abs_path and storage.ensure_local(abs_path):
         filename = os.path.basename(abs_path)
         return FileResponse(abs_path, media_type="application/pdf", filename=filename)
 
@@ -242,6 +247,8 @@ def download_book(book_id: int, db: Session = Depends(get_db)):
     if db_book.cover_image_url:
         cover_rel = db_book.cover_image_url.lstrip("/")
         cover_image = os.path.join("app", cover_rel) if cover_rel else None
+        if cover_image:
+            storage.ensure_local(cover_image)
 
     # Garante diretório de saída
     output_dir = os.path.join("app", "static", "generated")
@@ -265,6 +272,8 @@ def download_book(book_id: int, db: Session = Depends(get_db)):
         print(f"Erro ao regerar livro {book_id}: {e}")
         raise HTTPException(status_code=500, detail="Erro ao regerar o PDF do livro.")
 
+    storage.persist(final_path)
+
     # Atualiza caminho salvo no banco para futuras chamadas
     db_book.file_path = f"/static/generated/{os.path.basename(final_path)}"
     db.commit()
@@ -4,6 +4,7 @@ from sqlalchemy import text
 from app.database import get_db
 from app.models import Settings
 from app.services.ai_generator import AIContentGenerator
+from app.services import workspace, storage
 import os
 import requests
 
@@ -29,7 +30,8 @@ def run_diagnostics(db: Session = Depends(get_db)):
         "app/static/generated",
         "app/static/covers",
         "app/static/videos",
-        "app/static/temp_uploads"
+        "app/static/temp_uploads",
+        workspace.ROOT
     ]
     for directory in directories:
         if not os.path.exists(directory):
@@ -116,6 +118,36 @@ def run_diagnostics(db: Session = Depends(get_db)):
         report["status"] = "degraded"
         report["checks"].append({"name": "FFmpeg", "status": "FAIL", "message": "Not found in PATH (Video generation will fail)"})
 
+    # 5. Render Profile (autotune or RENDER_PROFILE)
+    from app.services import render_profile
+    profile = render_profile.current()
+    report["render_profile"] = profile
+    report["disk_usage"] = workspace.usage()
+    report["checks"].append({
+        "name": "Render Profile",
+        "status": "OK",
+        "message": f"{profile['name']} ({profile['source']}): {profile['threads']} thread(s), preset {profile['preset']}, "
+                   f"{profile['height']}p{profile['fps']}, {profile['slots']} slot(s)"
+    })
+
+    # Cache das leituras da YouTube Data API e cota do dia
+    from app.services import youtube_quota
+    from app.services.youtube_cache import youtube_cache
+    report["youtube_api"] = {"cache": youtube_cache.snapshot(), "quota": youtube_quota.snapshot(db)}
+
+    # 6. Durable Storage (STORAGE_BACKEND)
+    storage_info = storage.describe()
+    report["storage"] = storage_info
+    if storage_info.get("error"):
+        report["status"] = "degraded"
+        report["checks"].append({"name": "Storage", "status": "FAIL", "message": storage_info["error"]})
+    elif storage_info.get("durable_copy"):
+        report["checks"].append({"name": "Storage", "status": "OK", "message": f"{storage_info['backend']}: durable copies enabled"})
+    else:
+        # Comportamento padrão (como antes): não degrada, só avisa
+        report["checks"].append({"name": "Storage", "status": "OK",
+                                 "message": "local (app/static): files are lost on restart. Set STORAGE_BACKEND or STORAGE_LOCAL_DIR"})
+
     return report
 
 @router.post("/test-ai-connection")
@@ -10,6 +10,7 @@ from typing import Optional
 from app.services.ai_generator import AIContentGenerator
 from app.services.video_generator import VideoGenerator
 from app.services.suno_service import generate_song_with_vocals
+from app.services import workspace, media_catalog
 from app.routers.auth import get_current_user
 from app.models import User
 
@@ -107,9 +108,11 @@ def generate_music_clip(request: GenerateClipRequest, user: User = Depends(get_c
         raise HTTPException(status_code=404, detail="Arquivo de música não encontrado. Gere a música novamente.")
     try:
         ai = AIContentGenerator()
-        video_gen = VideoGenerator(ai_service=ai)
         scenes = ai.lyrics_to_clip_scenes(request.lyrics, request.title)
-        result = video_gen.create_music_video(music_path, scenes, title=request.title, aspect_ratio="9:16")
+        with workspace.job(workspace.request_key()) as work_dir:
+            video_gen = VideoGenerator(ai_service=ai, work_dir=work_dir)
+            result = video_gen.create_music_video(music_path, scenes, title=request.title, aspect_ratio="9:16")
+        media_catalog.register(result["video_url"], "clip")
         return {
             "video_url": result["video_url"],
             "message": "Clipe gerado com sucesso."
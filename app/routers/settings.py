@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import Settings
+from app.services.youtube_client import youtube_client
 from pydantic import BaseModel
 from typing import Optional
 
@@ -78,4 +79,6 @@ def update_settings(settings_update: SettingsUpdate, db: Session = Depends(get_d
     
     db.commit()
     db.refresh(settings)
+    # Credenciais do YouTube podem ter mudado: o cliente compartilhado relê na próxima chamada
+    youtube_client.invalidate()
     return settings
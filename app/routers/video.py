@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from pydantic import BaseModel
 from typing import List, Optional
 from sqlalchemy.orm import Session
@@ -6,6 +6,9 @@ from app.database import get_db
 from app.models import Book, Post
 from app.services.video_generator import VideoGenerator
 from app.services.ai_generator import AIContentGenerator
+from app.services.video_batch import build_script_plan, process_video_batch
+from app.services.task_manager import create_batch, get_batch, admission_retry_after
+from app.services import eta_model, workspace, media_catalog
 import uuid
 
 router = APIRouter(prefix="/video", tags=["Video"])
@@ -26,45 +29,38 @@ class CreateVideoRequest(BaseModel):
     voice_style: Optional[str] = "human"
     voice_gender: Optional[str] = "female"
 
+class BatchVideoItem(BaseModel):
+    title: str
+    content: str
+    mode: str = "topic" # manual, topic, story, short
+    duration: int = 1
+
+class BatchVideoRequest(BaseModel):
+    theme: str = ""
+    items: List[BatchVideoItem]
+    voice_style: Optional[str] = "human"
+    voice_gender: Optional[str] = "female"
+    music_mood: str = "drama"
+    cover_image_url: Optional[str] = None
+
 @router.post("/create")
 def create_video(request: CreateVideoRequest):
     try:
         ai_service = AIContentGenerator()
-        video_gen = VideoGenerator(ai_service=ai_service)
-        
-        script_plan = {}
-        
-        if request.mode == "manual":
-            script_plan = {
-                "title": request.title,
-                "scenes": [{"text": line} for line in request.content.split('\n') if line.strip()]
-            }
-            aspect_ratio = "16:9"
-        elif request.mode == "topic":
-            script_plan = ai_service.generate_motivational_script(request.content, request.duration)
-            script_plan["title"] = request.title
-            aspect_ratio = "16:9"
-        elif request.mode == "story":
-            script_plan = ai_service.generate_video_script(request.title, request.content, "story")
-            aspect_ratio = "16:9"
-        elif request.mode == "short":
-            # YouTube Short por prompt: um único prompt → roteiro curto → vídeo vertical 9:16
-            script_plan = ai_service.generate_short_script_from_prompt(request.content)
-            script_plan["title"] = request.title or script_plan.get("title", "Short")
-            aspect_ratio = "9:16"
-        else:
-            script_plan = ai_service.generate_video_script(request.title, request.content, "drama")
-            aspect_ratio = "16:9"
+        script_plan, aspect_ratio = build_script_plan(ai_service, request.mode, request.title, request.content, request.duration)
             
         # Generate Video (9:16 para Short, 16:9 para os demais)
-        result = video_gen.create_video_from_plan(
-            script_plan,
-            aspect_ratio=aspect_ratio,
-            voice_style=request.voice_style,
-            voice_gender=request.voice_gender
-        )
+        with workspace.job(workspace.request_key()) as work_dir:
+            video_gen = VideoGenerator(ai_service=ai_service, work_dir=work_dir)
+            result = video_gen.create_video_from_plan(
+                script_plan,
+                aspect_ratio=aspect_ratio,
+                voice_style=request.voice_style,
+                voice_gender=request.voice_gender
+            )
+        media_catalog.register(result["video_url"], "request")
         
-        return {"video_url": result["video_url"], "script": script_plan, "music_credit": result.get("music_credit")}
+        return {"video_url": result["video_url"], "script": script_plan, "music_credit": result.get("music_credit"), "degradations": result.get("degradations")}
         
     except Exception as e:
         print(f"Erro ao criar vídeo ({request.mode}): {e}")
@@ -75,8 +71,10 @@ def generate_video(request: VideoRequest):
     try:
         filename = f"{uuid.uuid4()}.mp4"
         # Instancia sob demanda para evitar problemas de startup
-        local_video_gen = VideoGenerator()
-        video_url = local_video_gen.generate_simple_video(request.title, request.script, filename)
+        with workspace.job(workspace.request_key()) as work_dir:
+            local_video_gen = VideoGenerator(work_dir=work_dir)
+            video_url = local_video_gen.generate_simple_video(request.title, request.script, filename)
+        media_catalog.register(video_url, "request")
         return {"video_url": video_url}
     except Exception as e:
         print(f"Erro ao gerar vídeo: {e}")
@@ -94,9 +92,6 @@ def generate_auto_video(request: AutoVideoRequest, db: Session = Depends(get_db)
         script_plan = ai_service.generate_video_script(book.title, book.synopsis, request.style)
         
         # 2. Gerar Vídeo
-        # Instancia VideoGenerator passando ai_service para gerar imagens
-        video_gen = VideoGenerator(ai_service=ai_service)
-        
         # Resolve caminho da capa se existir
         cover_path = None
         if book.cover_image_url:
@@ -108,9 +103,47 @@ def generate_auto_video(request: AutoVideoRequest, db: Session = Depends(get_db)
                 # TODO: Implementar download de capa externa se necessário
                 pass
 
-        result = video_gen.create_video_from_plan(script_plan, cover_image_path=cover_path)
+        # Instancia VideoGenerator passando ai_service para gerar imagens
+        with workspace.job(workspace.request_key()) as work_dir:
+            video_gen = VideoGenerator(ai_service=ai_service, work_dir=work_dir)
+            result = video_gen.create_video_from_plan(script_plan, cover_image_path=cover_path)
+        media_catalog.register(result["video_url"], "request")
         
         return {"video_url": result["video_url"], "script": script_plan, "music_credit": result.get("music_credit")}
     except Exception as e:
         print(f"Erro ao gerar vídeo automático: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/batch")
+def create_video_batch(request: BatchVideoRequest, background_tasks: BackgroundTasks):
+    """Gera N vídeos com tema, voz e clima musical compartilhados (trilha/narração final/capa resolvidas uma vez)"""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Envie ao menos um vídeo no lote.")
+    retry_after = admission_retry_after()
+    if retry_after:
+        raise HTTPException(status_code=503, detail="Fila de renderização cheia. Tente novamente mais tarde.",
+                            headers={"Retry-After": str(retry_after)})
+
+    predicted = [
+        eta_model.eta_model.predict(eta_model.estimate_features("short" if item.mode == "short" else "video", item.duration))
+        for item in request.items
+    ]
+    batch_id = create_batch([item.title for item in request.items], predicted_seconds=predicted)
+    background_tasks.add_task(
+        process_video_batch,
+        batch_id,
+        [item.model_dump() for item in request.items],
+        theme=request.theme,
+        voice_style=request.voice_style,
+        voice_gender=request.voice_gender,
+        music_mood=request.music_mood,
+        cover_image_url=request.cover_image_url
+    )
+    return get_batch(batch_id)
+
+@router.get("/batch/{batch_id}")
+def get_video_batch(batch_id: str):
+    batch = get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+    return batch
@@ -1,10 +1,11 @@
-import os
-import glob
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+import time
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, Response
+from fastapi.responses import StreamingResponse
 from app.services.youtube_service import YouTubeService
 from app.services.ai_generator import AIContentGenerator
 from app.services.video_generator import VideoGenerator
-from app.services.task_manager import create_task, update_task, get_task
+from app.services.task_manager import create_task, update_task, get_task, admission_retry_after
 from app.database import get_db
 from app.models import ScheduledVideo, ChannelReport, Settings
 from sqlalchemy.orm import Session
@@ -13,6 +14,10 @@ from typing import List, Optional, Dict, Any
 import json
 from datetime import datetime
 from app.services.video_processing import process_scheduled_video
+from app.services.monitor_service import monitor_service
+from app.services.render_budget import RenderBudget, StageTimeout, fallback_script_plan
+from app.services.event_bus import event_bus, task_event
+from app.services import scheduling, eta_model, job_stages, workspace, media_catalog, youtube_quota
 
 router = APIRouter(
     prefix="/youtube",
@@ -54,21 +59,14 @@ def get_stats():
     return service.get_channel_stats()
 
 @router.get("/videos")
-def list_videos():
-    """Lista os vídeos gerados na pasta videos"""
-    # Corrigido para listar da pasta correta onde o VideoGenerator salva
-    video_files = glob.glob("app/static/videos/*.mp4")
-    videos = []
-    for f in video_files:
-        filename = os.path.basename(f)
-        videos.append({
-            "filename": filename,
-            "url": f"/static/videos/{filename}",
-            "created_at": os.path.getctime(f)
-        })
-    # Ordenar por data de criação (mais recente primeiro)
-    videos.sort(key=lambda x: x['created_at'], reverse=True)
-    return videos
+def list_videos(response: Response, limit: int = 50, cursor: Optional[int] = None, source: Optional[str] = None,
+                video_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Lista os vídeos gerados (catálogo media_assets), do mais recente ao mais antigo.
+    A resposta continua sendo uma lista; a próxima página vem no cabeçalho X-Next-Cursor (passe em cursor)."""
+    page = media_catalog.list_assets(db, limit=limit, cursor=cursor, source=source, video_id=video_id)
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = str(page["next_cursor"])
+    return page["items"]
 
 @router.get("/auth_url")
 def get_auth_url():
@@ -277,6 +275,15 @@ def update_scheduled_video(video_id: int, data: Dict[str, Any], db: Session = De
     if "auto_post" in data:
         video.auto_post = bool(data["auto_post"])
         
+    # Etapas já produzidas que a alteração invalida (o roteiro depende do título; a narração, da voz)
+    stale_from = None
+    if "voice_style" in data and data["voice_style"] != video.voice_style:
+        stale_from = "tts"
+    if "voice_gender" in data and data["voice_gender"] != video.voice_gender:
+        stale_from = "tts"
+    if "title" in data and data["title"] != video.title:
+        stale_from = "script"
+
     if "title" in data:
         video.title = data["title"]
 
@@ -287,6 +294,12 @@ def update_scheduled_video(video_id: int, data: Dict[str, Any], db: Session = De
         video.voice_gender = data["voice_gender"]
         
     db.commit()
+    if stale_from and video.status not in ("processing", "preparing"):
+        job_stages.reset(db, video.id, stale_from)
+
+    # Reagenda o disparo exato do upload caso horário/auto_post tenham mudado
+    if video.status == "completed" and video.auto_post and not video.uploaded_at:
+        monitor_service.schedule_upload(video.id, video.scheduled_for)
     return {"message": "Video updated", "video": {
         "id": video.id, 
         "scheduled_for": video.scheduled_for.isoformat() if video.scheduled_for else None,
@@ -415,9 +428,8 @@ def save_schedule(plan: List[Dict[str, Any]], background_tasks: BackgroundTasks,
         db.commit()
         
         # OTIMIZAÇÃO DE MEMÓRIA: Não iniciar processamento em paralelo.
-        # Deixar o MonitorService pegar um por um a cada minuto.
-        # for vid_id in saved_ids:
-        #    background_tasks.add_task(process_scheduled_video, vid_id)
+        # O despachante do MonitorService pega um por um; aqui só o acordamos.
+        monitor_service.notify_queue()
             
         return {"status": "success", "saved_items": count}
     except Exception as e:
@@ -434,38 +446,70 @@ def generate_scheduled_video(video_id: int, background_tasks: BackgroundTasks, d
     video.progress = 0 # Reset progress
     db.commit()
     
-    # background_tasks.add_task(process_scheduled_video, video_id)
-    # Não iniciar imediatamente para respeitar a fila sequencial
+    # Não processar aqui para respeitar a fila sequencial: apenas acorda o despachante
+    monitor_service.notify_queue()
     return {"status": "queued"}
 
 @router.post("/schedule/{video_id}/regenerate")
 def regenerate_scheduled_video(video_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    """Mesma coisa que generate, mas semanticamente explícito"""
+    """Como generate, mas descarta as etapas já produzidas (roteiro, imagens, narração) e refaz tudo"""
+    video = db.query(ScheduledVideo).filter(ScheduledVideo.id == video_id).first()
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if video.status in ("processing", "preparing"):
+        raise HTTPException(status_code=409, detail="Vídeo em processamento")
+    if video.video_url:
+        # O MP4 anterior será substituído pelo novo render
+        media_catalog.remove(video.video_url, db=db)
+        video.video_url = None
+    job_stages.reset(db, video_id)
     return generate_scheduled_video(video_id, background_tasks, db)
 
+@router.get("/schedule/{video_id}/stages")
+def get_scheduled_video_stages(video_id: int, db: Session = Depends(get_db)):
+    """Estado de cada etapa do pipeline do vídeo (tentativas, backoff, último erro)"""
+    if not db.query(ScheduledVideo.id).filter(ScheduledVideo.id == video_id).first():
+        raise HTTPException(status_code=404, detail="Video not found")
+    return job_stages.summary(db, video_id)
+
 @router.delete("/schedule/{video_id}")
 def delete_scheduled_video(video_id: int, db: Session = Depends(get_db)):
     video = db.query(ScheduledVideo).filter(ScheduledVideo.id == video_id).first()
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
     
-    # Opcional: deletar arquivo físico se existir
+    # Apaga o arquivo, o pôster e o registro no catálogo de mídia
     if video.video_url:
-        try:
-            # Caminho relativo para absoluto
-            abs_path = os.path.join("c:/dev/TRAE/codexia/app", video.video_url.lstrip('/'))
-            if os.path.exists(abs_path):
-                os.remove(abs_path)
-        except Exception as e:
-            print(f"Erro ao deletar arquivo: {e}")
+        media_catalog.remove(video.video_url, db=db)
 
+    job_stages.reset(db, video_id)
     db.delete(video)
     db.commit()
     return {"status": "deleted"}
 
+@router.get("/schedule/metrics")
+def get_schedule_metrics(days: int = 30, db: Session = Depends(get_db)):
+    """Folga dos vídeos pendentes (EDF), atraso das publicações recentes e estado dos uploads"""
+    metrics = scheduling.schedule_metrics(db, days=days)
+    metrics["uploads"] = {**monitor_service.upload_dispatcher.snapshot(), "quota": youtube_quota.snapshot(db)}
+    return metrics
+
 @router.get("/schedule")
 def get_schedule(db: Session = Depends(get_db)):
-    return db.query(ScheduledVideo).order_by(ScheduledVideo.id.desc()).all()
+    videos = db.query(ScheduledVideo).order_by(ScheduledVideo.id.desc()).all()
+    now = datetime.now()
+    response = []
+    for video in videos:
+        item = {column.name: getattr(video, column.name) for column in ScheduledVideo.__table__.columns}
+        item["predicted_render_seconds"] = None
+        item["eta_seconds"] = None
+        if video.status in ("queued", "preparing", "prepared", "processing"):
+            predicted = scheduling.predict_render_seconds(video)
+            item["predicted_render_seconds"] = round(predicted)
+            started_at = video.started_at if video.status == "processing" else None
+            item["eta_seconds"] = eta_model.remaining_seconds(predicted, started_at, video.progress, now)
+        response.append(item)
+    return response
 
 @router.get("/auto_insights")
 def get_auto_insights():
@@ -509,9 +553,14 @@ def get_monetization_status():
 @router.post("/generate_video")
 def generate_video(request: VideoRequest, background_tasks: BackgroundTasks):
     """Gera um vídeo motivacional e opcionalmente faz upload"""
-    
-    # Cria ID da tarefa
-    task_id = create_task()
+    retry_after = admission_retry_after()
+    if retry_after:
+        raise HTTPException(status_code=503, detail="Fila de renderização cheia. Tente novamente mais tarde.",
+                            headers={"Retry-After": str(retry_after)})
+
+    # Cria ID da tarefa (com a duração prevista antes do roteiro existir)
+    predicted = eta_model.eta_model.predict(eta_model.estimate_features("video", request.duration))
+    task_id = create_task(predicted_seconds=predicted)
     
     # Inicia processo em background
     background_tasks.add_task(process_video_generation, request, task_id)
@@ -525,27 +574,85 @@ def get_task_status(task_id: str):
         raise HTTPException(status_code=404, detail="Tarefa não encontrada")
     return task
 
+# Comentário SSE periódico para proxies não derrubarem a conexão ociosa
+SSE_KEEPALIVE_SECONDS = 15
+
+async def _event_stream(request: Request, channel: str, initial=None, until_terminal=False):
+    """Stream SSE de um canal do event_bus (uma assinatura por conexão, sem polling do cliente)"""
+    sub = event_bus.subscribe(channel)
+    last_sent = None
+    try:
+        if initial:
+            last_sent = initial
+            yield f"data: {json.dumps(initial, ensure_ascii=False, default=str)}\n\n"
+            if until_terminal and initial.get("status") in ("completed", "failed"):
+                return
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event == last_sent:
+                continue
+            last_sent = event
+            yield f"data: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+            if until_terminal and event.get("status") in ("completed", "failed"):
+                return
+    finally:
+        event_bus.unsubscribe(sub)
+
+def _sse_response(generator):
+    return StreamingResponse(generator, media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+@router.get("/task/{task_id}/events")
+async def stream_task_events(task_id: str, request: Request):
+    """Progresso, mudanças de status e conclusão de uma tarefa via Server-Sent Events"""
+    task = await asyncio.to_thread(get_task, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+    initial = task_event(task_id, task["status"], task["progress"], task["message"], task.get("result"))
+    return _sse_response(_event_stream(request, f"task:{task_id}", initial, until_terminal=True))
+
+@router.get("/events/schedule")
+async def stream_schedule_events(request: Request):
+    """Eventos de progresso/status dos vídeos agendados (substitui o polling de /youtube/schedule)"""
+    return _sse_response(_event_stream(request, "schedule"))
+
 def process_video_generation(request: VideoRequest, task_id):
+    features = video_path = None
     try:
         topic_display = request.topic if request.mode == 'topic' else "História Personalizada"
         update_task(task_id, status="processing", progress=5, message=f"Iniciando geração sobre: {topic_display}")
         print(f"Iniciando geração de vídeo ({request.mode}): {topic_display}")
+        started = time.monotonic()
         
         ai_service = AIContentGenerator()
-        video_service = VideoGenerator(ai_service=ai_service)
+        video_service = VideoGenerator(ai_service=ai_service, work_dir=workspace.path(workspace.task_key(task_id)))
         yt_service = YouTubeService()
         
         # 1. Gerar Roteiro
         update_task(task_id, progress=10, message="Estruturando roteiro com IA...")
+        budget = RenderBudget()
         
-        if request.mode == 'story' and request.story_content:
-            script = ai_service.generate_script_from_text(request.story_content, request.duration)
-        else:
-            # Fallback to topic mode if no story content
-            topic = request.topic or "Motivação Genérica"
-            script = ai_service.generate_motivational_script(topic, request.duration)
+        topic = request.topic or "Motivação Genérica"
+        try:
+            if request.mode == 'story' and request.story_content:
+                script = budget.run("script", ai_service.generate_script_from_text, request.story_content, request.duration)
+            else:
+                # Fallback to topic mode if no story content
+                script = budget.run("script", ai_service.generate_motivational_script, topic, request.duration)
+        except StageTimeout as e:
+            budget.degrade("script", "roteiro local", reason=str(e))
+            script = fallback_script_plan(topic_display, request.story_content or topic)
             
         print("Roteiro gerado/estruturado.")
+        # Com o roteiro pronto, a previsão usa cenas e texto reais
+        features = eta_model.plan_features(script, eta_model.video_size_for("video"))
+        update_task(task_id, predicted_seconds=eta_model.eta_model.predict(features))
         
         # 2. Gerar Vídeo (16:9)
         # Passamos uma função de callback para atualizar o progresso
@@ -554,11 +661,14 @@ def process_video_generation(request: VideoRequest, task_id):
             task_progress = 20 + int(progress * 0.7)
             update_task(task_id, progress=task_progress, message=message)
             
-        video_result = video_service.create_video_from_plan(script, aspect_ratio="16:9", progress_callback=progress_callback)
+        video_result = video_service.create_video_from_plan(script, aspect_ratio="16:9", progress_callback=progress_callback, budget=budget)
         video_path = video_result["video_url"]
+        media_catalog.register(video_path, "task", task_id=task_id)
+        eta_model.record("task", features, video_result.get("stage_timings"), time.monotonic() - started,
+                         task_id=task_id, duration_seconds=video_result.get("duration_seconds"))
         
         # O path retornado é relativo para web (/static/...), precisamos do absoluto para upload
-        abs_video_path = "c:/dev/TRAE/codexia/app" + video_path 
+        abs_video_path = media_catalog.path_for(video_path)
         print(f"Vídeo gerado em: {abs_video_path}")
         
         # 3. Upload (se solicitado)
@@ -570,16 +680,28 @@ def process_video_generation(request: VideoRequest, task_id):
             if video_result.get("music_credit"):
                 description += f"\n\n{video_result['music_credit']}"
             
+            # Mesma cota dos uploads agendados: sem credenciais o upload é simulado e não gasta nada
+            if yt_service.service and not youtube_quota.reserve(youtube_quota.INSERT_COST):
+                reset_at = youtube_quota.next_reset()
+                update_task(task_id, progress=100, status="completed",
+                            message=f"Vídeo gerado, mas não publicado: cota diária do YouTube esgotada (renova às {reset_at:%d/%m %H:%M}).",
+                            result={"video_url": video_path, "degradations": budget.degradations})
+                return
+            # A chamada à API gasta a reserva, mesmo se o upload falhar
             yt_service.upload_video(
                 abs_video_path,
                 title=script.get('title', f"Motivação: {topic}"),
                 description=description,
                 tags=script.get('tags', ['motivação', 'sucesso'])
             )
-            update_task(task_id, progress=100, status="completed", message="Vídeo gerado e publicado com sucesso!", result={"video_url": video_path})
+            update_task(task_id, progress=100, status="completed", message="Vídeo gerado e publicado com sucesso!", result={"video_url": video_path, "degradations": budget.degradations})
         else:
-            update_task(task_id, progress=100, status="completed", message="Vídeo gerado com sucesso!", result={"video_url": video_path})
+            update_task(task_id, progress=100, status="completed", message="Vídeo gerado com sucesso!", result={"video_url": video_path, "degradations": budget.degradations})
             
     except Exception as e:
         print(f"Erro na tarefa {task_id}: {e}")
+        if features and not video_path:
+            eta_model.record("task", features, budget.timings(), time.monotonic() - started, status="failed", task_id=task_id)
         update_task(task_id, status="failed", message=f"Erro: {str(e)}")
+    finally:
+        workspace.remove(workspace.task_key(task_id))
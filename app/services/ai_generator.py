@@ -5,9 +5,16 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 from app.database import SessionLocal
 from app.models import Settings
+from app.services.render_budget import request_timeout
 
 load_dotenv()
 
+
+def _openai_timeout():
+    """Timeout das chamadas OpenAI: o prazo da etapa do render, se houver (senão o padrão do cliente)"""
+    return request_timeout() or openai.NOT_GIVEN
+
+
 class AIContentGenerator:
     def __init__(self):
         self._load_config()
@@ -117,7 +124,8 @@ class AIContentGenerator:
                     response = requests.post(
                         "https://api.mistral.ai/v1/chat/completions",
                         headers=headers,
-                        json=data
+                        json=data,
+                        timeout=request_timeout()
                     )
                     
                     if response.status_code != 200:
@@ -143,7 +151,8 @@ class AIContentGenerator:
                         model="openai/gpt-3.5-turbo", # OpenRouter supports mapping, or use "mistralai/mistral-7b-instruct"
                         messages=messages,
                         temperature=temperature,
-                        response_format={"type": "json_object"} if json_mode else None
+                        response_format={"type": "json_object"} if json_mode else None,
+                        timeout=_openai_timeout()
                     )
                     return response.choices[0].message.content
 
@@ -170,7 +179,8 @@ class AIContentGenerator:
                     response = requests.post(
                         "https://api.anthropic.com/v1/messages",
                         headers=headers,
-                        json=data
+                        json=data,
+                        timeout=request_timeout()
                     )
                     
                     if response.status_code != 200:
@@ -193,12 +203,14 @@ class AIContentGenerator:
                             if json_mode:
                                 final_prompt += "\n\nIMPORTANT: Output ONLY valid JSON."
                             
+                            timeout = request_timeout()
                             response = model.generate_content(
                                 final_prompt,
                                 generation_config=genai.types.GenerationConfig(
                                     temperature=temperature,
                                     response_mime_type="application/json" if json_mode else "text/plain"
-                                )
+                                ),
+                                request_options={"timeout": timeout} if timeout else None
                             )
                             return response.text
                         except Exception as e:
@@ -224,7 +236,8 @@ class AIContentGenerator:
                             model="gpt-3.5-turbo",
                             messages=messages,
                             temperature=temperature,
-                            response_format={"type": "json_object"} if json_mode else None
+                            response_format={"type": "json_object"} if json_mode else None,
+                            timeout=_openai_timeout()
                         )
                         return response.choices[0].message.content
                     except Exception as e:
@@ -244,7 +257,8 @@ class AIContentGenerator:
                         model="deepseek-chat",
                         messages=messages,
                         temperature=temperature,
-                        response_format={"type": "json_object"} if json_mode else None
+                        response_format={"type": "json_object"} if json_mode else None,
+                        timeout=_openai_timeout()
                     )
                     return response.choices[0].message.content
 
@@ -262,7 +276,8 @@ class AIContentGenerator:
                         model="llama3-70b-8192",
                         messages=messages,
                         temperature=temperature,
-                        response_format={"type": "json_object"} if json_mode else None
+                        response_format={"type": "json_object"} if json_mode else None,
+                        timeout=_openai_timeout()
                     )
                     return response.choices[0].message.content
 
@@ -1464,21 +1479,30 @@ class AIContentGenerator:
         else:
             return base_msg + f"🎬 [Simulação] Roteiro para '{title}'..."
 
-    def generate_image(self, prompt):
+    def generate_image(self, prompt, size=None):
+        """Gera imagem para cena. size=(largura, altura) do vídeo: o provedor já gera na orientação/tamanho certos."""
         self._load_config()
+        width, height = size or (720, 1280)
+        if width > height:
+            orientation, dalle_size = "Horizontal aspect ratio 16:9", "1792x1024"
+        elif width < height:
+            orientation, dalle_size = "Vertical aspect ratio 9:16", "1024x1792"
+        else:
+            orientation, dalle_size = "Square aspect ratio 1:1", "1024x1024"
         
         # 1. Tenta OpenAI DALL-E 3 se tiver chave
         if self.api_key:
             try:
                 # Enforcing original, artistic creation via prompt engineering
-                full_prompt = f"{prompt}. Vertical aspect ratio 9:16. Original digital art, unique composition, cinematic lighting, 8k resolution, highly detailed. No text, copyright free style."
+                full_prompt = f"{prompt}. {orientation}. Original digital art, unique composition, cinematic lighting, 8k resolution, highly detailed. No text, copyright free style."
                 
                 response = openai.images.generate(
                     model="dall-e-3",
                     prompt=full_prompt,
-                    size="1024x1792",
+                    size=dalle_size,
                     quality="standard",
                     n=1,
+                    timeout=_openai_timeout(),
                 )
                 return response.data[0].url
             except Exception as e:
@@ -1488,9 +1512,9 @@ class AIContentGenerator:
         try:
             import urllib.parse
             # Otimiza prompt para Pollinations
-            safe_prompt = urllib.parse.quote(f"{prompt} vertical 9:16 cinematic lighting high quality")
-            # Pollinations URL format
-            return f"https://image.pollinations.ai/prompt/{safe_prompt}?width=720&height=1280&model=flux&nologo=true"
+            safe_prompt = urllib.parse.quote(f"{prompt} {orientation.lower()} cinematic lighting high quality")
+            # Pollinations URL format (gera direto no tamanho de renderização)
+            return f"https://image.pollinations.ai/prompt/{safe_prompt}?width={width}&height={height}&model=flux&nologo=true"
         except Exception as e:
             print(f"Erro no fallback Pollinations: {e}")
             return None
@@ -1525,7 +1549,8 @@ class AIContentGenerator:
             response = openai.audio.speech.create(
                 model="tts-1",
                 voice=voice,
-                input=text
+                input=text,
+                timeout=_openai_timeout()
             )
             return response.content
         except Exception as e:
@@ -1573,7 +1598,7 @@ Retorne APENAS o prompt, sem aspas."""
             scenes.append({"text": block, "image_prompt": image_prompt})
         return scenes if scenes else [{"text": title or "Música", "image_prompt": "abstract music visual"}]
 
-    def generate_music(self, prompt):
+    def generate_music(self, prompt, timeout=120):
         """Gera música usando Hugging Face (MusicGen)"""
         # Se não tiver token, tenta sem (pode falhar por rate limit)
         # URL atualizada conforme erro 410
@@ -1590,7 +1615,7 @@ Retorne APENAS o prompt, sem aspas."""
         
         try:
             payload = {"inputs": music_prompt}
-            response = requests.post(API_URL, headers=headers, json=payload)
+            response = requests.post(API_URL, headers=headers, json=payload, timeout=timeout)
             
             if response.status_code == 200:
                 return response.content
@@ -0,0 +1,231 @@
+"""
+Previsão de duração de render (ETA) aprendida com a telemetria dos jobs.
+
+Todo render (agendado, sob demanda ou de lote) grava em render_telemetry o
+tempo de cada etapa (roteiro, imagens, narração, música, encode) e o total,
+junto com as características do job: número de cenas, tamanho do texto,
+resolução e renderizador. O EtaModel ajusta por mínimos quadrados:
+
+    total ≈ b0 + b1·cenas + b2·kchars + b3·cenas·MP + b4·kchars·MP
+
+(MP = megapixels do quadro), um modelo por renderizador, com um modelo global
+de reserva. Com menos de ETA_MIN_SAMPLES jobs concluídos vale a estimativa
+fixa de antes. O ajuste é refeito a cada ETA_REFIT_MINUTES, fora do caminho
+das requisições: job periódico do monitor (role queue) ou, no processo web
+sem worker embutido, start_refit_loop(). predict() só lê os coeficientes.
+"""
+import os
+import json
+import time
+import datetime
+import threading
+import numpy as np
+from app.database import SessionLocal
+from app.models import RenderTelemetry
+from app.services import render_profile
+from app.services.render_budget import STAGES
+from app.services.render_pool import resolve_duration, video_size_for
+
+MIN_SAMPLES = int(os.getenv("ETA_MIN_SAMPLES", "8"))
+REFIT_MINUTES = float(os.getenv("ETA_REFIT_MINUTES", "30"))
+# Janela de histórico usada no ajuste (jobs mais recentes)
+HISTORY_LIMIT = 500
+# Nenhuma previsão abaixo disso (evita ETA zero/negativo com poucos dados)
+MIN_PREDICTION_SECONDS = 30
+
+# Estimativa padrão (sem histórico): fixo + por cena (imagem + narração) + encode por minuto de vídeo
+BASE_SECONDS = 90
+SECONDS_PER_SCENE = 20
+ENCODE_SECONDS_PER_MINUTE = 30
+# Texto narrado por minuto de vídeo (~150 palavras), para jobs ainda sem roteiro
+CHARS_PER_MINUTE = 900
+
+
+def plan_features(plan, video_size, renderer=None):
+    """Características de um roteiro já gerado"""
+    scenes = plan.get("scenes") if isinstance(plan, dict) else None
+    scenes = scenes if isinstance(scenes, list) else []
+    text_chars = sum(len(str(scene.get("text", ""))) for scene in scenes if isinstance(scene, dict))
+    return {
+        "scene_count": len(scenes),
+        "text_chars": text_chars,
+        "width": video_size[0],
+        "height": video_size[1],
+        "renderer": renderer or _default_renderer(),
+    }
+
+
+def estimate_features(video_type, duration, scene_count=None, text_chars=None):
+    """Características presumidas de um job cujo roteiro ainda não existe"""
+    width, height = video_size_for(video_type)
+    return {
+        "scene_count": scene_count or max(5, duration * 2),
+        "text_chars": text_chars or duration * CHARS_PER_MINUTE,
+        "width": width,
+        "height": height,
+        "renderer": _default_renderer(),
+        "duration_minutes": duration,
+    }
+
+
+def video_features(video):
+    """Características de um ScheduledVideo (roteiro salvo em script_data, se houver)"""
+    try:
+        script_data = json.loads(video.script_data) if video.script_data else {}
+    except (TypeError, ValueError):
+        script_data = {}
+    duration = resolve_duration(video.video_type, script_data)
+    scenes = script_data.get("scenes")
+    if isinstance(scenes, list) and scenes:
+        features = plan_features(script_data, video_size_for(video.video_type))
+        features["duration_minutes"] = duration
+        return features
+    return estimate_features(video.video_type, duration)
+
+
+def _default_renderer():
+    return render_profile.current()["renderer"]
+
+
+def _row(features):
+    megapixels = (features["width"] * features["height"]) / 1e6
+    kchars = features["text_chars"] / 1000
+    scenes = features["scene_count"]
+    return [1.0, scenes, kchars, scenes * megapixels, kchars * megapixels]
+
+
+def heuristic_seconds(features):
+    duration = features.get("duration_minutes") or max(1, round(features["text_chars"] / CHARS_PER_MINUTE))
+    return BASE_SECONDS + SECONDS_PER_SCENE * features["scene_count"] + ENCODE_SECONDS_PER_MINUTE * duration
+
+
+def record(source, features, timings=None, total_seconds=None, status="completed", video_id=None, task_id=None, duration_seconds=None):
+    """Grava a telemetria de um render (nunca interrompe o job em caso de erro)"""
+    timings = timings or {}
+    db = SessionLocal()
+    try:
+        db.add(RenderTelemetry(
+            source=source,
+            video_id=video_id,
+            task_id=task_id,
+            renderer=features.get("renderer"),
+            status=status,
+            scene_count=features.get("scene_count"),
+            text_chars=features.get("text_chars"),
+            width=features.get("width"),
+            height=features.get("height"),
+            duration_seconds=duration_seconds,
+            total_seconds=round(total_seconds, 2) if total_seconds is not None else None,
+            **{f"stage_{stage}": timings.get(stage, 0) for stage in STAGES},
+        ))
+        db.commit()
+    except Exception as e:
+        print(f"Erro ao gravar telemetria de render: {e}")
+    finally:
+        db.close()
+
+
+class EtaModel:
+    def __init__(self, min_samples=MIN_SAMPLES, refit_minutes=REFIT_MINUTES):
+        self.min_samples = min_samples
+        self.refit_seconds = refit_minutes * 60
+        # {renderer: coeficientes}; a chave None é o modelo global
+        self.coefficients = {}
+        self.samples = {}
+        self.fitted_at = None
+        self._lock = threading.Lock()
+        self._refit_thread = None
+
+    def refit(self, db=None):
+        """Reajusta os modelos com os jobs concluídos mais recentes"""
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            rows = db.query(
+                RenderTelemetry.renderer, RenderTelemetry.scene_count, RenderTelemetry.text_chars,
+                RenderTelemetry.width, RenderTelemetry.height, RenderTelemetry.total_seconds
+            ).filter(
+                RenderTelemetry.status == "completed",
+                RenderTelemetry.total_seconds != None
+            ).order_by(RenderTelemetry.id.desc()).limit(HISTORY_LIMIT).all()
+        except Exception as e:
+            print(f"Erro ao carregar telemetria de render: {e}")
+            rows = []
+        finally:
+            if own_session:
+                db.close()
+
+        groups = {None: rows}
+        for row in rows:
+            groups.setdefault(row.renderer, []).append(row)
+        coefficients, samples = {}, {}
+        for renderer, group in groups.items():
+            samples[renderer] = len(group)
+            if len(group) < self.min_samples:
+                continue
+            x = np.array([_row(r._asdict()) for r in group], dtype=float)
+            y = np.array([r.total_seconds for r in group], dtype=float)
+            coefficients[renderer] = np.linalg.lstsq(x, y, rcond=None)[0]
+
+        with self._lock:
+            self.coefficients = coefficients
+            self.samples = samples
+            self.fitted_at = datetime.datetime.now()
+        return self.snapshot()
+
+    def start_refit_loop(self):
+        """Reajusta em segundo plano a cada refit_seconds (processos sem o job do monitor). Uma vez por processo."""
+        with self._lock:
+            if self._refit_thread is not None:
+                return
+            self._refit_thread = threading.Thread(target=self._refit_loop, name="eta-refit", daemon=True)
+        self._refit_thread.start()
+
+    def _refit_loop(self):
+        while True:
+            try:
+                self.refit()
+            except Exception as e:
+                print(f"Erro ao reajustar modelo de ETA: {e}")
+            time.sleep(self.refit_seconds)
+
+    def predict(self, features):
+        """Duração total prevista do render (segundos). Até o primeiro ajuste vale a estimativa fixa."""
+        with self._lock:
+            coef = self.coefficients.get(features.get("renderer"))
+            if coef is None:
+                coef = self.coefficients.get(None)
+        if coef is None:
+            return float(heuristic_seconds(features))
+        return max(MIN_PREDICTION_SECONDS, float(np.dot(coef, _row(features))))
+
+    def predict_video(self, video):
+        return self.predict(video_features(video))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "fitted_at": self.fitted_at.isoformat(timespec="seconds") if self.fitted_at else None,
+                "min_samples": self.min_samples,
+                "samples": {renderer or "global": count for renderer, count in self.samples.items()},
+                "models": sorted(renderer or "global" for renderer in self.coefficients),
+            }
+
+
+def remaining_seconds(predicted_seconds, started_at=None, progress=0, now=None):
+    """Tempo restante previsto de um job em andamento"""
+    if predicted_seconds is None:
+        return None
+    if not started_at:
+        return round(predicted_seconds)
+    now = now or datetime.datetime.now()
+    elapsed = (now - started_at).total_seconds()
+    if elapsed < predicted_seconds:
+        return round(predicted_seconds - elapsed)
+    # Passou do previsto: extrapola pelo progresso informado (ou assume que está no fim)
+    if progress and 0 < progress < 100:
+        return round(elapsed * (100 - progress) / progress)
+    return 0
+
+
+eta_model = EtaModel()
@@ -0,0 +1,168 @@
+"""
+Barramento de eventos de progresso para o painel (Server-Sent Events).
+
+Canais:
+  - "schedule": mudanças de status/progresso dos ScheduledVideo
+  - "task:<task_id>": progresso de uma tarefa sob demanda (task_manager)
+
+Publicadores no mesmo processo (task_manager, ProgressReporter) entregam o
+evento na hora. Renders em outros processos (sandbox, app.worker, outros
+workers do gunicorn) chegam pelo ChangeWatcher: uma única consulta leve por
+segundo, só das colunas de progresso, e apenas enquanto houver assinantes.
+Eventos que não mudam nada (mesmo status, progresso igual ou menor) são
+descartados, então as duas fontes podem coexistir sem regressões na UI.
+"""
+import os
+import json
+import time
+import asyncio
+import datetime
+import threading
+from app.database import SessionLocal
+from app.models import ScheduledVideo, VideoTask
+
+POLL_SECONDS = float(os.getenv("EVENT_POLL_SECONDS", "1"))
+# Limite de eventos acumulados por assinante lento (os mais antigos são descartados)
+MAX_QUEUE = 500
+TERMINAL_STATUSES = ("completed", "failed", "published")
+
+
+class Subscription:
+    def __init__(self, channel, loop):
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=MAX_QUEUE)
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    def deliver(self, event):
+        # Publicadores rodam em threads; a fila pertence ao event loop do endpoint
+        self.loop.call_soon_threadsafe(self._put, event)
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers = {}
+        # Último estado enviado por (canal, id): filtra eventos repetidos ou atrasados
+        self._last = {}
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def subscribe(self, channel):
+        sub = Subscription(channel, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(sub)
+        self._ensure_watcher()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.channel)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.channel]
+
+    def channels(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, channel, event):
+        """Entrega o evento aos assinantes do canal (seguro para chamar de qualquer thread)"""
+        key = (channel, event.get("id"))
+        state = (event.get("status"), event.get("progress"), event.get("message"))
+        with self._lock:
+            last = self._last.get(key)
+            if last:
+                same_status = last[0] == state[0] or state[0] is None
+                stale = state[1] is not None and last[1] is not None and state[1] < last[1]
+                if same_status and (state == last or (stale and state[0] not in TERMINAL_STATUSES)):
+                    return
+            self._last[key] = state
+            if len(self._last) > 10000:
+                self._last.clear()
+            subs = list(self._subscribers.get(channel, ()))
+        for sub in subs:
+            try:
+                sub.deliver(event)
+            except RuntimeError:
+                # Event loop do assinante já encerrado
+                self.unsubscribe(sub)
+
+    def _ensure_watcher(self):
+        with self._lock:
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = ChangeWatcher(self)
+                self._watcher.start()
+
+
+class ChangeWatcher(threading.Thread):
+    """Traz para o barramento mudanças gravadas no banco por outros processos"""
+
+    def __init__(self, bus):
+        super().__init__(name="event-change-watcher", daemon=True)
+        self.bus = bus
+        self.since = datetime.datetime.now()
+
+    def run(self):
+        while True:
+            with self.bus._lock:
+                channels = list(self.bus._subscribers)
+                if not channels:
+                    # Sem assinantes: encerra (reinicia na próxima assinatura)
+                    self.bus._watcher = None
+                    return
+            try:
+                self._poll(channels)
+            except Exception as e:
+                print(f"Erro ao buscar eventos de progresso: {e}")
+            time.sleep(POLL_SECONDS)
+
+    def _poll(self, channels):
+        db = SessionLocal()
+        try:
+            if "schedule" in channels:
+                started = datetime.datetime.now()
+                rows = db.query(
+                    ScheduledVideo.id, ScheduledVideo.status, ScheduledVideo.progress,
+                    ScheduledVideo.progress_message, ScheduledVideo.video_url, ScheduledVideo.updated_at
+                ).filter(ScheduledVideo.updated_at >= self.since).all()
+                # Margem de 1s para relógios/transações que gravaram logo antes da consulta
+                self.since = started - datetime.timedelta(seconds=1)
+                for row in rows:
+                    self.bus.publish("schedule", schedule_event(row))
+
+            task_ids = [c.split(":", 1)[1] for c in channels if c.startswith("task:")]
+            if task_ids:
+                rows = db.query(
+                    VideoTask.id, VideoTask.status, VideoTask.progress, VideoTask.message, VideoTask.result
+                ).filter(VideoTask.id.in_(task_ids)).all()
+                for row in rows:
+                    result = json.loads(row.result) if row.result else None
+                    self.bus.publish(f"task:{row.id}", task_event(row.id, row.status, row.progress, row.message, result))
+        finally:
+            db.close()
+
+
+def schedule_event(video, message=None):
+    return {
+        "type": "schedule",
+        "id": video.id,
+        "status": video.status,
+        "progress": video.progress,
+        "message": message or getattr(video, "progress_message", None),
+        "video_url": getattr(video, "video_url", None),
+    }
+
+
+def task_event(task_id, status, progress, message, result=None):
+    event = {"type": "task", "id": task_id, "status": status, "progress": progress, "message": message}
+    if result is not None:
+        event["result"] = result
+    return event
+
+
+event_bus = EventBus()
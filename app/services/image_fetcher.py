@@ -0,0 +1,81 @@
+"""
+Aquisição de imagens geradas por IA (DALL-E, Pollinations).
+
+Sessão HTTP compartilhada (pool de conexões + retry), timeouts explícitos,
+leitura em blocos grandes e decodificação direto no tamanho de renderização,
+para que cada cena não carregue na memória a imagem em resolução cheia.
+"""
+import io
+import os
+import uuid
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from PIL import Image
+from app.services.text_overlay import fit_cover
+
+CHUNK_SIZE = 256 * 1024
+CONNECT_TIMEOUT = float(os.getenv("IMAGE_FETCH_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("IMAGE_FETCH_READ_TIMEOUT", "60"))
+# Limite de segurança contra respostas inesperadamente grandes
+MAX_IMAGE_BYTES = 25 * 1024 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Sessão HTTP única por processo, com pool de conexões e retry em falhas transitórias"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _read_body(response):
+    buffer = io.BytesIO()
+    for chunk in response.iter_content(CHUNK_SIZE):
+        buffer.write(chunk)
+        if buffer.tell() > MAX_IMAGE_BYTES:
+            raise ValueError(f"Imagem excede {MAX_IMAGE_BYTES // (1024 * 1024)} MB")
+    buffer.seek(0)
+    return buffer
+
+
+def fetch_image(url, dest_dir, target_size=None, timeout=None):
+    """Baixa a imagem para dest_dir e retorna o caminho (ou None em caso de erro).
+
+    Com target_size (largura, altura) a imagem é decodificada já reduzida
+    (draft para JPEG, reducing_gap para os demais formatos), recortada na
+    proporção do vídeo e salva como JPEG no tamanho exato de renderização."""
+    try:
+        with get_session().get(url, stream=True, timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)) as response:
+            if response.status_code != 200:
+                print(f"Erro ao baixar imagem: HTTP {response.status_code}")
+                return None
+            body = _read_body(response)
+
+        os.makedirs(dest_dir, exist_ok=True)
+        if not target_size:
+            filepath = os.path.join(dest_dir, f"temp_{uuid.uuid4()}.png")
+            with open(filepath, "wb") as f:
+                f.write(body.getbuffer())
+            return filepath
+
+        filepath = os.path.join(dest_dir, f"temp_{uuid.uuid4()}.jpg")
+        with Image.open(body) as img:
+            img.draft("RGB", tuple(target_size))
+            img = fit_cover(img.convert("RGB"), tuple(target_size))
+            img.save(filepath, "JPEG", quality=92)
+        return filepath
+    except Exception as e:
+        print(f"Erro ao baixar imagem: {e}")
+    return None
@@ -0,0 +1,369 @@
+"""
+Fila de renderização com posse (lease) por worker.
+
+Um vídeo só passa de 'queued' para 'processing' por um UPDATE condicional
+(SQLite) ou sob SELECT ... FOR UPDATE SKIP LOCKED (PostgreSQL), gravando o
+dono do lease e sua validade. Enquanto renderiza, o worker renova o lease
+(heartbeat). Se o processo morrer, o lease expira em segundos e o vídeo volta
+para a fila, sem depender de heurísticas sobre updated_at. Vários processos
+(workers do gunicorn, instâncias) podem drenar a mesma fila com segurança.
+
+A preparação antecipada (etapas de rede enquanto outro vídeo codifica) usa o
+mesmo mecanismo: 'queued' -> 'preparing' (com lease) -> 'prepared' (sem dono,
+aguardando encode) -> 'processing'.
+
+O upload para o YouTube também: 'completed' -> 'uploading' (com lease) ->
+'published'. Só quem vence o UPDATE condicional envia o vídeo; se o worker
+morrer no meio, o lease expira e o vídeo volta para 'completed' (a sessão
+resumível salva permite continuar de onde parou).
+
+Itens de lote (VideoTask com payload) entram na mesma fila: 'pending' ->
+'processing' por UPDATE condicional, com lease; um worker morto devolve o
+item para 'pending'.
+
+Um processo sem despachante (web com EMBEDDED_WORKER=false, agendador de
+uploads) avisa os workers com signal_changed(): incrementa uma versão na tabela
+queue_signals, que o despachante de cada worker consulta a cada
+SIGNAL_POLL_SECONDS (leitura de uma linha pela chave) em vez de varrer a fila.
+"""
+import os
+import uuid
+import socket
+import datetime
+import threading
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from app.database import SessionLocal, engine
+from app.models import ScheduledVideo, VideoTask, QueueSignal
+
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "30"))
+HEARTBEAT_SECONDS = max(1, LEASE_SECONDS // 3)
+# Teto de duração de um render: ao passar disso o worker desiste e marca falha
+MAX_RENDER_SECONDS = int(os.getenv("JOB_MAX_RENDER_SECONDS", str(90 * 60)))
+
+# Intervalo entre consultas à versão da fila (queue_signals) pelo despachante
+SIGNAL_POLL_SECONDS = float(os.getenv("QUEUE_SIGNAL_POLL_SECONDS", "2"))
+SIGNAL_NAME = "render"
+
+# Identidade deste processo como dono de leases
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+_supports_skip_locked = engine.dialect.name == "postgresql"
+# Estados em que o vídeo pertence a um worker (lease renovado por heartbeat)
+LEASED_STATUSES = ("processing", "preparing")
+# Upload em andamento (lease renovado como o render, mas expira de volta para 'completed')
+UPLOAD_STATUS = "uploading"
+
+
+def _lease_expiry(now=None):
+    return (now or datetime.datetime.now()) + datetime.timedelta(seconds=LEASE_SECONDS)
+
+
+def _claim_values(owner, now, status="processing"):
+    return {
+        "status": status,
+        "lease_owner": owner,
+        "lease_expires_at": _lease_expiry(now),
+        "heartbeat_at": now,
+        "started_at": now,
+        "updated_at": now,
+    }
+
+
+def claim_next(db, owner=WORKER_ID, admit=None, order=None, statuses=("queued",), status="processing"):
+    """Reserva atomicamente o próximo vídeo da fila para owner.
+
+    order(videos) -> lista ordenada (e filtrada) dos candidatos; padrão: por id.
+    admit(video) -> bool decide se o vídeo cabe neste worker (ex: pool de memória).
+    Deve só conferir, sem reservar: quem chama reserva o id retornado, depois
+    que o UPDATE venceu. Se recusar, nada é alterado. statuses: estados de origem aceitos; status: estado
+    gravado na reserva ('processing' ou 'preparing'). Retorna o id reservado ou None."""
+    now = datetime.datetime.now()
+    candidates = db.query(ScheduledVideo).filter(ScheduledVideo.status.in_(statuses)).order_by(ScheduledVideo.id.asc()).all()
+    if order:
+        candidates = order(candidates)
+
+    for video in candidates[:5]:
+        if _supports_skip_locked:
+            # Linha já travada por outro worker é pulada, sem espera
+            locked = db.query(ScheduledVideo).filter(
+                ScheduledVideo.id == video.id,
+                ScheduledVideo.status.in_(statuses)
+            ).with_for_update(skip_locked=True).first()
+            if not locked:
+                db.rollback()
+                continue
+            if admit and not admit(locked):
+                db.rollback()
+                return None
+            for key, value in _claim_values(owner, now, status).items():
+                setattr(locked, key, value)
+            db.commit()
+            return locked.id
+
+        # SQLite: o UPDATE condicional é a reserva; quem perder a corrida tenta o próximo
+        if admit and not admit(video):
+            return None
+        if claim(db, video.id, owner, now=now, statuses=statuses, status=status):
+            return video.id
+    return None
+
+
+def claim(db, video_id, owner=WORKER_ID, now=None, statuses=("queued",), status="processing"):
+    """Reserva um vídeo específico (só se ainda estiver em statuses). Retorna True se conseguiu."""
+    now = now or datetime.datetime.now()
+    claimed = db.query(ScheduledVideo).filter(
+        ScheduledVideo.id == video_id,
+        ScheduledVideo.status.in_(statuses)
+    ).update(_claim_values(owner, now, status), synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def renew(video_id, owner=WORKER_ID):
+    """Heartbeat: estende o lease. Retorna False se o lease foi perdido."""
+    db = SessionLocal()
+    try:
+        now = datetime.datetime.now()
+        renewed = db.query(ScheduledVideo).filter(
+            ScheduledVideo.id == video_id,
+            ScheduledVideo.status.in_(LEASED_STATUSES + (UPLOAD_STATUS,)),
+            ScheduledVideo.lease_owner == owner
+        ).update({"lease_expires_at": _lease_expiry(now), "heartbeat_at": now}, synchronize_session=False)
+        db.commit()
+        return renewed == 1
+    finally:
+        db.close()
+
+
+def fail_expired_render(video_id, owner=WORKER_ID):
+    """Marca como falha um render que passou de MAX_RENDER_SECONDS (somente se ainda for do owner)"""
+    db = SessionLocal()
+    try:
+        video = db.query(ScheduledVideo).filter(
+            ScheduledVideo.id == video_id,
+            ScheduledVideo.lease_owner == owner
+        ).first()
+        if video and video.status in LEASED_STATUSES:
+            video.status = "failed"
+            video.lease_owner = None
+            video.lease_expires_at = None
+            video.description = (video.description or "") + f"\n\n[SISTEMA]: Processo expirou (timeout de {MAX_RENDER_SECONDS // 60}min). Tente novamente."
+            db.commit()
+    finally:
+        db.close()
+
+
+def is_owner(db, video_id, owner):
+    current = db.query(ScheduledVideo.lease_owner).filter(ScheduledVideo.id == video_id).scalar()
+    return current == owner
+
+
+def reclaim_expired(db=None):
+    """Devolve à fila vídeos cujo lease expirou (worker morto). Retorna quantos foram devolvidos."""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        now = datetime.datetime.now()
+        reclaimed = db.query(ScheduledVideo).filter(
+            ScheduledVideo.status.in_(LEASED_STATUSES),
+            # Sem lease: vídeo marcado antes da migração ou por código legado
+            or_(ScheduledVideo.lease_expires_at == None, ScheduledVideo.lease_expires_at < now)
+        ).update({
+            "status": "queued",
+            "progress": 0,
+            "lease_owner": None,
+            "lease_expires_at": None,
+        }, synchronize_session=False)
+        db.commit()
+        if reclaimed:
+            print(f"Fila: {reclaimed} vídeo(s) com lease expirado devolvidos para 'queued'.")
+        return reclaimed
+    finally:
+        if own_session:
+            db.close()
+
+
+def signal_changed():
+    """Avisa os despachantes de outros processos que a fila mudou (vídeo ou item de lote enfileirado)"""
+    db = SessionLocal()
+    try:
+        bumped = db.query(QueueSignal).filter(QueueSignal.name == SIGNAL_NAME).update(
+            {"version": QueueSignal.version + 1, "updated_at": datetime.datetime.now()}, synchronize_session=False
+        )
+        if not bumped:
+            db.add(QueueSignal(name=SIGNAL_NAME, version=1))
+        db.commit()
+    except IntegrityError:
+        # Outro processo criou a linha ao mesmo tempo: o aviso dele já acorda os workers
+        db.rollback()
+    finally:
+        db.close()
+
+
+def signal_version():
+    """Versão atual da fila (0 se nunca houve aviso)"""
+    db = SessionLocal()
+    try:
+        return db.query(QueueSignal.version).filter(QueueSignal.name == SIGNAL_NAME).scalar() or 0
+    finally:
+        db.close()
+
+
+def claim_upload(db, video_id, owner=WORKER_ID):
+    """Reserva o upload de um vídeo pronto ('completed' e não publicado). Retorna True se conseguiu."""
+    now = datetime.datetime.now()
+    claimed = db.query(ScheduledVideo).filter(
+        ScheduledVideo.id == video_id,
+        ScheduledVideo.status == "completed",
+        ScheduledVideo.uploaded_at == None
+    ).update({
+        "status": UPLOAD_STATUS,
+        "lease_owner": owner,
+        "lease_expires_at": _lease_expiry(now),
+        "heartbeat_at": now,
+        "updated_at": now,
+    }, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def reclaim_expired_uploads(db=None):
+    """Devolve para 'completed' uploads cujo lease expirou (worker morto). Retorna quantos foram devolvidos."""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        now = datetime.datetime.now()
+        reclaimed = db.query(ScheduledVideo).filter(
+            ScheduledVideo.status == UPLOAD_STATUS,
+            or_(ScheduledVideo.lease_expires_at == None, ScheduledVideo.lease_expires_at < now)
+        ).update({
+            "status": "completed",
+            "lease_owner": None,
+            "lease_expires_at": None,
+        }, synchronize_session=False)
+        db.commit()
+        if reclaimed:
+            print(f"Fila: {reclaimed} upload(s) com lease expirado devolvidos para 'completed'.")
+        return reclaimed
+    finally:
+        if own_session:
+            db.close()
+
+
+def claim_next_task(db, owner=WORKER_ID, admit=None):
+    """Reserva o próximo item de lote da fila ('pending' com payload), na ordem de criação.
+    admit(task) como em claim_next: só confere a vaga. Retorna o id reservado ou None."""
+    candidates = db.query(VideoTask).filter(
+        VideoTask.status == "pending",
+        VideoTask.payload != None
+    ).order_by(VideoTask.created_at.asc(), VideoTask.position.asc()).limit(5).all()
+    for task in candidates:
+        if admit and not admit(task):
+            return None
+        now = datetime.datetime.now()
+        # O UPDATE condicional é a reserva em qualquer banco; quem perder a corrida tenta o próximo
+        claimed = db.query(VideoTask).filter(
+            VideoTask.id == task.id,
+            VideoTask.status == "pending"
+        ).update({
+            "status": "processing",
+            "lease_owner": owner,
+            "lease_expires_at": _lease_expiry(now),
+            "started_at": now,
+            "updated_at": now,
+        }, synchronize_session=False)
+        db.commit()
+        if claimed == 1:
+            return task.id
+    return None
+
+
+def renew_task(task_id, owner=WORKER_ID):
+    """Heartbeat de um item de lote. Retorna False se o lease foi perdido."""
+    db = SessionLocal()
+    try:
+        renewed = db.query(VideoTask).filter(
+            VideoTask.id == task_id,
+            VideoTask.status == "processing",
+            VideoTask.lease_owner == owner
+        ).update({"lease_expires_at": _lease_expiry()}, synchronize_session=False)
+        db.commit()
+        return renewed == 1
+    finally:
+        db.close()
+
+
+def is_task_owner(task_id, owner=WORKER_ID):
+    """True se o item de lote ainda está 'processing' com lease deste dono"""
+    db = SessionLocal()
+    try:
+        current = db.query(VideoTask.lease_owner).filter(VideoTask.id == task_id, VideoTask.status == "processing").scalar()
+        return current == owner
+    finally:
+        db.close()
+
+
+def reclaim_expired_tasks(db=None):
+    """Devolve à fila itens de lote cujo lease expirou (worker morto). Retorna quantos foram devolvidos."""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        reclaimed = db.query(VideoTask).filter(
+            VideoTask.status == "processing",
+            VideoTask.payload != None,
+            or_(VideoTask.lease_expires_at == None, VideoTask.lease_expires_at < datetime.datetime.now())
+        ).update({
+            "status": "pending",
+            "progress": 0,
+            "message": "Aguardando outro worker...",
+            "lease_owner": None,
+            "lease_expires_at": None,
+        }, synchronize_session=False)
+        db.commit()
+        if reclaimed:
+            print(f"Fila: {reclaimed} item(ns) de lote com lease expirado devolvidos para 'pending'.")
+        return reclaimed
+    finally:
+        if own_session:
+            db.close()
+
+
+class Heartbeat:
+    """Renova o lease de um vídeo em segundo plano enquanto o render (ou upload) roda.
+    max_seconds: teto de duração (None: sem teto, ex: upload, que já tem retentativas próprias).
+    renew_lease: função de renovação (padrão: renew, de ScheduledVideo; renew_task para itens de lote)."""
+
+    def __init__(self, video_id, owner=WORKER_ID, max_seconds=MAX_RENDER_SECONDS, renew_lease=None):
+        self.video_id = video_id
+        self.owner = owner
+        self.max_seconds = max_seconds
+        self.renew_lease = renew_lease or renew
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"lease-{video_id}", daemon=True)
+        self._started = None
+
+    def start(self):
+        self._started = datetime.datetime.now()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                if self.max_seconds and (datetime.datetime.now() - self._started).total_seconds() > self.max_seconds:
+                    print(f"Fila: vídeo {self.video_id} excedeu {self.max_seconds // 60}min. Marcando como falha.")
+                    fail_expired_render(self.video_id, self.owner)
+                    self.lost = True
+                    return
+                if not self.renew_lease(self.video_id, self.owner):
+                    print(f"Fila: lease do vídeo {self.video_id} perdido por {self.owner}.")
+                    self.lost = True
+                    return
+            except Exception as e:
+                # Falha transitória do banco: tenta de novo no próximo ciclo
+                print(f"Erro ao renovar lease do vídeo {self.video_id}: {e}")
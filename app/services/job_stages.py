@@ -0,0 +1,402 @@
+"""
+Pipeline de produção de um vídeo agendado como DAG de etapas persistidas.
+
+    script ──┬── images ──┐
+             ├── tts ─────┼── encode ── upload
+             └── music ───┘
+
+Cada etapa tem uma linha em job_stages com status, tentativas e saída (JSON:
+roteiro, caminhos de imagens e áudios, vídeo final). Uma nova execução do
+vídeo pula as etapas concluídas cujos arquivos ainda existem: uma falha no
+encode não gera de novo roteiro, imagens e narração. Etapas independentes
+(images, tts, music) rodam em paralelo.
+
+Cada etapa tem sua política de retentativa (DEFAULT_POLICIES): até
+max_attempts tentativas com backoff exponencial. Uma falha passageira do
+provedor de imagens repete só a etapa images, e só as cenas que faltam.
+O upload é executado pelo monitor no horário de publicação e registra suas
+tentativas na mesma tabela.
+
+Saída das etapas: "files" são arquivos gerados pela etapa (removidos quando o
+vídeo é publicado ou regenerado); "refs" são arquivos de que ela depende mas
+não são dela (trilha da biblioteca, MP4 final). Se algum sumir do disco, a
+etapa e as que dependem dela voltam a pending.
+"""
+import os
+import json
+import time
+import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from app.database import SessionLocal
+from app.models import JobStage
+from app.services import workspace, storage
+
+STAGE_GRAPH = {
+    "script": (),
+    "images": ("script",),
+    "tts": ("script",),
+    "music": ("script",),
+    "encode": ("images", "tts", "music"),
+    "upload": ("encode",),
+}
+# Etapas executadas pelo render (o upload roda no monitor)
+RENDER_STAGES = ("script", "images", "tts", "music", "encode")
+# Etapas de rede/IO que podem ser adiantadas enquanto outro vídeo codifica
+PREP_STAGES = ("script", "images", "tts", "music")
+
+# Tentativas por execução e backoff inicial em segundos (dobra a cada falha).
+# Sobrescreva as tentativas com STAGE_MAX_ATTEMPTS_<ETAPA>.
+DEFAULT_POLICIES = {
+    "script": {"max_attempts": 3, "backoff": 10},
+    "images": {"max_attempts": 4, "backoff": 15},
+    "tts": {"max_attempts": 3, "backoff": 10},
+    "music": {"max_attempts": 2, "backoff": 5},
+    "encode": {"max_attempts": 2, "backoff": 30},
+    "upload": {"max_attempts": 5, "backoff": 120},
+}
+MAX_BACKOFF_SECONDS = 900
+
+
+class StageRetry(Exception):
+    """Falha passageira: a etapa é repetida após o backoff; partial guarda o que já foi feito"""
+
+    def __init__(self, message, partial=None):
+        super().__init__(message)
+        self.partial = partial
+
+
+class StageFailed(Exception):
+    """A etapa esgotou as tentativas"""
+
+    def __init__(self, stage, message):
+        super().__init__(f"Etapa '{stage}' falhou: {message}")
+        self.stage = stage
+
+
+class PipelineStopped(Exception):
+    """Execução interrompida de fora (ex: lease perdido)"""
+
+
+def max_attempts(name):
+    return int(os.getenv(f"STAGE_MAX_ATTEMPTS_{name.upper()}", DEFAULT_POLICIES[name]["max_attempts"]))
+
+
+def backoff_seconds(name, attempts):
+    """Espera antes da tentativa seguinte à de número attempts"""
+    return min(MAX_BACKOFF_SECONDS, DEFAULT_POLICIES[name]["backoff"] * 2 ** max(0, attempts - 1))
+
+
+def dependents(name):
+    """A etapa e todas as que dependem dela, direta ou indiretamente"""
+    result = {name}
+    changed = True
+    while changed:
+        changed = False
+        for stage, deps in STAGE_GRAPH.items():
+            if stage not in result and result.intersection(deps):
+                result.add(stage)
+                changed = True
+    return result
+
+
+def ancestors(name):
+    """A etapa e todas as que ela precisa"""
+    result = {name}
+    for dep in STAGE_GRAPH[name]:
+        result |= ancestors(dep)
+    return result
+
+
+def _loads(value):
+    try:
+        return json.loads(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _missing_files(output):
+    if not output:
+        return []
+    # Arquivos de app/static voltam do armazenamento durável antes de contarem como perdidos
+    return [path for path in (output.get("files") or []) + (output.get("refs") or []) if path and not storage.ensure_local(path)]
+
+
+def load(db, video_id):
+    """Linhas de etapa do vídeo, criando as que faltam"""
+    stages = {stage.name: stage for stage in db.query(JobStage).filter(JobStage.video_id == video_id).all()}
+    for name in STAGE_GRAPH:
+        if name not in stages:
+            stages[name] = JobStage(video_id=video_id, name=name, status="pending", attempts=0)
+            db.add(stages[name])
+    db.commit()
+    return stages
+
+
+def _clear(stage):
+    stage.status = "pending"
+    stage.attempts = 0
+    stage.next_attempt_at = None
+    stage.output = None
+    stage.error = None
+    stage.started_at = None
+    stage.finished_at = None
+
+
+def discard_artifacts(db, video_id, names=None):
+    """Apaga os arquivos gerados pelas etapas (não toca nos refs)"""
+    query = db.query(JobStage).filter(JobStage.video_id == video_id)
+    if names:
+        query = query.filter(JobStage.name.in_(list(names)))
+    for stage in query.all():
+        for path in (_loads(stage.output) or {}).get("files") or []:
+            try:
+                if path and os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                print(f"Erro ao remover artefato {path}: {e}")
+
+
+def reset(db, video_id, from_stage=None):
+    """Descarta a etapa from_stage e todas as seguintes (sem from_stage: o pipeline inteiro)"""
+    names = dependents(from_stage) if from_stage else set(STAGE_GRAPH)
+    discard_artifacts(db, video_id, names)
+    if from_stage is None:
+        db.query(JobStage).filter(JobStage.video_id == video_id).delete(synchronize_session=False)
+        workspace.remove(workspace.video_key(video_id))
+    else:
+        for stage in db.query(JobStage).filter(JobStage.video_id == video_id, JobStage.name.in_(list(names))).all():
+            _clear(stage)
+    db.commit()
+
+
+def summary(db, video_id):
+    """Estado de cada etapa do vídeo, na ordem do grafo"""
+    stages = {stage.name: stage for stage in db.query(JobStage).filter(JobStage.video_id == video_id).all()}
+    result = []
+    for name in STAGE_GRAPH:
+        stage = stages.get(name)
+        seconds = None
+        if stage and stage.started_at and stage.finished_at:
+            seconds = round((stage.finished_at - stage.started_at).total_seconds(), 1)
+        result.append({
+            "name": name,
+            "after": list(STAGE_GRAPH[name]),
+            "status": stage.status if stage else "pending",
+            "attempts": stage.attempts if stage else 0,
+            "max_attempts": max_attempts(name),
+            "next_attempt_at": stage.next_attempt_at if stage else None,
+            "error": stage.error if stage else None,
+            "seconds": seconds,
+        })
+    return result
+
+
+def critical_path_seconds(stages):
+    """Duração (última tentativa) de cada etapa de render e o caminho crítico do DAG, a partir de summary()"""
+    seconds = {stage["name"]: stage["seconds"] or 0 for stage in stages if stage["name"] in RENDER_STAGES}
+    total = seconds.get("script", 0) + max(seconds.get(name, 0) for name in ("images", "tts", "music")) + seconds.get("encode", 0)
+    return seconds, total
+
+
+def _save(video_id, name, **fields):
+    """Grava a transição de uma etapa em sessão própria (etapas rodam em threads)"""
+    db = SessionLocal()
+    try:
+        fields["updated_at"] = datetime.datetime.now()
+        if "output" in fields:
+            fields["output"] = json.dumps(fields["output"], ensure_ascii=False, default=str) if fields["output"] is not None else None
+        db.query(JobStage).filter(JobStage.video_id == video_id, JobStage.name == name).update(fields, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def begin(video_id, name):
+    """Marca o início de uma tentativa fora do StagePipeline (upload). Retorna o número da tentativa."""
+    db = SessionLocal()
+    try:
+        stage = load(db, video_id)[name]
+        stage.status = "running"
+        stage.attempts = (stage.attempts or 0) + 1
+        stage.started_at = datetime.datetime.now()
+        stage.next_attempt_at = None
+        db.commit()
+        return stage.attempts
+    finally:
+        db.close()
+
+
+def complete(video_id, name, output=None):
+    _save(video_id, name, status="completed", output=output, error=None, finished_at=datetime.datetime.now(), next_attempt_at=None)
+
+
+def fail(video_id, name, attempt, error):
+    """Registra a falha da tentativa. Retorna o horário da próxima tentativa, ou None se esgotou."""
+    now = datetime.datetime.now()
+    if attempt < max_attempts(name):
+        retry_at = now + datetime.timedelta(seconds=backoff_seconds(name, attempt))
+        _save(video_id, name, status="pending", error=str(error)[:2000], finished_at=now, next_attempt_at=retry_at)
+        return retry_at
+    _save(video_id, name, status="failed", error=str(error)[:2000], finished_at=now, next_attempt_at=None)
+    return None
+
+
+def waiting_retry(db, video_ids, name, now=None):
+    """{video_id: próxima tentativa} dos vídeos cuja etapa name está em backoff"""
+    if not video_ids:
+        return {}
+    now = now or datetime.datetime.now()
+    rows = db.query(JobStage.video_id, JobStage.next_attempt_at).filter(
+        JobStage.video_id.in_(list(video_ids)),
+        JobStage.name == name,
+        JobStage.next_attempt_at > now
+    ).all()
+    return {row.video_id: row.next_attempt_at for row in rows}
+
+
+class StagePipeline:
+    """Executa as etapas pendentes de um vídeo até target (uma etapa ou tupla), em paralelo quando independentes.
+
+    handlers: {etapa: fn(outputs, previous, final_attempt) -> saída (dict JSON)}
+      outputs: saídas das etapas concluídas; previous: saída parcial da
+      tentativa anterior (StageRetry.partial) ou None; final_attempt: última
+      tentativa da política (hora de degradar em vez de pedir nova tentativa)."""
+
+    def __init__(self, video_id, handlers, target="encode", should_stop=None):
+        self.video_id = video_id
+        self.handlers = handlers
+        self.targets = (target,) if isinstance(target, str) else tuple(target)
+        self.should_stop = should_stop
+        needed = set()
+        for name in self.targets:
+            needed |= ancestors(name)
+        self.needed = [name for name in STAGE_GRAPH if name in needed]
+        self.outputs = {}
+        # Etapas executadas nesta chamada (as demais foram reaproveitadas)
+        self.executed = set()
+
+    def _prepare(self):
+        db = SessionLocal()
+        try:
+            stages = load(db, self.video_id)
+            invalid = set()
+            for name in self.needed:
+                stage = stages[name]
+                if stage.status == "completed" and _missing_files(_loads(stage.output)):
+                    print(f"Vídeo {self.video_id}: artefatos da etapa '{name}' sumiram; etapa será refeita.")
+                    invalid |= dependents(name)
+            for name in self.needed:
+                stage = stages[name]
+                if name in invalid:
+                    _clear(stage)
+                elif stage.status == "failed":
+                    # Nova execução: nova rodada de tentativas, aproveitando a saída parcial
+                    stage.status = "pending"
+                    stage.attempts = 0
+                    stage.next_attempt_at = None
+                elif stage.status == "running":
+                    # Execução anterior interrompida no meio da etapa (a tentativa já foi contada)
+                    stage.status = "pending"
+            if stages["upload"].status == "failed":
+                # Vídeo reenviado à fila após esgotar os uploads: o próximo ciclo recomeça as tentativas
+                stages["upload"].status = "pending"
+                stages["upload"].attempts = 0
+            db.commit()
+            self.state = {
+                name: {
+                    "status": stages[name].status,
+                    "attempts": stages[name].attempts or 0,
+                    "next_at": stages[name].next_attempt_at,
+                    "output": _loads(stages[name].output),
+                }
+                for name in self.needed
+            }
+        finally:
+            db.close()
+        self.outputs = {name: s["output"] for name, s in self.state.items() if s["status"] == "completed"}
+
+    def _ready(self, now, running):
+        ready = []
+        for name in self.needed:
+            s = self.state[name]
+            if s["status"] != "pending" or name in running:
+                continue
+            if not all(self.state[dep]["status"] == "completed" for dep in STAGE_GRAPH[name]):
+                continue
+            if s["next_at"] and s["next_at"] > now:
+                continue
+            ready.append(name)
+        return ready
+
+    def _start(self, pool, name):
+        s = self.state[name]
+        s["status"] = "running"
+        s["attempts"] += 1
+        s["next_at"] = None
+        final_attempt = s["attempts"] >= max_attempts(name)
+        previous = s["output"]
+        _save(self.video_id, name, status="running", attempts=s["attempts"], started_at=datetime.datetime.now(), finished_at=None, next_attempt_at=None)
+        self.executed.add(name)
+        outputs = dict(self.outputs)
+        return pool.submit(self.handlers[name], outputs, previous, final_attempt)
+
+    def _finish(self, name, future):
+        """Registra o resultado da tentativa. Retorna a mensagem de erro se a etapa falhou de vez."""
+        s = self.state[name]
+        try:
+            output = future.result()
+        except MemoryError:
+            s["status"] = "failed"
+            _save(self.video_id, name, status="failed", error="MemoryError", finished_at=datetime.datetime.now())
+            raise
+        except Exception as e:
+            if isinstance(e, StageRetry) and e.partial is not None:
+                s["output"] = e.partial
+                _save(self.video_id, name, output=e.partial)
+            retry_at = fail(self.video_id, name, s["attempts"], e)
+            if retry_at:
+                s["status"] = "pending"
+                s["next_at"] = retry_at
+                print(f"Vídeo {self.video_id}: etapa '{name}' falhou (tentativa {s['attempts']}), nova tentativa em {(retry_at - datetime.datetime.now()).total_seconds():.0f}s: {e}")
+                return None
+            s["status"] = "failed"
+            return str(e)
+        s["status"] = "completed"
+        s["output"] = output
+        self.outputs[name] = output
+        complete(self.video_id, name, output)
+        return None
+
+    def run(self):
+        """Executa até os targets. Retorna as saídas das etapas; StageFailed se alguma esgotar as tentativas."""
+        self._prepare()
+        failure = None
+        running = {}
+        with ThreadPoolExecutor(max_workers=len(self.needed), thread_name_prefix=f"stage-{self.video_id}") as pool:
+            while True:
+                if not running:
+                    if failure or all(self.state[name]["status"] == "completed" for name in self.targets):
+                        break
+                    if self.should_stop and self.should_stop():
+                        raise PipelineStopped(f"Execução do vídeo {self.video_id} interrompida")
+                now = datetime.datetime.now()
+                if not failure:
+                    for name in self._ready(now, running.values()):
+                        running[self._start(pool, name)] = name
+                if not running:
+                    # Só há etapas em backoff: espera a mais próxima
+                    pending = [s["next_at"] for s in self.state.values() if s["status"] == "pending" and s["next_at"]]
+                    if not pending:
+                        raise StageFailed(self.targets[-1], "nenhuma etapa pode ser executada")
+                    time.sleep(min(1.0, max(0.0, (min(pending) - now).total_seconds())))
+                    continue
+                done, _ = wait(list(running), timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = self._finish(name, future)
+                    if error and not failure:
+                        # Espera as etapas em andamento terminarem (e persistirem) antes de falhar
+                        failure = (name, error)
+        if failure:
+            raise StageFailed(*failure)
+        return self.outputs
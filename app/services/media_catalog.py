@@ -0,0 +1,292 @@
+"""
+Catálogo dos vídeos gerados (tabela media_assets).
+
+Cada render concluído é registrado uma única vez. register() sonda o MP4
+(tamanho, duração, resolução e codec, com ffprobe; sem ffprobe, pelo
+cabeçalho que o ffmpeg imprime) e extrai um pôster em
+app/static/videos/posters. A listagem de /youtube/videos é uma consulta
+paginada por cursor (id decrescente, chave primária): o custo depende do
+tamanho da página, não de quantos arquivos existem na pasta. Arquivos sem
+registro (restos de renders descartados) não aparecem.
+
+O MP4 e o pôster também são gravados no armazenamento durável (ver
+storage). Sem a cópia local, /static os restaura sob demanda.
+
+reconcile() (job periódico do monitor) remove registros cujo arquivo sumiu
+(do disco e do armazenamento) e cataloga MP4s de vídeos agendados gerados
+antes do catálogo existir. Cada execução confere no máximo RECONCILE_BATCH
+linhas de cada tabela, continuando de onde a anterior parou: o custo (e as
+consultas ao S3) não cresce com o catálogo.
+"""
+import os
+import re
+import json
+import shutil
+import subprocess
+from app.database import SessionLocal
+from app.models import MediaAsset, ScheduledVideo
+from app.services import storage
+from app.services.render_profile import ffmpeg_path
+
+VIDEOS_DIR = os.path.join("app", "static", "videos")
+POSTER_DIR = os.path.join(VIDEOS_DIR, "posters")
+POSTER_WIDTH = 320
+PROBE_TIMEOUT = 30
+MAX_PAGE_SIZE = 200
+RECONCILE_BATCH = int(os.getenv("MEDIA_RECONCILE_BATCH", "200"))
+
+# Último id conferido por reconcile() em cada tabela (volta ao início ao chegar no fim)
+_reconcile_cursors = {"assets": 0, "videos": 0}
+
+
+def path_for(url):
+    """Caminho local de uma URL /static/..."""
+    return os.path.join("app", url.lstrip("/"))
+
+
+def url_for(file_path):
+    return f"/static/videos/{os.path.basename(file_path)}"
+
+
+def _ffprobe():
+    found = shutil.which("ffprobe")
+    if found:
+        return found
+    # Algumas instalações trazem o ffprobe ao lado do ffmpeg
+    ffmpeg = ffmpeg_path()
+    if ffmpeg:
+        candidate = os.path.join(os.path.dirname(ffmpeg), "ffprobe")
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def _number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _probe_ffprobe(ffprobe, file_path):
+    output = subprocess.run(
+        [ffprobe, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=codec_name,width,height:format=duration", "-of", "json", file_path],
+        capture_output=True, text=True, timeout=PROBE_TIMEOUT, check=True
+    ).stdout
+    data = json.loads(output or "{}")
+    stream = (data.get("streams") or [{}])[0]
+    return {
+        "duration_seconds": _number((data.get("format") or {}).get("duration")),
+        "width": _number(stream.get("width"), int),
+        "height": _number(stream.get("height"), int),
+        "codec": stream.get("codec_name"),
+    }
+
+
+def _probe_ffmpeg(ffmpeg, file_path):
+    # Sem saída definida o ffmpeg termina com erro, mas imprime o cabeçalho do arquivo
+    header = subprocess.run(
+        [ffmpeg, "-hide_banner", "-i", file_path],
+        capture_output=True, text=True, timeout=PROBE_TIMEOUT
+    ).stderr
+    result = {"duration_seconds": None, "width": None, "height": None, "codec": None}
+    duration = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", header)
+    if duration:
+        hours, minutes, seconds = duration.groups()
+        result["duration_seconds"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    video = re.search(r"Video: (\w+).*?, (\d{2,5})x(\d{2,5})", header)
+    if video:
+        result["codec"] = video.group(1)
+        result["width"], result["height"] = int(video.group(2)), int(video.group(3))
+    return result
+
+
+def probe(file_path):
+    """Tamanho, duração, resolução e codec do vídeo"""
+    info = {"size_bytes": os.path.getsize(file_path)}
+    try:
+        ffprobe = _ffprobe()
+        if ffprobe:
+            info.update(_probe_ffprobe(ffprobe, file_path))
+        elif ffmpeg_path():
+            info.update(_probe_ffmpeg(ffmpeg_path(), file_path))
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        print(f"Erro ao sondar {file_path}: {e}")
+    return info
+
+
+def make_poster(file_path, duration_seconds=None):
+    """Extrai um quadro do vídeo como pôster (JPEG). Retorna a URL ou None."""
+    ffmpeg = ffmpeg_path()
+    if not ffmpeg:
+        return None
+    os.makedirs(POSTER_DIR, exist_ok=True)
+    name = os.path.splitext(os.path.basename(file_path))[0] + ".jpg"
+    poster_path = os.path.join(POSTER_DIR, name)
+    # 1s depois do início: o quadro 0 costuma ser o fade do título
+    offset = "1" if (duration_seconds or 0) > 2 else "0"
+    try:
+        subprocess.run(
+            [ffmpeg, "-v", "error", "-y", "-ss", offset, "-i", file_path, "-frames:v", "1",
+             "-vf", f"scale={POSTER_WIDTH}:-2", poster_path],
+            capture_output=True, timeout=PROBE_TIMEOUT, check=True
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Erro ao gerar pôster de {file_path}: {e}")
+        return None
+    return f"/static/videos/posters/{name}" if os.path.exists(poster_path) else None
+
+
+def register(video_url, source, video_id=None, task_id=None, db=None):
+    """Cataloga um vídeo recém-renderizado (nunca interrompe o job em caso de erro)"""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        file_path = path_for(video_url)
+        if not os.path.exists(file_path):
+            return None
+        info = probe(file_path)
+        info["poster_url"] = make_poster(file_path, info.get("duration_seconds"))
+        storage.persist(file_path)
+        if info["poster_url"]:
+            storage.persist(path_for(info["poster_url"]))
+        asset = db.query(MediaAsset).filter(MediaAsset.url == video_url).first()
+        if not asset:
+            asset = MediaAsset(url=video_url)
+            db.add(asset)
+        asset.source = source
+        asset.video_id = video_id
+        asset.task_id = task_id
+        for key, value in info.items():
+            setattr(asset, key, value)
+        db.commit()
+        return asset.id
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao catalogar vídeo {video_url}: {e}")
+        return None
+    finally:
+        if own_session:
+            db.close()
+
+
+def _asset_dict(asset):
+    return {
+        "id": asset.id,
+        "filename": os.path.basename(asset.url),
+        "url": asset.url,
+        "source": asset.source,
+        "video_id": asset.video_id,
+        "size_bytes": asset.size_bytes,
+        "duration_seconds": round(asset.duration_seconds, 2) if asset.duration_seconds else None,
+        "width": asset.width,
+        "height": asset.height,
+        "codec": asset.codec,
+        "poster_url": asset.poster_url,
+        # Epoch em segundos, como o os.path.getctime da listagem antiga
+        "created_at": asset.created_at.timestamp() if asset.created_at else None,
+    }
+
+
+def list_assets(db, limit=50, cursor=None, source=None, video_id=None):
+    """Página de vídeos, do mais recente ao mais antigo. cursor: next_cursor da página anterior."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = db.query(MediaAsset)
+    if cursor:
+        query = query.filter(MediaAsset.id < cursor)
+    if source:
+        query = query.filter(MediaAsset.source == source)
+    if video_id:
+        query = query.filter(MediaAsset.video_id == video_id)
+    rows = query.order_by(MediaAsset.id.desc()).limit(limit + 1).all()
+    page = rows[:limit]
+    return {
+        "items": [_asset_dict(asset) for asset in page],
+        "next_cursor": page[-1].id if len(rows) > limit else None,
+    }
+
+
+def _delete_local(urls):
+    for url in urls:
+        file_path = path_for(url)
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except OSError as e:
+            print(f"Erro ao deletar arquivo {file_path}: {e}")
+
+
+def remove(video_url, db=None):
+    """Apaga o vídeo, o pôster (disco e armazenamento) e o registro"""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        asset = db.query(MediaAsset).filter(MediaAsset.url == video_url).first()
+        urls = [video_url]
+        if asset and asset.poster_url:
+            urls.append(asset.poster_url)
+        _delete_local(urls)
+        for url in urls:
+            storage.remove(storage.key_for(url))
+        if asset:
+            db.delete(asset)
+            db.commit()
+    finally:
+        if own_session:
+            db.close()
+
+
+def evict_local(video_url, db=None):
+    """Libera o disco: apaga só a cópia local se o vídeo está no armazenamento durável, senão remove tudo"""
+    if not storage.stored(storage.key_for(video_url)):
+        remove(video_url, db=db)
+        return
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        asset = db.query(MediaAsset).filter(MediaAsset.url == video_url).first()
+        urls = [video_url]
+        if asset and asset.poster_url:
+            urls.append(asset.poster_url)
+        _delete_local(urls)
+    finally:
+        if own_session:
+            db.close()
+
+
+def _next_page(db, name, columns, key, *filters):
+    """Próximas RECONCILE_BATCH linhas depois do cursor de reconcile()"""
+    rows = db.query(key, *columns).filter(key > _reconcile_cursors[name], *filters).order_by(key.asc()).limit(RECONCILE_BATCH).all()
+    _reconcile_cursors[name] = rows[-1][0] if len(rows) == RECONCILE_BATCH else 0
+    return rows
+
+
+def reconcile(db=None):
+    """Remove registros de arquivos que sumiram e cataloga MP4s de vídeos agendados ainda sem registro
+    (um lote de cada tabela por execução)"""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        dropped = 0
+        for asset_id, url in _next_page(db, "assets", [MediaAsset.url], MediaAsset.id):
+            if not os.path.exists(path_for(url)) and not storage.stored(storage.key_for(url)):
+                db.query(MediaAsset).filter(MediaAsset.id == asset_id).delete(synchronize_session=False)
+                dropped += 1
+        db.commit()
+
+        added = 0
+        page = _next_page(db, "videos", [ScheduledVideo.video_url], ScheduledVideo.id, ScheduledVideo.video_url != None)
+        known = {url for (url,) in db.query(MediaAsset.url).filter(MediaAsset.url.in_([url for _, url in page])).all()} if page else set()
+        for video_id, url in page:
+            if url not in known and os.path.exists(path_for(url)):
+                if register(url, "scheduled", video_id=video_id, db=db):
+                    added += 1
+        if dropped or added:
+            print(f"Catálogo de mídia: {dropped} registros sem arquivo removidos, {added} vídeos catalogados.")
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao reconciliar catálogo de mídia: {e}")
+    finally:
+        if own_session:
+            db.close()
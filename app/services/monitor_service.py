@@ -1,40 +1,135 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from app.services.youtube_service import YouTubeService
 from app.services.ai_generator import AIContentGenerator
-from app.services.video_processing import process_scheduled_video
+from app.services import music_library, task_manager, video_batch
+from app.services.render_pool import RenderPool, estimate_video_cost
+from app.services import job_queue, job_stages, render_sandbox, scheduling, render_profile, workspace, media_catalog, storage, youtube_quota
+from app.services.upload_dispatcher import UploadDispatcher
+from app.services.video_processing import prepare_scheduled_video
+from app.services.eta_model import eta_model
 from app.database import SessionLocal
 from app.models import ChannelReport, ScheduledVideo
 import datetime
 import logging
 import json
 import os
+import threading
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Intervalo da varredura de segurança da fila (o despachante é acordado por eventos)
+QUEUE_SAFETY_NET_SECONDS = 60
+# Loops que um processo pode assumir (web embutido ou app.worker)
+ALL_ROLES = ("queue", "uploads", "monitor")
+# Preparação antecipada: enquanto o pool de render está cheio, adianta as etapas de rede
+# (roteiro, imagens, narração, música) dos próximos vídeos. RENDER_PREP_AHEAD = vídeos
+# preparados/em preparação aguardando encode (0 = desligado); RENDER_PREP_MEMORY_MB = teto de memória.
+PREP_AHEAD = int(os.getenv("RENDER_PREP_AHEAD", "1"))
+PREP_MEMORY_BUDGET_MB = int(os.getenv("RENDER_PREP_MEMORY_MB", "300"))
+# Memória aproximada de uma preparação (requisições HTTP, decodificação de uma imagem por vez)
+PREP_COST_MB = 120
+# O YouTube descarta sessões de upload resumível depois de uma semana: abaixo disso ainda dá para retomar
+UPLOAD_SESSION_TTL = datetime.timedelta(days=6)
+
 class MonitorService:
     def __init__(self):
         self.scheduler = BackgroundScheduler()
         self.job = None
         self.queue_job = None
         self.upload_job = None
+        self.music_job = None
+        # Despachante da fila: acordado ao enfileirar um vídeo ou ao terminar um render
+        self._queue_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._dispatcher_thread = None
+        # Serializa a varredura de uploads (tick periódico x disparos no horário exato x vaga liberada)
+        self._upload_lock = threading.Lock()
+        # Uploads simultâneos limitados por UPLOAD_WORKERS (uma única conta do YouTube)
+        self.upload_dispatcher = UploadDispatcher()
+        # Concorrência de renders limitada por RENDER_MEMORY_BUDGET_MB (sem a variável: perfil de render)
+        self.render_pool = RenderPool()
+        self.prep_pool = RenderPool(PREP_MEMORY_BUDGET_MB, PREP_AHEAD)
+        self.roles = set()
+        self.poll_seconds = QUEUE_SAFETY_NET_SECONDS
 
-    def start(self):
-        if not self.job:
-            # Startup Recovery: Reset any 'processing' videos to 'queued'
-            self._reset_stuck_videos()
+    def start(self, roles=ALL_ROLES, poll_seconds=None):
+        """Inicia os loops em segundo plano.
 
+        roles: "queue" (renderização), "uploads" (uploads agendados) e "monitor"
+        (relatórios do canal e biblioteca de músicas). Workers extras de
+        renderização usam apenas ("queue",). poll_seconds: intervalo máximo entre
+        varreduras da fila (útil quando outro processo enfileira os vídeos)."""
+        if self.scheduler.running:
+            return
+        roles = set(roles)
+        self.roles = roles
+        if poll_seconds:
+            self.poll_seconds = poll_seconds
+
+        if "monitor" in roles:
             # Run every 10 minutes
             self.job = self.scheduler.add_job(self.check_channel_status, 'interval', minutes=10)
-            # Run video queue check every 1 minute
+            
+            # Abastece a biblioteca de trilhas por mood fora do caminho crítico da renderização
+            self.music_job = self.scheduler.add_job(
+                music_library.replenish,
+                'interval',
+                minutes=30,
+                max_instances=1,
+                next_run_time=datetime.datetime.now() + datetime.timedelta(minutes=1)
+            )
+
+            # Remove tarefas sob demanda expiradas (TASK_TTL_HOURS)
+            self.scheduler.add_job(task_manager.cleanup_expired, 'interval', hours=1, max_instances=1)
+
+            # Pastas de jobs órfãs (inclusive de um processo que caiu) e teto de disco (WORKSPACE_DISK_BUDGET_MB)
+            self.scheduler.add_job(
+                workspace.reap,
+                'interval',
+                minutes=workspace.REAP_MINUTES,
+                max_instances=1,
+                next_run_time=datetime.datetime.now() + datetime.timedelta(minutes=1)
+            )
+
+            # Catálogo de mídia: registros sem arquivo e MP4s agendados anteriores ao catálogo
+            self.scheduler.add_job(
+                media_catalog.reconcile,
+                'interval',
+                hours=1,
+                max_instances=1,
+                next_run_time=datetime.datetime.now() + datetime.timedelta(minutes=2)
+            )
+
+        if "queue" in roles:
+            # Startup Recovery: Reset any 'processing' videos to 'queued'
+            self._reset_stuck_videos()
+
+            # Threads, preset, resolução e slots de render conforme os limites da instância
+            render_profile.start_autotune()
+
+            # Rede de segurança: acorda o despachante a cada minuto (vídeos enfileirados
+            # por outro processo, leases expirados). O caminho normal é notify_queue().
             # REMOVED next_run_time=now to allow server to startup fully before heavy processing
             self.queue_job = self.scheduler.add_job(
-                self.process_video_queue, 
+                self.notify_queue, 
                 'interval', 
-                minutes=1, 
+                seconds=QUEUE_SAFETY_NET_SECONDS, 
                 max_instances=1
             )
+
+            # Reajusta o modelo de ETA (ordem EDF) com a telemetria dos renders recentes
+            self.scheduler.add_job(
+                eta_model.refit,
+                'interval',
+                minutes=eta_model.refit_seconds / 60,
+                max_instances=1,
+                next_run_time=datetime.datetime.now()
+            )
+
+        if "uploads" in roles:
             # Run upload check every 5 minutes, starting immediately (catch up on missed uploads)
             self.upload_job = self.scheduler.add_job(
                 self.check_scheduled_uploads, 
@@ -42,32 +137,115 @@ class MonitorService:
                 minutes=5,
                 next_run_time=datetime.datetime.now()
             )
+            # Vídeos concluídos por outros processos: agenda o disparo exato do upload
+            self.scheduler.add_job(self._schedule_pending_uploads, 'interval', minutes=1, max_instances=1)
             
             # Executar verificação de integridade de arquivos (Self-Healing)
             self.check_file_integrity()
             
-            self.scheduler.start()
-            logger.info("Monitoramento do canal, processador de fila e agendador de uploads iniciados.")
+        self.scheduler.start()
 
-    def _reset_stuck_videos(self):
-        """Reseta vídeos que ficaram presos em 'processing' devido a reinicialização do servidor"""
+        if "uploads" in roles:
+            self._schedule_pending_uploads()
+
+        if "queue" in roles:
+            self._stop_event.clear()
+            self._dispatcher_thread = threading.Thread(target=self._dispatch_loop, name="video-queue-dispatcher", daemon=True)
+            self._dispatcher_thread.start()
+        logger.info(f"Serviços em segundo plano iniciados: {', '.join(sorted(roles))}.")
+
+    def notify_queue(self):
+        """Acorda o despachante da fila imediatamente (chamar após enfileirar um vídeo)"""
+        self._queue_event.set()
+        if "queue" not in self.roles:
+            # O despachante roda em outro processo (worker): avisa pela versão em queue_signals
+            try:
+                job_queue.signal_changed()
+            except Exception as e:
+                logger.error(f"Erro ao avisar os workers da fila: {e}")
+
+    def _dispatch_loop(self):
+        # Varre a fila ao menos uma vez por período de lease para reclamar renders de workers mortos
+        scan_every = min(self.poll_seconds, job_queue.LEASE_SECONDS)
+        last_scan = 0
+        seen_version = None
+        while not self._stop_event.is_set():
+            woken = self._queue_event.wait(timeout=min(job_queue.SIGNAL_POLL_SECONDS, scan_every))
+            self._queue_event.clear()
+            if self._stop_event.is_set():
+                break
+            if not woken:
+                try:
+                    version = job_queue.signal_version()
+                except Exception as e:
+                    logger.error(f"Erro ao consultar a versão da fila: {e}")
+                    version = seen_version
+                changed = version != seen_version
+                seen_version = version
+                if not changed and time.monotonic() - last_scan < scan_every:
+                    continue
+            last_scan = time.monotonic()
+            try:
+                # Inicia renders enquanto houver memória no pool; cada render que termina acorda o despachante
+                while not self._stop_event.is_set() and self.process_video_queue():
+                    pass
+            except Exception as e:
+                logger.error(f"Erro no despachante da fila: {e}")
+
+    def schedule_upload(self, video_id, scheduled_for=None):
+        """Agenda o upload de um vídeo pronto para o horário exato de scheduled_for"""
+        if not self.scheduler.running:
+            return
+        if scheduled_for is None:
+            db = SessionLocal()
+            try:
+                video = db.query(ScheduledVideo).filter(ScheduledVideo.id == video_id).first()
+                if not video or video.status != "completed" or not video.auto_post or video.uploaded_at:
+                    return
+                scheduled_for = video.scheduled_for
+            finally:
+                db.close()
+        run_at = max(scheduled_for or datetime.datetime.now(), datetime.datetime.now())
+        self.scheduler.add_job(
+            self.check_scheduled_uploads,
+            'date',
+            run_date=run_at,
+            id=f"upload-{video_id}",
+            replace_existing=True,
+            misfire_grace_time=300
+        )
+
+    def _schedule_pending_uploads(self):
+        """Agenda o disparo exato dos uploads de vídeos já prontos (ex: após reinício)"""
         db = SessionLocal()
         try:
-            stuck_videos = db.query(ScheduledVideo).filter(ScheduledVideo.status == "processing").all()
-            if stuck_videos:
-                logger.warning(f"Encontrados {len(stuck_videos)} vídeos presos em 'processing'. Resetando para 'queued'.")
-                for video in stuck_videos:
-                    video.status = "queued"
-                    video.progress = 0
-                db.commit()
+            pending = db.query(ScheduledVideo.id, ScheduledVideo.scheduled_for).filter(
+                ScheduledVideo.status == "completed",
+                ScheduledVideo.auto_post == True,
+                ScheduledVideo.uploaded_at == None
+            ).all()
+            retries = job_stages.waiting_retry(db, [video_id for video_id, _ in pending], "upload")
+            for video_id, scheduled_for in pending:
+                self.schedule_upload(video_id, retries.get(video_id, scheduled_for))
         except Exception as e:
-            logger.error(f"Erro ao resetar vídeos presos: {e}")
+            logger.error(f"Erro ao agendar uploads pendentes: {e}")
         finally:
             db.close()
 
+    def _reset_stuck_videos(self):
+        """Devolve à fila vídeos presos em 'processing' cujo lease expirou (ex: reinicialização do servidor).
+        Vídeos com lease válido pertencem a outro worker vivo e não são tocados."""
+        try:
+            stuck = job_queue.reclaim_expired()
+            job_queue.reclaim_expired_tasks()
+            if stuck:
+                logger.warning(f"Encontrados {stuck} vídeos presos em 'processing'. Resetados para 'queued'.")
+        except Exception as e:
+            logger.error(f"Erro ao resetar vídeos presos: {e}")
+
     def check_file_integrity(self):
-        """Verifica se os arquivos de vídeos 'completos' realmente existem no disco.
-           Se não existirem (ex: Render reiniciou), marca como 'queued' para regenerar."""
+        """Verifica se os arquivos de vídeos 'completos' realmente existem no disco ou no armazenamento durável.
+           Se não existirem (ex: Render reiniciou sem armazenamento durável), marca como 'queued' para regenerar."""
         logger.info("Verificando integridade dos arquivos de vídeo...")
         db = SessionLocal()
         try:
@@ -90,7 +268,8 @@ class MonitorService:
                 
                 abs_path = os.path.join(os.getcwd(), rel_path)
                 
-                if not os.path.exists(abs_path):
+                # Com cópia durável o arquivo é restaurado no upload: não precisa renderizar de novo
+                if not os.path.exists(abs_path) and not storage.stored(storage.key_for(video.video_url)):
                     logger.warning(f"Arquivo sumiu para vídeo {video.id} ({video.title}). Reiniciando geração...")
                     video.status = "queued"
                     video.progress = 0
@@ -108,58 +287,129 @@ class MonitorService:
             db.close()
 
     def stop(self):
+        self._stop_event.set()
+        self._queue_event.set()
         if self.scheduler.running:
             self.scheduler.shutdown()
             logger.info("Monitoramento do canal parado.")
+        # Leituras da API ainda não gravadas na cota do dia
+        youtube_quota.flush()
 
     def process_video_queue(self):
-        """Verifica se há vídeos na fila e inicia processamento"""
+        """Reserva e inicia o próximo vídeo da fila se o pool de renderização tiver memória livre.
+        Retorna True se iniciou um render ou devolveu vídeos à fila (o despachante tenta de novo)."""
         db = SessionLocal()
         try:
-            # 1. Check if any video is currently processing (to avoid overload)
-            processing = db.query(ScheduledVideo).filter(ScheduledVideo.status == "processing").first()
-            if processing:
-                # Check for timeout (stuck video)
-                # If updated_at is missing (legacy), assume it's stuck if we are here (simplification)
-                # or rely on a reasonable default if null.
-                
-                # Timeout: 40 min normalmente; 90 min se já estiver em fase final (95%+), pois write_videofile é pesado
-                is_final_render = (processing.progress or 0) >= 90
-                timeout_minutes = 90 if is_final_render else 40
-                timeout_limit = datetime.timedelta(minutes=timeout_minutes)
-                last_update = processing.updated_at or processing.scheduled_for or datetime.datetime.now()
-                
-                if datetime.datetime.now() - last_update > timeout_limit:
-                    logger.warning(f"Vídeo {processing.id} expirou (timeout {timeout_minutes}min). Marcando como falha.")
-                    processing.status = "failed"
-                    processing.description = (processing.description or "") + "\n\n[SISTEMA]: Processo expirou (timeout de 40min). Tente novamente."
-                    db.commit()
-                    # Continue to pick next video in next cycle (or now if we want to be aggressive)
-                    return
-                
-                logger.info(f"Fila ocupada: Vídeo {processing.id} está processando (Atualizado em: {last_update}).")
-                return
+            # 1. Leases expirados (worker morto): o vídeo (ou item de lote) volta para a fila
+            if job_queue.reclaim_expired(db) + job_queue.reclaim_expired_tasks(db):
+                return True
 
-            # 2. Pick next queued video
-            next_video = db.query(ScheduledVideo).filter(ScheduledVideo.status == "queued").order_by(ScheduledVideo.id.asc()).first()
-            
-            if next_video:
-                logger.info(f"Iniciando processamento do vídeo agendado {next_video.id}...")
-                # We call the processor directly (synchronously in this thread)
-                # Since we use max_instances=1, this won't overlap with itself.
-                process_scheduled_video(next_video.id)
-            else:
-                pass # Nothing to do
+            # 2. Reserva atômica do próximo vídeo (por prazo) que couber no pool.
+            # admit só confere a vaga; a memória é reservada depois que a reserva na fila vence.
+            costs = {}
+            def admit(video):
+                cost = estimate_video_cost(video)
+                if self.render_pool.fits(cost):
+                    costs[video.id] = cost
+                    return True
+                logger.info(f"Pool de renderização cheio ({self.render_pool.snapshot()['used_mb']} MB em uso). Vídeo {video.id} aguarda.")
+                return False
+
+            # Vídeos já preparados primeiro (só falta o encode); em cada grupo, ordem por
+            # prazo de publicação (EDF) considerando a duração prevista do render
+            video_id = job_queue.claim_next(
+                db, job_queue.WORKER_ID, admit=admit, order=scheduling.prepared_first, statuses=("prepared", "queued")
+            )
+            if not video_id:
+                # Sem agendado para iniciar: itens de lote sob demanda; pool cheio: adianta a preparação dos próximos
+                return self._start_batch_task(db) or self._start_preparation(db)
+            self.render_pool.acquire(video_id, costs[video_id])
+
+            logger.info(f"Iniciando processamento do vídeo agendado {video_id} (custo estimado {self.render_pool.snapshot()['running'].get(video_id)} MB)...")
+            threading.Thread(target=self._run_render, args=(video_id,), name=f"render-{video_id}", daemon=True).start()
+            return True
                 
         except Exception as e:
             logger.error(f"Erro no processador de fila: {e}")
+            return False
         finally:
             db.close()
 
+    def _start_batch_task(self, db):
+        """Reserva o próximo item de lote ('pending' com payload) se couber no pool de render. Retorna True se iniciou."""
+        costs = {}
+        def admit(task):
+            costs[task.id] = video_batch.estimate_task_cost(task)
+            return self.render_pool.fits(costs[task.id])
+
+        task_id = job_queue.claim_next_task(db, job_queue.WORKER_ID, admit=admit)
+        if not task_id:
+            return False
+        self.render_pool.acquire(task_id, costs[task_id])
+        logger.info(f"Iniciando item de lote {task_id} (custo estimado {costs[task_id]} MB)...")
+        threading.Thread(target=self._run_batch_task, args=(task_id,), name=f"batch-{task_id[:8]}", daemon=True).start()
+        return True
+
+    def _run_batch_task(self, task_id):
+        try:
+            video_batch.run_batch_task(task_id, job_queue.WORKER_ID)
+        except Exception as e:
+            logger.error(f"Erro ao renderizar item de lote {task_id}: {e}")
+        finally:
+            self.render_pool.release(task_id)
+            self.notify_queue()
+
+    def _start_preparation(self, db):
+        """Reserva o próximo vídeo da fila como 'preparing' se houver vaga de preparação. Retorna True se iniciou."""
+        if not PREP_AHEAD or not self.render_pool.running:
+            # Sem render em andamento não há encode para sobrepor: o próprio render prepara o vídeo
+            return False
+        prepared = db.query(ScheduledVideo.id).filter(ScheduledVideo.status == "prepared").count()
+        if prepared + len(self.prep_pool.running) >= PREP_AHEAD:
+            return False
+
+        video_id = job_queue.claim_next(
+            db, job_queue.WORKER_ID, admit=lambda video: self.prep_pool.fits(PREP_COST_MB),
+            order=scheduling.edf_order, status="preparing"
+        )
+        if not video_id:
+            return False
+        self.prep_pool.acquire(video_id, PREP_COST_MB)
+        logger.info(f"Preparando vídeo {video_id} enquanto o encoder está ocupado...")
+        threading.Thread(target=self._run_prepare, args=(video_id,), name=f"prepare-{video_id}", daemon=True).start()
+        return True
+
+    def _run_prepare(self, video_id):
+        try:
+            prepare_scheduled_video(video_id, job_queue.WORKER_ID)
+        except Exception as e:
+            logger.error(f"Erro ao preparar vídeo {video_id}: {e}")
+        finally:
+            self.prep_pool.release(video_id)
+            self.notify_queue()
+
+    def _run_render(self, video_id):
+        try:
+            # Subprocesso com limites de memória/CPU e watchdog (em thread se não houver suporte)
+            render_sandbox.run_render(video_id, job_queue.WORKER_ID, self.render_pool.snapshot()["running"].get(video_id))
+            self.schedule_upload(video_id)
+        except Exception as e:
+            logger.error(f"Erro ao renderizar vídeo {video_id}: {e}")
+        finally:
+            self.render_pool.release(video_id)
+            # Memória liberada: tenta iniciar o próximo da fila
+            self.notify_queue()
+
     def check_scheduled_uploads(self):
-        """Verifica vídeos prontos e agendados para upload"""
+        """Verifica vídeos prontos e agendados e distribui os uploads pelo pool (upload_dispatcher)"""
+        with self._upload_lock:
+            self._check_scheduled_uploads()
+
+    def _check_scheduled_uploads(self):
         db = SessionLocal()
         try:
+            # Uploads de um worker que morreu no meio voltam a ser elegíveis
+            job_queue.reclaim_expired_uploads(db)
             now = datetime.datetime.now()
             # Videos that are completed, have auto_post=True, scheduled time passed, and not yet uploaded
             videos_to_upload = db.query(ScheduledVideo).filter(
@@ -168,95 +418,229 @@ class MonitorService:
                 ScheduledVideo.scheduled_for <= now,
                 ScheduledVideo.uploaded_at == None
             ).all()
-            
-            if videos_to_upload:
-                yt_service = YouTubeService()
-                for video in videos_to_upload:
-                    logger.info(f"Iniciando upload automático do vídeo {video.id} ({video.title})...")
-                    try:
-                        # Construct absolute path (Platform Independent)
-                        # video.video_url is usually "/static/videos/..."
-                        rel_path = video.video_url.lstrip('/')
-                        if rel_path.startswith("static"):
-                             rel_path = os.path.join("app", rel_path)
-                             
-                        abs_video_path = os.path.join(os.getcwd(), rel_path)
-                        
-                        if not os.path.exists(abs_video_path):
-                            logger.error(f"Arquivo de vídeo não encontrado: {abs_video_path}")
-                            # Se o arquivo não existe, marcamos para regenerar (queued) em vez de ignorar
-                            logger.info(f"Tentando recuperar vídeo {video.id} reenviando para fila...")
-                            video.status = "queued"
-                            video.progress = 0
-                            db.commit()
-                            continue
-
-                        # Parse script data for tags if available
-                        tags = ["motivação", "sucesso"]
-                        if video.script_data:
-                            try:
-                                script = json.loads(video.script_data)
-                                if "tags" in script:
-                                    tags = script["tags"]
-                            except:
-                                pass
-
-                        # Check for lateness
-                        time_diff = now - video.scheduled_for
-                        if time_diff.total_seconds() > 600: # 10 minutes late
-                            logger.warning(f"EMERGÊNCIA: Upload do vídeo {video.id} está atrasado em {time_diff}. Iniciando imediatamente.")
-                        else:
-                            logger.info(f"Iniciando upload automático do vídeo {video.id} ({video.title})...")
-
-                        # Upload
-                        # video_path must be relative to app root or absolute
-                        # We stored relative path in DB like "/static/videos/..."
-                        upload_result = yt_service.upload_video(
-                            abs_video_path,
-                            title=video.title,
-                            description=video.description or "Vídeo gerado automaticamente por Codexia.",
-                            tags=tags
+            # Uploads que falharam aguardam o backoff da etapa 'upload' (disparo agendado em schedule_upload)
+            in_backoff = job_stages.waiting_retry(db, [v.id for v in videos_to_upload], "upload", now)
+            running = self.upload_dispatcher.snapshot()["running"]
+            videos_to_upload = [v for v in videos_to_upload if v.id not in in_backoff and v.id not in running]
+            # Mais atrasado primeiro: com cota ou workers escassos, os que já passaram do horário há mais tempo saem antes
+            videos_to_upload.sort(key=lambda v: (v.scheduled_for, v.id))
+
+            for index, video in enumerate(videos_to_upload):
+                if self.upload_dispatcher.full():
+                    logger.info(f"Pool de uploads cheio. {len(videos_to_upload) - index} vídeo(s) aguardam a próxima vaga.")
+                    break
+                # Retomar uma sessão não cria outro videos.insert: só uploads novos gastam cota
+                quota_units = 0
+                if not self._resumable_session(video, self._video_path(video)):
+                    quota_units = youtube_quota.INSERT_COST
+                    if not youtube_quota.reserve(quota_units):
+                        reset_at = youtube_quota.next_reset()
+                        logger.warning(f"Cota diária do YouTube esgotada. Uploads pendentes retomam às {reset_at:%d/%m %H:%M}.")
+                        self.scheduler.add_job(
+                            self.check_scheduled_uploads, 'date',
+                            run_date=reset_at + datetime.timedelta(minutes=1),
+                            id="upload-quota-reset", replace_existing=True, misfire_grace_time=3600
                         )
-                        
-                        # Interpretar resultado do upload:
-                        # - Sucesso real: dict com 'id' e sem 'error'
-                        # - Mock (sem credenciais): dict com 'id' e status 'uploaded_mock'
-                        # - Falha: dict com chave 'error' ou resultado vazio
-                        is_error = False
-                        video_id_value = None
-                        if isinstance(upload_result, dict):
-                            if upload_result.get("error"):
-                                is_error = True
-                            else:
-                                video_id_value = upload_result.get("id") or str(upload_result)
-                        else:
-                            # Qualquer outro tipo não-vazio é tratado como sucesso e logado como string
-                            if upload_result:
-                                video_id_value = str(upload_result)
-                            else:
-                                is_error = True
-
-                        if is_error or not video_id_value:
-                            logger.error(f"Falha no upload do vídeo {video.id}: {upload_result}")
-                            # Marcar como falha para não ficar em loop infinito de re-upload
-                            video.status = "failed"
-                            video.description = (video.description or "") + "\n\n[UPLOAD_ERRO]: falha ao enviar para o YouTube. Veja logs do servidor."
-                        else:
-                            video.uploaded_at = datetime.datetime.now()
-                            video.youtube_video_id = video_id_value
-                            video.status = "published"
-                            logger.info(f"Vídeo {video.id} publicado com sucesso! ID: {video_id_value}")
-                            
-                        db.commit()
-                        
-                    except Exception as e:
-                        logger.error(f"Erro ao fazer upload do vídeo {video.id}: {e}")
-                        
+                        break
+                started = False
+                try:
+                    started = self.upload_dispatcher.try_submit(
+                        video.id,
+                        lambda video_id=video.id, units=quota_units: self._upload_one(video_id, units),
+                        on_done=self._drain_uploads
+                    )
+                finally:
+                    if not started and quota_units:
+                        youtube_quota.refund(quota_units)
         except Exception as e:
             logger.error(f"Erro no verificador de uploads: {e}")
         finally:
             db.close()
 
+    def _drain_uploads(self):
+        """Um upload terminou: a vaga vai para o próximo vídeo pendente sem esperar o tick de 5 min"""
+        if self.scheduler.running:
+            self.scheduler.add_job(self.check_scheduled_uploads, id="upload-drain", replace_existing=True)
+
+    def _video_path(self, video):
+        # video.video_url is usually "/static/videos/..."
+        rel_path = (video.video_url or "").lstrip('/')
+        if rel_path.startswith("static"):
+            rel_path = os.path.join("app", rel_path)
+        return os.path.join(os.getcwd(), rel_path)
+
+    def _upload_one(self, video_id, quota_units):
+        """Upload de um vídeo (roda em um worker do pool de uploads, com sessão de banco própria).
+        quota_units: cota reservada pelo despachante, devolvida se a API não chegar a ser chamada."""
+        db = SessionLocal()
+        attempt = None
+        video = None
+        heartbeat = None
+        # Cota reservada ainda não gasta: devolvida no finally se a API não for chamada (inclusive por exceção)
+        reserved = quota_units
+        try:
+            # 'completed' -> 'uploading' por UPDATE condicional: outro worker com o mesmo vídeo perde aqui
+            if not job_queue.claim_upload(db, video_id):
+                # Publicado, alterado ou já sendo enviado por outro processo desde a varredura
+                return
+            heartbeat = job_queue.Heartbeat(video_id, max_seconds=None).start()
+            video = db.query(ScheduledVideo).filter(ScheduledVideo.id == video_id).first()
+            now = datetime.datetime.now()
+            abs_video_path = self._video_path(video)
+
+            if not os.path.exists(abs_video_path) and not storage.ensure_local(video.video_url):
+                logger.error(f"Arquivo de vídeo não encontrado: {abs_video_path}")
+                # Se o arquivo não existe, marcamos para regenerar (queued) em vez de ignorar
+                logger.info(f"Tentando recuperar vídeo {video.id} reenviando para fila...")
+                video.status = "queued"
+                video.progress = 0
+                video.lease_owner = None
+                video.lease_expires_at = None
+                db.commit()
+                self.notify_queue()
+                return
+
+            # Parse script data for tags if available
+            tags = ["motivação", "sucesso"]
+            if video.script_data:
+                try:
+                    script = json.loads(video.script_data)
+                    if "tags" in script:
+                        tags = script["tags"]
+                except:
+                    pass
+
+            # Check for lateness
+            time_diff = now - video.scheduled_for
+            if time_diff.total_seconds() > 600: # 10 minutes late
+                logger.warning(f"EMERGÊNCIA: Upload do vídeo {video.id} está atrasado em {time_diff}. Iniciando imediatamente.")
+            else:
+                logger.info(f"Iniciando upload automático do vídeo {video.id} ({video.title})...")
+
+            session_uri = self._resumable_session(video, abs_video_path)
+            if session_uri:
+                logger.info(f"Retomando upload do vídeo {video.id} a partir de {(video.upload_offset or 0) / (1024 * 1024):.1f} MB.")
+            elif video.upload_session_uri:
+                logger.info(f"Sessão de upload do vídeo {video.id} descartada (arquivo mudou ou sessão expirou).")
+
+            def on_progress(uri, offset):
+                if uri is None and session_uri:
+                    # Sessão expirou no YouTube: o envio recomeça com um novo videos.insert
+                    youtube_quota.charge(youtube_quota.INSERT_COST)
+                self._save_upload_session(db, video, abs_video_path, uri, offset)
+
+            yt_service = YouTubeService()
+
+            # Upload
+            # video_path must be relative to app root or absolute
+            # We stored relative path in DB like "/static/videos/..."
+            attempt = job_stages.begin(video.id, "upload")
+            if yt_service.service:
+                # A chamada à API gasta a reserva (sem credenciais o upload é simulado e a cota volta no finally)
+                reserved = 0
+            upload_result = yt_service.upload_video(
+                abs_video_path,
+                title=video.title,
+                description=video.description or "Vídeo gerado automaticamente por Codexia.",
+                tags=tags,
+                session_uri=session_uri,
+                on_progress=on_progress
+            )
+
+            # Interpretar resultado do upload:
+            # - Sucesso real: dict com 'id' e sem 'error'
+            # - Mock (sem credenciais): dict com 'id' e status 'uploaded_mock'
+            # - Falha: dict com chave 'error' ou resultado vazio
+            is_error = False
+            video_id_value = None
+            if isinstance(upload_result, dict):
+                if upload_result.get("error"):
+                    is_error = True
+                else:
+                    video_id_value = upload_result.get("id") or str(upload_result)
+            else:
+                # Qualquer outro tipo não-vazio é tratado como sucesso e logado como string
+                if upload_result:
+                    video_id_value = str(upload_result)
+                else:
+                    is_error = True
+
+            if is_error or not video_id_value:
+                logger.error(f"Falha no upload do vídeo {video.id}: {upload_result}")
+                self._upload_failed(db, video, attempt, upload_result)
+            else:
+                video.uploaded_at = datetime.datetime.now()
+                video.youtube_video_id = video_id_value
+                video.status = "published"
+                video.lease_owner = None
+                video.lease_expires_at = None
+                self._save_upload_session(db, video, abs_video_path, None, None)
+                logger.info(f"Vídeo {video.id} publicado com sucesso! ID: {video_id_value}")
+                job_stages.complete(video.id, "upload", {"youtube_video_id": video_id_value})
+                # Imagens e narração não são mais necessárias depois de publicado
+                job_stages.discard_artifacts(db, video.id)
+                workspace.remove(workspace.video_key(video.id))
+
+            db.commit()
+
+        except Exception as e:
+            logger.error(f"Erro ao fazer upload do vídeo {video_id}: {e}")
+            db.rollback()
+            if attempt:
+                self._upload_failed(db, video, attempt, e)
+            elif video is not None and video.status == job_queue.UPLOAD_STATUS:
+                self._release_upload(video, "completed")
+            db.commit()
+        finally:
+            if reserved:
+                youtube_quota.refund(reserved)
+            if heartbeat:
+                heartbeat.stop()
+            db.close()
+
+    def _resumable_session(self, video, file_path):
+        """Sessão resumível salva para o vídeo, se ainda vale para este arquivo (None: começa do zero)"""
+        if not video.upload_session_uri:
+            return None
+        started = video.upload_started_at or datetime.datetime.min
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            # Cópia local ainda não restaurada: o tamanho salvo é conferido de novo no upload
+            size = video.upload_size
+        if video.upload_size != size or datetime.datetime.now() - started > UPLOAD_SESSION_TTL:
+            return None
+        return video.upload_session_uri
+
+    def _save_upload_session(self, db, video, file_path, session_uri, offset):
+        """Persiste o ponto de retomada do upload (session_uri None: limpa a sessão)"""
+        if session_uri != video.upload_session_uri:
+            video.upload_started_at = datetime.datetime.now() if session_uri else None
+            video.upload_size = os.path.getsize(file_path) if session_uri else None
+        video.upload_session_uri = session_uri
+        video.upload_offset = offset
+        db.commit()
+
+    def _upload_failed(self, db, video, attempt, error):
+        """Etapa 'upload' falhou: agenda nova tentativa com backoff ou, esgotadas, marca o vídeo como falho"""
+        retry_at = job_stages.fail(video.id, "upload", attempt, error)
+        if retry_at:
+            logger.warning(f"Upload do vídeo {video.id} falhou (tentativa {attempt}). Nova tentativa às {retry_at:%H:%M:%S}.")
+            # Volta a ser 'completed' para a próxima varredura poder reservá-lo de novo
+            self._release_upload(video, "completed")
+            db.commit()
+            self.schedule_upload(video.id, retry_at)
+            return
+        # Marcar como falha para não ficar em loop infinito de re-upload
+        self._release_upload(video, "failed")
+        video.description = (video.description or "") + "\n\n[UPLOAD_ERRO]: falha ao enviar para o YouTube. Veja logs do servidor."
+
+    def _release_upload(self, video, status):
+        """Encerra a posse do upload (lease) deixando o vídeo em status"""
+        video.status = status
+        video.lease_owner = None
+        video.lease_expires_at = None
+
     def check_channel_status(self):
         logger.info(f"[{datetime.datetime.now()}] Executando verificação de canal...")
         db = SessionLocal()
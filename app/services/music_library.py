@@ -0,0 +1,282 @@
+"""
+Biblioteca de trilhas de fundo pré-geradas por mood.
+
+Um job em segundo plano (MonitorService) mantém um pool de faixas por
+music_mood: baixa as faixas livres de referência (Kevin MacLeod) e gera
+novas com MusicGen, normaliza a loudness (ffmpeg loudnorm) e registra
+duração e crédito em library.json. Na renderização, pick() apenas sorteia
+uma faixa do pool: a música nunca fica no caminho crítico do vídeo.
+
+O music_mood vem livre do roteiro da IA. Só os moods de DEFAULT_MOODS (e as
+variações em MOOD_ALIASES) têm pool; o resto usa a faixa mais parecida. Um
+mood conhecido ainda sem faixas fica anotado em library.json ("requested")
+para o replenish, que pode rodar em outro processo, abastecê-lo primeiro.
+"""
+import os
+import re
+import json
+import uuid
+import random
+import datetime
+import threading
+import subprocess
+import requests
+
+LEGACY_MUSIC_DIR = "app/static/music"
+LIBRARY_DIR = os.path.join(LEGACY_MUSIC_DIR, "library")
+INDEX_PATH = os.path.join(LIBRARY_DIR, "library.json")
+POOL_SIZE = int(os.getenv("MUSIC_LIBRARY_POOL_SIZE", "3"))
+DEFAULT_MOODS = ["drama", "epic", "happy", "epic_cinematic", "emotional_cinematic"]
+# Variações que a IA costuma escrever em music_mood -> mood do pool
+MOOD_ALIASES = {
+    "dramatic": "drama",
+    "suspense": "drama",
+    "dark": "drama",
+    "epico": "epic",
+    "inspirational": "epic",
+    "motivational": "epic",
+    "powerful": "epic",
+    "cinematic": "epic_cinematic",
+    "cinematico": "epic_cinematic",
+    "emotional": "emotional_cinematic",
+    "emocional": "emotional_cinematic",
+    "sad": "emotional_cinematic",
+    "melancholic": "emotional_cinematic",
+    "upbeat": "happy",
+    "cheerful": "happy",
+    "feliz": "happy",
+    "alegre": "happy",
+}
+# Teto de moods pedidos guardados no índice
+MAX_REQUESTED_MOODS = len(DEFAULT_MOODS)
+# Loudness alvo para música de fundo (EBU R128)
+LOUDNORM_FILTER = "loudnorm=I=-16:TP=-1.5:LRA=11"
+
+# Faixas livres usadas para semear o pool (antes baixadas durante a renderização)
+SEED_TRACKS = {
+    "drama": {
+        "url": "https://incompetech.com/music/royalty-free/mp3-royaltyfree/Impact%20Prelude.mp3",
+        "credit": "Music: Impact Prelude by Kevin MacLeod\nFree download: https://filmmusic.io/song/3900-impact-prelude\nLicense (CC BY 4.0): https://filmmusic.io/standard-license",
+    },
+    "epic": {
+        "url": "https://incompetech.com/music/royalty-free/mp3-royaltyfree/Impact%20Andante.mp3",
+        "credit": "Music: Impact Andante by Kevin MacLeod\nFree download: https://filmmusic.io/song/3898-impact-andante\nLicense (CC BY 4.0): https://filmmusic.io/standard-license",
+    },
+    "happy": {
+        "url": "https://incompetech.com/music/royalty-free/mp3-royaltyfree/Carefree.mp3",
+        "credit": "Music: Carefree by Kevin MacLeod\nFree download: https://filmmusic.io/song/3476-carefree\nLicense (CC BY 4.0): https://filmmusic.io/standard-license",
+    },
+}
+
+_lock = threading.Lock()
+
+
+def _load_index():
+    if not os.path.exists(INDEX_PATH):
+        return {"tracks": []}
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Erro ao ler índice da biblioteca de músicas: {e}")
+        return {"tracks": []}
+
+
+def _save_index(index):
+    os.makedirs(LIBRARY_DIR, exist_ok=True)
+    tmp_path = f"{INDEX_PATH}.{uuid.uuid4().hex[:6]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, INDEX_PATH)
+
+
+def _available(tracks):
+    return [t for t in tracks if os.path.exists(os.path.join(LIBRARY_DIR, t["file"]))]
+
+
+def list_tracks(mood=None):
+    tracks = _available(_load_index().get("tracks", []))
+    if mood:
+        tracks = [t for t in tracks if t["mood"] == mood]
+    return tracks
+
+
+def _slug(mood):
+    return re.sub(r"[^a-z0-9_]+", "_", (mood or "").lower()).strip("_")
+
+
+def normalize_mood(mood):
+    """Mood do pool para um music_mood livre, ou None se não é um mood conhecido"""
+    slug = _slug(mood)
+    slug = MOOD_ALIASES.get(slug, slug)
+    return slug if slug in DEFAULT_MOODS else None
+
+
+def requested_moods():
+    return _load_index().get("requested", [])
+
+
+def _set_requested(mood, requested):
+    """Anota (ou retira) um mood sem faixas no índice, compartilhado com o replenish de outros processos"""
+    with _lock:
+        index = _load_index()
+        pending = index.get("requested", [])
+        if requested and mood not in pending and len(pending) < MAX_REQUESTED_MOODS:
+            pending.append(mood)
+        elif not requested and mood in pending:
+            pending.remove(mood)
+        else:
+            return
+        index["requested"] = pending
+        _save_index(index)
+
+
+def pick(mood):
+    """Sorteia uma faixa do pool do mood (ou do mood mais parecido). Nunca acessa a rede.
+    Retorna {"path", "credit", "duration", "mood"} ou None se a biblioteca estiver vazia."""
+    slug = _slug(mood) or "drama"
+    known = normalize_mood(slug)
+    index = _load_index()
+    tracks = _available(index.get("tracks", []))
+    candidates = [t for t in tracks if t["mood"] == known]
+    if known and not candidates and known not in index.get("requested", []):
+        _set_requested(known, True)
+    if not tracks:
+        return None
+
+    if not candidates:
+        # "epic_cinematic" → faixas de "epic" ou "cinematic"
+        tokens = set(slug.split("_"))
+        candidates = [t for t in tracks if tokens & set(t["mood"].split("_"))] or tracks
+
+    track = random.choice(candidates)
+    return {
+        "path": os.path.join(LIBRARY_DIR, track["file"]),
+        "credit": track.get("credit"),
+        "duration": track.get("duration"),
+        "mood": track["mood"],
+    }
+
+
+def _ffmpeg_exe():
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def _normalize(src_path, dest_path):
+    """Normaliza a loudness e converte para MP3"""
+    cmd = [_ffmpeg_exe(), "-y", "-loglevel", "error", "-i", src_path,
+           "-af", LOUDNORM_FILTER, "-ar", "44100", "-b:a", "192k", dest_path]
+    subprocess.run(cmd, check=True, timeout=300)
+
+
+def _probe_duration(path):
+    try:
+        from moviepy import AudioFileClip
+        clip = AudioFileClip(path)
+        try:
+            return round(clip.duration, 2)
+        finally:
+            clip.close()
+    except Exception as e:
+        print(f"Erro ao medir duração de {path}: {e}")
+        return None
+
+
+def add_track(raw_path, mood, credit=None, source="musicgen"):
+    """Normaliza um arquivo de áudio bruto e o registra no pool do mood"""
+    known = normalize_mood(mood)
+    if not known:
+        raise ValueError(f"Mood de música desconhecido: {mood!r}")
+    mood = known
+    os.makedirs(LIBRARY_DIR, exist_ok=True)
+    filename = f"{mood}_{uuid.uuid4().hex[:10]}.mp3"
+    dest_path = os.path.join(LIBRARY_DIR, filename)
+    _normalize(raw_path, dest_path)
+    entry = {
+        "file": filename,
+        "mood": mood,
+        "duration": _probe_duration(dest_path),
+        "credit": credit,
+        "source": source,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    with _lock:
+        index = _load_index()
+        index.setdefault("tracks", []).append(entry)
+        _save_index(index)
+    return entry
+
+
+def _download_seed(mood):
+    seed = SEED_TRACKS[mood]
+    raw_path = os.path.join(LIBRARY_DIR, f"raw_{uuid.uuid4().hex[:8]}.mp3")
+    try:
+        response = requests.get(seed["url"], timeout=60)
+        if response.status_code != 200:
+            print(f"Erro ao baixar faixa base de {mood}: HTTP {response.status_code}")
+            return None
+        with open(raw_path, "wb") as f:
+            f.write(response.content)
+        return add_track(raw_path, mood, credit=seed["credit"], source="kevin_macleod")
+    except Exception as e:
+        print(f"Erro ao baixar faixa base de {mood}: {e}")
+        return None
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+
+def _generate_track(ai_service, mood):
+    content = ai_service.generate_music(f"{mood.replace('_', ' ')} style", timeout=180)
+    if not content:
+        return None
+    raw_path = os.path.join(LIBRARY_DIR, f"raw_{uuid.uuid4().hex[:8]}.wav")
+    try:
+        with open(raw_path, "wb") as f:
+            f.write(content)
+        return add_track(raw_path, mood, credit=None, source="musicgen")
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+
+def replenish(moods=None, pool_size=POOL_SIZE):
+    """Completa o pool de cada mood até pool_size faixas (job em segundo plano)"""
+    from app.services.ai_generator import AIContentGenerator
+
+    os.makedirs(LIBRARY_DIR, exist_ok=True)
+    # Moods que renders pediram e não tinham faixa vão primeiro
+    targets = []
+    for mood in requested_moods() + list(moods or DEFAULT_MOODS):
+        mood = normalize_mood(mood)
+        if mood and mood not in targets:
+            targets.append(mood)
+
+    ai_service = None
+    for mood in targets:
+        try:
+            existing = list_tracks(mood)
+            missing = pool_size - len(existing)
+            if missing <= 0:
+                _set_requested(mood, False)
+                continue
+
+            if mood in SEED_TRACKS and not any(t.get("source") == "kevin_macleod" for t in existing):
+                if _download_seed(mood):
+                    missing -= 1
+
+            for _ in range(max(0, missing)):
+                if ai_service is None:
+                    ai_service = AIContentGenerator()
+                if not _generate_track(ai_service, mood):
+                    # MusicGen indisponível agora: tenta de novo no próximo ciclo
+                    break
+            if list_tracks(mood):
+                _set_requested(mood, False)
+            print(f"Biblioteca de músicas: mood '{mood}' com {len(list_tracks(mood))} faixas.")
+        except Exception as e:
+            print(f"Erro ao abastecer biblioteca de músicas ({mood}): {e}")
@@ -0,0 +1,91 @@
+"""
+Progresso de renderização agrupado antes de ir para o banco.
+
+O RenderProgressLogger do moviepy chama o callback a cada quadro codificado.
+O ProgressReporter guarda o último valor em memória e só grava quando a etapa
+muda, passou PROGRESS_FLUSH_SECONDS desde a última gravação ou o progresso
+avançou pelo menos PROGRESS_MIN_DELTA pontos. A gravação é um UPDATE
+direcionado, em sessão própria, só das colunas progress, progress_message e
+heartbeat_at. A sessão do job não é usada e não há commit do objeto inteiro.
+"""
+import os
+import time
+import datetime
+import threading
+from app.database import SessionLocal
+from app.models import ScheduledVideo
+from app.services.event_bus import event_bus
+
+FLUSH_SECONDS = float(os.getenv("PROGRESS_FLUSH_SECONDS", "5"))
+MIN_DELTA = int(os.getenv("PROGRESS_MIN_DELTA", "5"))
+
+
+class ProgressReporter:
+    def __init__(self, video_id, initial=0, flush_seconds=FLUSH_SECONDS, min_delta=MIN_DELTA, status="processing"):
+        self.video_id = video_id
+        self.status = status
+        self.flush_seconds = flush_seconds
+        self.min_delta = min_delta
+        self.progress = initial or 0
+        self.message = None
+        self.writes = 0
+        self._written = self.progress
+        self._last_flush = 0.0
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def __call__(self, progress, message=None):
+        """Callback de progresso (0-100). Nunca diminui o progresso (evita 95% -> 24%)."""
+        try:
+            progress = int(progress)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            if progress < self.progress:
+                return
+            if progress == self.progress and (not message or message == self.message):
+                return
+            stage_changed = bool(message) and message != self.message
+            self.progress = progress
+            if message:
+                self.message = message
+            self._dirty = True
+            due = (
+                progress >= 100
+                or stage_changed
+                or progress - self._written >= self.min_delta
+                or time.monotonic() - self._last_flush >= self.flush_seconds
+            )
+        # Painel conectado a este processo recebe na hora; os demais, pelo banco (ChangeWatcher)
+        event_bus.publish("schedule", {
+            "type": "schedule", "id": self.video_id, "status": self.status,
+            "progress": progress, "message": self.message,
+        })
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Grava o valor pendente, se houver"""
+        with self._lock:
+            if not self._dirty:
+                return
+            progress, message = self.progress, self.message
+            self._dirty = False
+            self._written = progress
+            self._last_flush = time.monotonic()
+        db = SessionLocal()
+        try:
+            db.query(ScheduledVideo).filter(ScheduledVideo.id == self.video_id).update({
+                "progress": progress,
+                "progress_message": message,
+                "heartbeat_at": datetime.datetime.now(),
+            }, synchronize_session=False)
+            db.commit()
+            self.writes += 1
+        except Exception as e:
+            print(f"Erro ao gravar progresso do vídeo {self.video_id}: {e}")
+        finally:
+            db.close()
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,142 @@
+"""
+Orçamentos de tempo por etapa da renderização (roteiro, imagens, narração, música, encode).
+
+Cada job recebe um RenderBudget. Chamadas externas lentas (IA, Pollinations,
+MusicGen, TTS) rodam com prazo; quando o orçamento da etapa acaba, a etapa
+degrada de forma determinística (fundo procedural, biblioteca local de música,
+gTTS, roteiro local) e a degradação fica registrada no job.
+
+O prazo não cria threads: a chamada roda na própria thread e os clientes de
+rede usam request_timeout() como timeout (requests, OpenAI, Gemini, Edge TTS).
+"""
+import os
+import re
+import time
+import threading
+import datetime
+from contextlib import contextmanager
+
+STAGES = ("script", "images", "tts", "music", "encode")
+
+# Segundos por etapa (somados ao longo de todas as cenas). Sobrescreva com RENDER_BUDGET_<ETAPA>.
+DEFAULT_BUDGETS = {
+    "script": 120,
+    "images": 300,
+    "tts": 240,
+    "music": 90,
+    "encode": 3600,
+}
+
+
+# Timeout mínimo de uma requisição com o prazo já esgotado (falha rápido em vez de zero/negativo)
+MIN_REQUEST_TIMEOUT = 1.0
+
+# Prazo da chamada em andamento nesta thread (monotonic), definido por call_with_deadline
+_deadline = threading.local()
+
+
+class StageTimeout(Exception):
+    """A etapa esgotou seu orçamento de tempo"""
+
+
+def request_timeout(default=None):
+    """Timeout (s) para uma requisição de rede: o que resta do prazo de call_with_deadline,
+    limitado a default. Fora de um prazo retorna default (None = timeout do próprio cliente)."""
+    deadline = getattr(_deadline, "at", None)
+    if deadline is None:
+        return default
+    remaining = max(MIN_REQUEST_TIMEOUT, deadline - time.monotonic())
+    return min(remaining, default) if default else remaining
+
+
+def call_with_deadline(fn, timeout, *args, **kwargs):
+    """Executa fn com prazo de timeout segundos (None = sem limite: chamada direta).
+    fn roda nesta thread; os clientes de rede que ela usa leem request_timeout(). Um erro
+    depois do prazo (timeout do cliente, provedores esgotados) vira StageTimeout."""
+    if timeout is None:
+        return fn(*args, **kwargs)
+    previous = getattr(_deadline, "at", None)
+    deadline = time.monotonic() + timeout
+    _deadline.at = deadline if previous is None else min(deadline, previous)
+    try:
+        return fn(*args, **kwargs)
+    except StageTimeout:
+        raise
+    except Exception as e:
+        if time.monotonic() >= _deadline.at:
+            raise StageTimeout(f"{getattr(fn, '__name__', 'chamada')} excedeu {timeout:.1f}s") from e
+        raise
+    finally:
+        _deadline.at = previous
+
+
+class RenderBudget:
+    def __init__(self, budgets=None):
+        self.budgets = {}
+        for stage, default in DEFAULT_BUDGETS.items():
+            self.budgets[stage] = float(os.getenv(f"RENDER_BUDGET_{stage.upper()}", default))
+        for stage, seconds in (budgets or {}).items():
+            if stage in self.budgets and seconds is not None:
+                self.budgets[stage] = float(seconds)
+        self.spent = {stage: 0.0 for stage in STAGES}
+        self.degradations = []
+        self._lock = threading.Lock()
+
+    def remaining(self, stage):
+        return max(0.0, self.budgets[stage] - self.spent[stage])
+
+    def expired(self, stage):
+        return self.remaining(stage) <= 0
+
+    @contextmanager
+    def stage(self, stage):
+        """Contabiliza o tempo gasto no bloco dentro do orçamento da etapa"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.spent[stage] += time.monotonic() - started
+
+    def run(self, stage, fn, *args, **kwargs):
+        """Executa fn com o tempo restante da etapa como prazo (StageTimeout se esgotar)"""
+        if self.expired(stage):
+            raise StageTimeout(f"Orçamento da etapa '{stage}' esgotado")
+        with self.stage(stage):
+            return call_with_deadline(fn, self.remaining(stage), *args, **kwargs)
+
+    def degrade(self, stage, fallback, reason="orçamento esgotado"):
+        """Registra a degradação (agrupando ocorrências repetidas da mesma etapa/fallback)"""
+        with self._lock:
+            for entry in self.degradations:
+                if entry["stage"] == stage and entry["fallback"] == fallback:
+                    entry["count"] += 1
+                    return
+            self.degradations.append({
+                "stage": stage,
+                "fallback": fallback,
+                "reason": reason,
+                "count": 1,
+                "at": datetime.datetime.now().isoformat(timespec="seconds"),
+            })
+        print(f"[BUDGET] Etapa '{stage}' degradada para '{fallback}': {reason}")
+
+    def timings(self):
+        return {stage: round(seconds, 2) for stage, seconds in self.spent.items()}
+
+
+def fallback_script_plan(title, concept="", max_scenes=6):
+    """Roteiro mínimo montado localmente (sem IA) a partir do título e do conceito"""
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", concept or "") if s.strip()]
+    if not sentences:
+        sentences = [title or "Vídeo"]
+    scenes = [
+        {"text": sentence, "image_prompt": f"Cinematic digital art representing: {sentence[:100]}"}
+        for sentence in sentences[:max_scenes]
+    ]
+    return {
+        "title": title or "Vídeo",
+        "description": concept or "",
+        "scenes": scenes,
+        "music_mood": "drama",
+    }
@@ -0,0 +1,127 @@
+"""
+Pool de renderização limitado por memória.
+
+A concorrência vem de um orçamento de memória (RENDER_MEMORY_BUDGET_MB) e do
+custo estimado de cada job (resolução, número de cenas, duração). Sem
+orçamento configurado o pool tem um único slot: o mesmo comportamento
+sequencial de sempre, seguro para o free tier. Sem as variáveis, slots e
+orçamento vêm do perfil de render (render_profile), ajustado aos recursos da
+instância.
+
+Cada processo orça só os próprios renders: o orçamento e os slots descrevem a
+máquina (ou contêiner) onde o pool roda. Workers em outras instâncias têm o
+próprio pool.
+"""
+import os
+import json
+import threading
+from app.services import render_profile
+
+# Memória residente aproximada de um render (Python + moviepy + ffmpeg) antes das cenas
+BASE_RENDER_MB = 250
+# Minutos de áudio/vídeo mantidos em buffers pelo moviepy durante o encode
+MB_PER_MINUTE = 20
+
+
+def video_size_for(video_type):
+    """Resolução usada pelo VideoGenerator (do perfil de render; 720p no free tier)"""
+    return render_profile.frame_size("9:16" if video_type == "short" else "16:9")
+
+
+def resolve_duration(video_type, script_data):
+    """Duração em minutos: solicitada no plano > Short (1 min) > padrão (3 min)"""
+    if script_data.get("duration"):
+        try:
+            return int(script_data.get("duration"))
+        except (TypeError, ValueError):
+            pass
+    if video_type == "short":
+        return 1
+    return 3
+
+
+def estimate_job_cost(video_type, script_data, duration=None):
+    """Estimativa de pico de memória (MB) de um render"""
+    width, height = video_size_for(video_type)
+    duration = duration or resolve_duration(video_type, script_data)
+    scenes = script_data.get("scenes")
+    # O roteiro final pede pelo menos 2 cenas por minuto (mínimo 5)
+    scene_count = len(scenes) if isinstance(scenes, list) and scenes else max(5, duration * 2)
+    frame_mb = width * height * 3 / (1024 * 1024)
+    # Cada cena guarda o quadro RGB + cópia composta; título e slide final somam 2 cenas
+    return int(BASE_RENDER_MB + frame_mb * 2 * (scene_count + 2) + MB_PER_MINUTE * duration)
+
+
+def estimate_video_cost(video):
+    """Custo estimado de um ScheduledVideo"""
+    try:
+        script_data = json.loads(video.script_data) if video.script_data else {}
+    except (TypeError, ValueError):
+        script_data = {}
+    return estimate_job_cost(video.video_type, script_data)
+
+
+class RenderPool:
+    def __init__(self, memory_budget_mb=None, max_slots=None):
+        if memory_budget_mb is None and os.getenv("RENDER_MEMORY_BUDGET_MB"):
+            memory_budget_mb = int(os.getenv("RENDER_MEMORY_BUDGET_MB"))
+        if max_slots is None and os.getenv("RENDER_MAX_SLOTS"):
+            max_slots = int(os.getenv("RENDER_MAX_SLOTS"))
+        self._memory_budget_mb = memory_budget_mb
+        self._max_slots = max_slots
+        self.running = {}
+        self._lock = threading.Lock()
+
+    @property
+    def memory_budget_mb(self):
+        if self._memory_budget_mb is not None:
+            return self._memory_budget_mb
+        # Lido a cada uso: o perfil pode mudar quando a calibração termina
+        return render_profile.current()["memory_budget_mb"]
+
+    @property
+    def max_slots(self):
+        if self._max_slots:
+            return self._max_slots
+        if self._memory_budget_mb:
+            return 32
+        # Perfil free: um único slot, sem orçamento (comportamento do free tier)
+        return render_profile.current()["slots"]
+
+    def concurrency(self, cost_mb):
+        """Quantos renders desse custo rodam ao mesmo tempo neste pool (base das previsões de espera)"""
+        if not self.memory_budget_mb:
+            return self.max_slots
+        return max(1, min(self.max_slots, self.memory_budget_mb // max(1, cost_mb)))
+
+    @property
+    def used_mb(self):
+        return sum(self.running.values())
+
+    def fits(self, cost_mb):
+        """True se um job com esse custo cabe agora (só os renders deste processo contam).
+        O primeiro job sempre entra, mesmo acima do orçamento."""
+        with self._lock:
+            if not self.running:
+                return True
+            if len(self.running) >= self.max_slots:
+                return False
+            return not (self.memory_budget_mb and self.used_mb + cost_mb > self.memory_budget_mb)
+
+    def acquire(self, job_id, cost_mb):
+        """Registra o job no pool (chamar depois de fits() e de a reserva na fila vencer)"""
+        with self._lock:
+            self.running[job_id] = cost_mb
+
+    def release(self, job_id):
+        with self._lock:
+            self.running.pop(job_id, None)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "memory_budget_mb": self.memory_budget_mb,
+                "max_slots": self.max_slots,
+                "used_mb": self.used_mb,
+                "running": dict(self.running),
+            }
@@ -0,0 +1,260 @@
+"""
+Perfil de renderização ajustado aos recursos da instância.
+
+Todo render usava threads=1, preset ultrafast, 24 fps e 720p, o que cabe no
+free tier do Render, mesmo em instâncias maiores. Na inicialização,
+autotune() lê os limites do cgroup (cota de CPU e memória; sem cgroup, CPUs
+e memória do sistema) e escolhe o maior perfil que cabe neles. Em seguida
+roda um encode de calibração curto com esse perfil; se ele não alcança o
+tempo real (RENDER_CALIBRATION_MIN_SPEED), desce um perfil e calibra de novo.
+
+O perfil define threads e preset do x264, resolução, fps e a concorrência do
+pool de render (slots e orçamento de memória). RENDER_PROFILE fixa um perfil
+(free, standard, performance) e pula a sondagem. Os subprocessos de render
+herdam o perfil escolhido pela variável RENDER_PROFILE_RESOLVED.
+"""
+import os
+import time
+import shutil
+import threading
+import subprocess
+
+# Do menor para o maior. min_cpus/min_memory_mb: recursos exigidos; slot_mb: memória por render simultâneo
+PROFILES = {
+    "free": {"threads": 1, "preset": "ultrafast", "height": 720, "fps": 24, "min_cpus": 0, "min_memory_mb": 0, "slot_mb": 450},
+    "standard": {"threads": 2, "preset": "superfast", "height": 720, "fps": 24, "min_cpus": 2, "min_memory_mb": 1536, "slot_mb": 700},
+    "performance": {"threads": 4, "preset": "veryfast", "height": 1080, "fps": 30, "min_cpus": 4, "min_memory_mb": 4096, "slot_mb": 1400},
+}
+ORDER = ("free", "standard", "performance")
+
+PINNED = os.getenv("RENDER_PROFILE", "auto").strip().lower()
+RESOLVED_ENV = "RENDER_PROFILE_RESOLVED"
+# Segundos de vídeo codificados por segundo de parede exigidos na calibração
+MIN_SPEED = float(os.getenv("RENDER_CALIBRATION_MIN_SPEED", "1.0"))
+CALIBRATION_SECONDS = 3
+CALIBRATION_TIMEOUT = 60
+# Parte da memória do contêiner entregue ao pool de render (o resto fica para a API)
+MEMORY_SHARE = 0.7
+
+_profile = None
+_lock = threading.Lock()
+_autotune_thread = None
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+def cgroup_cpus():
+    """Cota de CPU do cgroup (v2 ou v1), ou None sem limite"""
+    try:
+        quota, period = _read("/sys/fs/cgroup/cpu.max").split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int(_read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"))
+        period = int(_read("/sys/fs/cgroup/cpu/cpu.cfs_period_us"))
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def cgroup_memory_mb():
+    """Limite de memória do cgroup (v2 ou v1), ou None sem limite"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            value = _read(path)
+        except OSError:
+            continue
+        if value == "max":
+            return None
+        try:
+            return int(value) / (1024 * 1024)
+        except ValueError:
+            return None
+    return None
+
+
+def system_limits():
+    """CPUs e memória (MB) disponíveis: o menor entre o cgroup e a máquina"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpus()
+    if quota:
+        cpus = min(cpus, quota)
+
+    try:
+        memory_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        memory_mb = None
+    limit = cgroup_memory_mb()
+    # cgroup v1 sem limite informa um valor gigante: vale o menor
+    if limit and (memory_mb is None or limit < memory_mb):
+        memory_mb = limit
+    return {
+        "cpus": round(cpus, 2),
+        "memory_mb": int(memory_mb) if memory_mb else None,
+    }
+
+
+def pick_profile(limits):
+    """Maior perfil cujos requisitos cabem nos limites"""
+    chosen = ORDER[0]
+    for name in ORDER:
+        spec = PROFILES[name]
+        memory_mb = limits.get("memory_mb")
+        if limits["cpus"] >= spec["min_cpus"] and (memory_mb is None or memory_mb >= spec["min_memory_mb"]):
+            chosen = name
+    return chosen
+
+
+def build(name, limits=None, source="limits", calibration=None):
+    """Perfil completo: parâmetros de encode + concorrência do pool"""
+    spec = PROFILES[name]
+    limits = limits or system_limits()
+    slots, memory_budget_mb = 1, None
+    if name != ORDER[0]:
+        # Free tier: sem orçamento de memória, um slot (comportamento de sempre)
+        memory_mb = limits.get("memory_mb")
+        by_cpu = int(limits["cpus"] // spec["threads"])
+        by_memory = int(memory_mb * MEMORY_SHARE // spec["slot_mb"]) if memory_mb else by_cpu
+        slots = max(1, min(by_cpu, by_memory))
+        memory_budget_mb = int(memory_mb * MEMORY_SHARE) if memory_mb else None
+    renderer = f"moviepy-libx264-{spec['preset']}-t{spec['threads']}"
+    if spec["fps"] != 24:
+        renderer += f"-{spec['fps']}fps"
+    return {
+        "name": name,
+        "source": source,
+        "threads": spec["threads"],
+        "preset": spec["preset"],
+        "height": spec["height"],
+        "fps": spec["fps"],
+        "slots": slots,
+        "memory_budget_mb": memory_budget_mb,
+        # Identifica a configuração de encode na telemetria (modelos de ETA são separados por renderizador)
+        "renderer": renderer,
+        "limits": limits,
+        "calibration": calibration,
+    }
+
+
+def ffmpeg_path():
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return shutil.which("ffmpeg")
+
+
+def calibrate(name, seconds=CALIBRATION_SECONDS):
+    """Encode curto (padrão de teste do ffmpeg) com os parâmetros do perfil.
+    Retorna {"seconds": parede, "speed": segundos de vídeo por segundo} ou None se não rodou."""
+    ffmpeg = ffmpeg_path()
+    if not ffmpeg:
+        return None
+    spec = PROFILES[name]
+    width, height = frame_size("16:9", spec["height"])
+    cmd = [
+        ffmpeg, "-hide_banner", "-loglevel", "error", "-f", "lavfi",
+        "-i", f"testsrc2=size={width}x{height}:rate={spec['fps']}", "-t", str(seconds),
+        "-c:v", "libx264", "-preset", spec["preset"], "-threads", str(spec["threads"]),
+        "-pix_fmt", "yuv420p", "-f", "null", "-",
+    ]
+    started = time.monotonic()
+    try:
+        subprocess.run(cmd, check=True, timeout=CALIBRATION_TIMEOUT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except subprocess.TimeoutExpired:
+        return {"seconds": CALIBRATION_TIMEOUT, "speed": round(seconds / CALIBRATION_TIMEOUT, 2)}
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Calibração de render ({name}) falhou: {e}")
+        return None
+    elapsed = time.monotonic() - started
+    return {"seconds": round(elapsed, 2), "speed": round(seconds / max(elapsed, 0.01), 2)}
+
+
+def _resolve(run_calibration):
+    if PINNED in PROFILES:
+        return build(PINNED, source="env")
+    inherited = os.getenv(RESOLVED_ENV)
+    if inherited in PROFILES:
+        return build(inherited, source="inherited")
+    if PINNED != "auto":
+        print(f"RENDER_PROFILE desconhecido: {PINNED!r}. Usando detecção automática.")
+
+    limits = system_limits()
+    name = pick_profile(limits)
+    if not run_calibration:
+        return build(name, limits)
+    calibration = None
+    # O menor perfil não tem para onde descer: não gasta CPU calibrando
+    while name != ORDER[0]:
+        calibration = calibrate(name)
+        if calibration is None or calibration["speed"] >= MIN_SPEED:
+            break
+        print(f"Calibração de render: perfil {name} codificou a {calibration['speed']}x do tempo real. Reduzindo perfil.")
+        name = ORDER[ORDER.index(name) - 1]
+    return build(name, limits, source="calibrated" if calibration else "limits", calibration=calibration)
+
+
+def current():
+    """Perfil em uso (sem calibração enquanto autotune() não terminou)"""
+    global _profile
+    with _lock:
+        if _profile is None:
+            _profile = _resolve(run_calibration=False)
+        return _profile
+
+
+def autotune():
+    """Sonda os limites, calibra e fixa o perfil deste processo (e dos subprocessos de render)"""
+    global _profile
+    profile = _resolve(run_calibration=True)
+    with _lock:
+        _profile = profile
+    os.environ[RESOLVED_ENV] = profile["name"]
+    print(f"Perfil de render: {profile['name']} ({profile['source']}) - {profile['threads']} thread(s), "
+          f"preset {profile['preset']}, {profile['height']}p{profile['fps']}, {profile['slots']} slot(s).")
+    return profile
+
+
+def start_autotune():
+    """Roda autotune() em segundo plano (uma vez por processo)"""
+    global _autotune_thread
+    with _lock:
+        if _autotune_thread is not None:
+            return
+        _autotune_thread = threading.Thread(target=_safe_autotune, name="render-autotune", daemon=True)
+    _autotune_thread.start()
+
+
+def _safe_autotune():
+    try:
+        autotune()
+    except Exception as e:
+        print(f"Erro ao ajustar perfil de render: {e}")
+
+
+def frame_size(aspect_ratio, height=None):
+    """Resolução do quadro para a proporção (16:9 ou 9:16) na altura do perfil"""
+    height = height or current()["height"]
+    long_side = height * 16 // 9
+    return (long_side, height) if aspect_ratio == "16:9" else (height, long_side)
+
+
+def write_params(profile=None):
+    """Argumentos de write_videofile do perfil (padrão: o perfil em uso)"""
+    profile = profile or current()
+    return {
+        "fps": profile["fps"],
+        "threads": profile["threads"],
+        "ffmpeg_params": ["-preset", profile["preset"]],
+    }
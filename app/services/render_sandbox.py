@@ -0,0 +1,181 @@
+"""
+Renderização isolada em processo filho.
+
+Cada vídeo agendado roda em um subprocesso (python -m app.services.render_sandbox)
+com limites do kernel: RLIMIT_AS (memória virtual) e RLIMIT_CPU (tempo de CPU).
+O processo pai age como watchdog: ao estourar o tempo de parede, mata o grupo
+do filho inteiro (inclusive o ffmpeg). Ao final, o pico de RSS e a causa da
+saída são gravados no ScheduledVideo. Um job problemático não derruba a API e a
+memória fragmentada pelo moviepy é devolvida ao sistema a cada vídeo.
+
+Onde o módulo resource não existe (Windows) ou com RENDER_ISOLATION=false, o
+render roda na thread do despachante, como antes.
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+from app.database import SessionLocal
+from app.models import ScheduledVideo
+from app.services import job_queue
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ISOLATION_ENABLED = resource is not None and os.getenv("RENDER_ISOLATION", "true").lower() not in ("0", "false", "no")
+# Limite de memória virtual do filho. Sem valor fixo: 3x o custo estimado do job, no mínimo 2 GB
+# (o espaço de endereçamento do Python + NumPy + threads é bem maior que o RSS).
+AS_LIMIT_MB = int(os.getenv("RENDER_AS_LIMIT_MB", "0"))
+MIN_AS_LIMIT_MB = 2048
+# Tempo de CPU somado de todas as threads do render
+CPU_LIMIT_SECONDS = int(os.getenv("RENDER_CPU_LIMIT_SECONDS", str(4 * 3600)))
+# Margem do watchdog além do teto de render do lease (o heartbeat marca a falha primeiro)
+WATCHDOG_GRACE_SECONDS = 30
+POLL_SECONDS = 0.5
+
+# Códigos de saída do filho
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_MEMORY = 3
+
+
+def _as_limit_mb(cost_mb):
+    return AS_LIMIT_MB or max(MIN_AS_LIMIT_MB, int(cost_mb or 0) * 3)
+
+
+def record_exit(video_id, owner, cause, peak_rss_mb=None, message=None):
+    """Grava causa de saída e pico de memória; marca falha se o filho morreu sem atualizar a linha"""
+    db = SessionLocal()
+    try:
+        video = db.query(ScheduledVideo).filter(ScheduledVideo.id == video_id).first()
+        if not video:
+            return
+        video.exit_cause = cause
+        if peak_rss_mb is not None:
+            video.peak_rss_mb = peak_rss_mb
+        if video.status == "processing" and video.lease_owner == owner:
+            video.status = "failed"
+            video.progress = 0
+            video.lease_owner = None
+            video.lease_expires_at = None
+            video.description = (video.description or "") + f"\n\n[SISTEMA]: {message or f'Render interrompido ({cause}).'}"
+        db.commit()
+    except Exception as e:
+        print(f"Erro ao registrar saída do render {video_id}: {e}")
+    finally:
+        db.close()
+
+
+def _exit_cause(returncode, timed_out):
+    if timed_out:
+        return "wall_timeout"
+    if returncode == EXIT_OK:
+        return "completed"
+    if returncode == EXIT_MEMORY:
+        return "memory_limit"
+    if returncode == EXIT_ERROR:
+        return "render_error"
+    if returncode < 0:
+        sig = -returncode
+        if sig == signal.SIGXCPU:
+            return "cpu_limit"
+        if sig == signal.SIGKILL:
+            # Sem watchdog envolvido: OOM killer do kernel/container ou limite rígido de CPU
+            return "killed"
+        return f"signal:{signal.Signals(sig).name}"
+    return f"exit:{returncode}"
+
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_render(video_id, owner=job_queue.WORKER_ID, cost_mb=None):
+    """Renderiza o vídeo (já reservado por owner) isolado em subprocesso. Retorna a causa de saída."""
+    if not ISOLATION_ENABLED:
+        from app.services.video_processing import process_scheduled_video
+        try:
+            completed = process_scheduled_video(video_id, lease_owner=owner)
+            cause = "completed" if completed else "render_error"
+        except MemoryError:
+            cause = "memory_limit"
+        record_exit(video_id, owner, cause)
+        return cause
+
+    as_limit_mb = _as_limit_mb(cost_mb)
+    cmd = [
+        sys.executable, "-m", "app.services.render_sandbox", str(video_id), owner,
+        "--as-mb", str(as_limit_mb), "--cpu-seconds", str(CPU_LIMIT_SECONDS),
+    ]
+    # Menos arenas do malloc: menos memória virtual reservada por thread (cabe melhor no RLIMIT_AS)
+    env = dict(os.environ, MALLOC_ARENA_MAX=os.getenv("MALLOC_ARENA_MAX", "2"))
+    # Grupo de processos próprio: o watchdog mata o render e o ffmpeg juntos
+    proc = subprocess.Popen(cmd, env=env, start_new_session=True)
+    deadline = time.monotonic() + job_queue.MAX_RENDER_SECONDS + WATCHDOG_GRACE_SECONDS
+    timed_out = False
+    rusage = None
+    status = None
+
+    while True:
+        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            break
+        if time.monotonic() > deadline:
+            timed_out = True
+            print(f"Watchdog: render do vídeo {video_id} excedeu o tempo limite. Encerrando processo {proc.pid}.")
+            _kill_group(proc)
+            _, status, rusage = os.wait4(proc.pid, 0)
+            break
+        time.sleep(POLL_SECONDS)
+
+    # Filhos do render (ffmpeg) que ainda estejam vivos no grupo
+    _kill_group(proc)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss em KB no Linux
+    peak_rss_mb = int(rusage.ru_maxrss / 1024) if rusage else None
+    cause = _exit_cause(proc.returncode, timed_out)
+    messages = {
+        "wall_timeout": f"Processo expirou (timeout de {job_queue.MAX_RENDER_SECONDS // 60}min) e foi encerrado.",
+        "memory_limit": f"Render excedeu o limite de memória ({as_limit_mb} MB).",
+        "cpu_limit": f"Render excedeu o limite de CPU ({CPU_LIMIT_SECONDS}s).",
+    }
+    record_exit(video_id, owner, cause, peak_rss_mb, messages.get(cause))
+    print(f"Render do vídeo {video_id} terminou: {cause} (pico de memória {peak_rss_mb} MB).")
+    return cause
+
+
+def _apply_limits(as_mb, cpu_seconds):
+    if as_mb:
+        limit = as_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if cpu_seconds:
+        # Soft: SIGXCPU (encerramento limpo); hard: SIGKILL 30s depois
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 30))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render isolado de um vídeo agendado")
+    parser.add_argument("video_id", type=int)
+    parser.add_argument("owner")
+    parser.add_argument("--as-mb", type=int, default=0)
+    parser.add_argument("--cpu-seconds", type=int, default=0)
+    args = parser.parse_args()
+
+    _apply_limits(args.as_mb, args.cpu_seconds)
+    from app.services.video_processing import process_scheduled_video
+    try:
+        completed = process_scheduled_video(args.video_id, lease_owner=args.owner)
+    except MemoryError:
+        sys.exit(EXIT_MEMORY)
+    sys.exit(EXIT_OK if completed else EXIT_ERROR)
+
+
+if __name__ == "__main__":
+    main()
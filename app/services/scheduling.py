@@ -0,0 +1,126 @@
+"""
+Ordem da fila de renderização por prazo (earliest deadline first).
+
+O prazo de cada vídeo é o horário de publicação (scheduled_for). A fila
+ordena pelo último instante em que o render ainda pode começar:
+
+    início_limite = scheduled_for - duração_prevista - SCHEDULE_SAFETY_MARGIN_MINUTES
+
+A duração prevista vem do eta_model (regressão sobre a telemetria dos renders).
+
+Vídeos sem horário vão para o fim, por id. Com RENDER_AHEAD_HOURS definido,
+vídeos cujo início-limite está além dessa janela esperam, exceto nas horas
+ociosas (RENDER_IDLE_HOURS, ex: "1-6"), quando tudo pode ser adiantado. Sem a
+variável, todo vídeo enfileirado é renderizado assim que houver capacidade,
+como antes, só que na ordem dos prazos.
+"""
+import os
+import datetime
+from app.services.eta_model import eta_model
+
+SAFETY_MARGIN = datetime.timedelta(minutes=int(os.getenv("SCHEDULE_SAFETY_MARGIN_MINUTES", "15")))
+RENDER_AHEAD_HOURS = float(os.getenv("RENDER_AHEAD_HOURS", "0"))
+IDLE_HOURS = os.getenv("RENDER_IDLE_HOURS", "")
+
+
+def predict_render_seconds(video):
+    """Duração prevista do render de um ScheduledVideo (segundos, ver eta_model)"""
+    return eta_model.predict_video(video)
+
+
+def latest_start(video, predicted_seconds=None):
+    """Último horário para começar o render e ainda publicar no horário (None se não há prazo)"""
+    if not video.scheduled_for:
+        return None
+    if predicted_seconds is None:
+        predicted_seconds = predict_render_seconds(video)
+    return video.scheduled_for - datetime.timedelta(seconds=predicted_seconds) - SAFETY_MARGIN
+
+
+def _in_idle_hours(now):
+    try:
+        start, end = (int(h) for h in IDLE_HOURS.split("-"))
+    except ValueError:
+        return False
+    if start <= end:
+        return start <= now.hour < end
+    # Janela que atravessa a meia-noite (ex: 22-6)
+    return now.hour >= start or now.hour < end
+
+
+def edf_order(videos, now=None):
+    """Ordena vídeos enfileirados por início-limite (EDF) e retira os que devem esperar"""
+    now = now or datetime.datetime.now()
+    hold_after = None
+    if RENDER_AHEAD_HOURS and not _in_idle_hours(now):
+        hold_after = now + datetime.timedelta(hours=RENDER_AHEAD_HOURS)
+
+    ranked = []
+    for video in videos:
+        start_by = latest_start(video)
+        if hold_after and start_by and start_by > hold_after:
+            continue
+        ranked.append((start_by is None, start_by or datetime.datetime.max, video.id, video))
+    ranked.sort(key=lambda entry: entry[:3])
+    return [entry[3] for entry in ranked]
+
+
+def prepared_first(videos, now=None):
+    """Ordem do encode: vídeos já preparados (só falta o encode) antes dos enfileirados, EDF em cada grupo.
+    A preparação também segue EDF, então os preparados já eram os mais urgentes quando começaram."""
+    prepared = [video for video in videos if video.status == "prepared"]
+    prepared.sort(key=lambda video: (latest_start(video) or datetime.datetime.max, video.id))
+    return prepared + edf_order([video for video in videos if video.status != "prepared"], now)
+
+
+def _minutes(delta):
+    return round(delta.total_seconds() / 60, 1)
+
+
+def schedule_metrics(db, days=30, now=None):
+    """Folga dos vídeos pendentes e atraso dos publicados nos últimos `days` dias"""
+    from app.models import ScheduledVideo
+
+    now = now or datetime.datetime.now()
+    pending = db.query(ScheduledVideo).filter(
+        ScheduledVideo.status.in_(["queued", "preparing", "prepared", "processing", "completed", "uploading"]),
+        ScheduledVideo.scheduled_for != None,
+        ScheduledVideo.uploaded_at == None
+    ).all()
+    slack = []
+    for video in pending:
+        predicted = predict_render_seconds(video) if video.status not in ("completed", "uploading") else 0
+        start_by = latest_start(video, predicted)
+        slack.append({
+            "id": video.id,
+            "title": video.title,
+            "status": video.status,
+            "scheduled_for": video.scheduled_for.isoformat(),
+            "predicted_render_minutes": round(predicted / 60, 1),
+            "slack_minutes": _minutes(start_by - now) if video.status in ("queued", "preparing", "prepared") else _minutes(video.scheduled_for - now),
+        })
+    slack.sort(key=lambda item: item["slack_minutes"])
+
+    published = db.query(ScheduledVideo.scheduled_for, ScheduledVideo.uploaded_at).filter(
+        ScheduledVideo.uploaded_at != None,
+        ScheduledVideo.scheduled_for != None,
+        ScheduledVideo.uploaded_at >= now - datetime.timedelta(days=days)
+    ).all()
+    lateness = [max(0.0, _minutes(uploaded - scheduled)) for scheduled, uploaded in published]
+    # Mesmo limite do alerta de EMERGÊNCIA em check_scheduled_uploads (10 min)
+    late = [m for m in lateness if m > 10]
+    return {
+        "pending": slack,
+        "at_risk": [item for item in slack if item["slack_minutes"] < 0],
+        "published": {
+            "days": days,
+            "count": len(lateness),
+            "late_count": len(late),
+            "on_time_ratio": round(1 - len(late) / len(lateness), 3) if lateness else None,
+            "avg_lateness_minutes": round(sum(lateness) / len(lateness), 1) if lateness else None,
+            "max_lateness_minutes": max(lateness) if lateness else None,
+        },
+        "render_ahead_hours": RENDER_AHEAD_HOURS or None,
+        "safety_margin_minutes": _minutes(SAFETY_MARGIN),
+        "eta_model": eta_model.snapshot(),
+    }
@@ -0,0 +1,259 @@
+"""
+Armazenamento durável dos arquivos gerados (vídeos, pôsteres, capas e PDFs).
+
+O disco do Render é efêmero. Quando um reinício apagava um MP4 pronto, o
+vídeo era renderizado de novo, e a capa dos livros precisava de uma cópia em
+base64 no banco. Os arquivos continuam sendo gerados e servidos a partir de
+app/static, que passa a funcionar como cache local. persist() grava uma cópia
+no backend configurado e restore() traz o arquivo de volta quando a cópia
+local some (reinício, teto de disco do workspace.reap). A chave de um arquivo
+é o caminho relativo a app/static (ex: videos/abc.mp4).
+
+STORAGE_BACKEND:
+- local (padrão): diretório STORAGE_LOCAL_DIR. O padrão é o próprio
+  app/static, sem cópia extra, como antes. Aponte para um disco persistente
+  para sobreviver a reinícios.
+- s3: bucket S3 ou compatível (MinIO, R2), configurado por S3_BUCKET,
+  S3_ENDPOINT_URL, S3_REGION e S3_PREFIX. As credenciais vêm das variáveis
+  padrão do boto3 (AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY). Requer boto3.
+
+Upload e download são em streaming: cópia em blocos ou multipart do boto3,
+sem carregar o arquivo inteiro em memória. O download vai para um arquivo
+.part e só é renomeado no fim, para não deixar cópias pela metade.
+"""
+import os
+import shutil
+import mimetypes
+import threading
+import anyio
+from starlette.exceptions import HTTPException
+from starlette.staticfiles import StaticFiles
+
+STATIC_ROOT = os.path.join("app", "static")
+BACKEND = os.getenv("STORAGE_BACKEND", "local").strip().lower()
+# Partes do multipart do S3: também o teto de memória por transferência
+CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def key_for(path_or_url):
+    """Chave de um caminho local em app/static ou de uma URL /static/... (None se estiver fora)"""
+    if not path_or_url:
+        return None
+    if path_or_url.startswith("/static/"):
+        key = path_or_url[len("/static/"):]
+    else:
+        key = os.path.relpath(os.path.abspath(path_or_url), os.path.abspath(STATIC_ROOT)).replace(os.sep, "/")
+    parts = key.split("/")
+    if not key or key.startswith("/") or ".." in parts or "" in parts:
+        return None
+    return key
+
+
+def local_path(key):
+    return os.path.join(STATIC_ROOT, *key.split("/"))
+
+
+def _replace_atomic(write, destination):
+    """Escreve em destination.part e renomeia ao final"""
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    partial = f"{destination}.part"
+    try:
+        write(partial)
+        os.replace(partial, destination)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root):
+        self.root = root
+        # Com a raiz em app/static o arquivo servido já é a cópia "durável" (comportamento de antes)
+        self.separate = os.path.abspath(root) != os.path.abspath(STATIC_ROOT)
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, source, key):
+        if self.separate:
+            _replace_atomic(lambda partial: shutil.copyfile(source, partial), self._path(key))
+
+    def get(self, key, destination):
+        _replace_atomic(lambda partial: shutil.copyfile(self._path(key), partial), destination)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def delete(self, key):
+        if self.separate and os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def describe(self):
+        return {"backend": self.name, "root": os.path.abspath(self.root), "durable_copy": self.separate}
+
+
+class S3Storage:
+    name = "s3"
+    separate = True
+
+    def __init__(self, bucket, endpoint_url=None, region=None, prefix=""):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requer o pacote boto3 (pip install boto3).")
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None, region_name=region or None)
+        self.transfer = TransferConfig(multipart_threshold=CHUNK_BYTES, multipart_chunksize=CHUNK_BYTES, max_concurrency=2)
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, source, key):
+        extra = {}
+        content_type = mimetypes.guess_type(source)[0]
+        if content_type:
+            extra["ContentType"] = content_type
+        self.client.upload_file(source, self.bucket, self._key(key), ExtraArgs=extra, Config=self.transfer)
+
+    def get(self, key, destination):
+        _replace_atomic(
+            lambda partial: self.client.download_file(self.bucket, self._key(key), partial, Config=self.transfer),
+            destination
+        )
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def describe(self):
+        return {"backend": self.name, "bucket": self.bucket, "endpoint_url": self.endpoint_url,
+                "prefix": self.prefix or None, "durable_copy": True}
+
+
+_backend = None
+_lock = threading.Lock()
+
+
+def backend():
+    """Backend configurado (criado na primeira chamada)"""
+    global _backend
+    with _lock:
+        if _backend is None:
+            if BACKEND == "s3":
+                _backend = S3Storage(
+                    os.getenv("S3_BUCKET", ""),
+                    endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+                    region=os.getenv("S3_REGION"),
+                    prefix=os.getenv("S3_PREFIX", ""),
+                )
+            else:
+                if BACKEND != "local":
+                    print(f"STORAGE_BACKEND desconhecido: {BACKEND!r}. Usando armazenamento local.")
+                _backend = LocalStorage(os.getenv("STORAGE_LOCAL_DIR", STATIC_ROOT))
+        return _backend
+
+
+def durable():
+    """True se o backend guarda uma cópia independente de app/static"""
+    try:
+        return backend().separate
+    except Exception:
+        return False
+
+
+def persist(path):
+    """Grava a cópia durável de um arquivo de app/static. Retorna a chave, ou None se não foi gravado."""
+    key = key_for(path)
+    if not key or not os.path.exists(local_path(key)):
+        return None
+    try:
+        backend().put(local_path(key), key)
+        return key
+    except Exception as e:
+        print(f"Erro ao gravar {key} no armazenamento ({BACKEND}): {e}")
+        return None
+
+
+def restore(key):
+    """Garante a cópia local do arquivo, baixando do backend se preciso. Retorna o caminho local ou None."""
+    if not key:
+        return None
+    destination = local_path(key)
+    if os.path.exists(destination):
+        return destination
+    if not durable():
+        return None
+    try:
+        if not backend().exists(key):
+            return None
+        backend().get(key, destination)
+        print(f"Arquivo {key} restaurado do armazenamento ({BACKEND}).")
+        return destination
+    except Exception as e:
+        print(f"Erro ao restaurar {key} do armazenamento ({BACKEND}): {e}")
+        return None
+
+
+def ensure_local(path_or_url):
+    """restore() a partir de um caminho local ou URL /static/... (True se o arquivo existe no disco)"""
+    key = key_for(path_or_url)
+    if key:
+        return restore(key) is not None
+    return bool(path_or_url) and os.path.exists(path_or_url)
+
+
+def stored(key):
+    """True se há cópia durável do arquivo (sem baixá-lo)"""
+    if not key or not durable():
+        return False
+    try:
+        return backend().exists(key)
+    except Exception as e:
+        print(f"Erro ao consultar {key} no armazenamento ({BACKEND}): {e}")
+        return False
+
+
+def remove(key):
+    """Apaga a cópia durável (a local é responsabilidade de quem chama)"""
+    if not key or not durable():
+        return
+    try:
+        backend().delete(key)
+    except Exception as e:
+        print(f"Erro ao apagar {key} do armazenamento ({BACKEND}): {e}")
+
+
+def describe():
+    try:
+        return backend().describe()
+    except Exception as e:
+        return {"backend": BACKEND, "error": str(e)}
+
+
+class StorageStaticFiles(StaticFiles):
+    """/static que, ao não achar o arquivo no disco, o restaura do armazenamento durável e serve"""
+
+    async def get_response(self, path, scope):
+        try:
+            return await super().get_response(path, scope)
+        except HTTPException as e:
+            if e.status_code != 404 or not durable():
+                raise
+            key = key_for(f"/static/{path}")
+            if not key or not await anyio.to_thread.run_sync(restore, key):
+                raise
+            return await super().get_response(path, scope)
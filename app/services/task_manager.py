@@ -1,30 +1,305 @@
+import os
+import json
 import uuid
+import time
+import datetime
+import threading
 from typing import Dict, Any
+from app.database import SessionLocal
+from app.models import VideoTask, VideoTaskBatch
+from app.services.event_bus import event_bus, task_event
+from app.services.eta_model import remaining_seconds
+from app.services.render_pool import estimate_job_cost
 
-# Armazenamento em memória para simplificar (em produção idealmente seria Redis ou DB)
-# Estrutura: {task_id: {status: str, progress: int, message: str, result: Any}}
-video_tasks: Dict[str, Dict[str, Any]] = {}
+# Tarefas e lotes ficam no banco: sobrevivem a reinícios e qualquer worker do
+# gunicorn responde /youtube/task/{task_id}. Atualizações só de progresso são
+# agrupadas em memória e gravadas no máximo a cada FLUSH_SECONDS por tarefa;
+# mudanças de status/resultado são gravadas na hora.
+FLUSH_SECONDS = float(os.getenv("TASK_FLUSH_SECONDS", "2"))
+# Tarefas sem atualização há mais que isso são removidas (cleanup_expired)
+TASK_TTL_HOURS = int(os.getenv("TASK_TTL_HOURS", "24"))
+# Controle de admissão: recusa novas tarefas quando a espera prevista passa disso (0 = desligado)
+ADMISSION_MAX_WAIT_MINUTES = float(os.getenv("ADMISSION_MAX_WAIT_MINUTES", "0"))
 
-def create_task():
-    task_id = str(uuid.uuid4())
-    video_tasks[task_id] = {
-        "status": "pending",
-        "progress": 0,
-        "message": "Aguardando início...",
-        "result": None
+# Progresso ainda não gravado: {task_id: {"progress": int, "message": str}}
+_pending: Dict[str, Dict[str, Any]] = {}
+_last_flush: Dict[str, float] = {}
+_lock = threading.Lock()
+# Serializa gravações: um flush atrasado nunca sobrescreve um status final
+_write_lock = threading.Lock()
+_flusher = None
+
+
+def _task_dict(task):
+    return {
+        "status": task.status,
+        "progress": task.progress,
+        "message": task.message,
+        "result": json.loads(task.result) if task.result else None,
+        "predicted_seconds": round(task.predicted_seconds) if task.predicted_seconds else None,
+        "started_at": task.started_at
     }
+
+
+def _with_eta(data):
+    """Acrescenta eta_seconds (tempo restante previsto) a uma tarefa em aberto"""
+    data["eta_seconds"] = None
+    if data["status"] in ("pending", "processing"):
+        data["eta_seconds"] = remaining_seconds(data["predicted_seconds"], data["started_at"], data["progress"])
+    return data
+
+
+def _write(task_id, fields):
+    db = SessionLocal()
+    try:
+        fields = dict(fields, updated_at=datetime.datetime.now())
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False, default=str)
+        db.query(VideoTask).filter(VideoTask.id == task_id).update(fields, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _flush_loop():
+    """Grava o progresso pendente que não recebeu nova atualização (última posição de cada tarefa)"""
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        flush()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_flush_loop, name="task-progress-flusher", daemon=True)
+        _flusher.start()
+
+
+def flush(task_id=None):
+    """Grava imediatamente o progresso pendente (de uma tarefa ou de todas)"""
+    with _write_lock:
+        with _lock:
+            ids = [task_id] if task_id else list(_pending)
+            batch = {tid: _pending.pop(tid) for tid in ids if tid in _pending}
+            now = time.monotonic()
+            for tid in batch:
+                _last_flush[tid] = now
+        for tid, fields in batch.items():
+            try:
+                _write(tid, fields)
+            except Exception as e:
+                print(f"Erro ao gravar progresso da tarefa {tid}: {e}")
+
+
+def create_task(batch_id=None, title=None, position=0, predicted_seconds=None):
+    task_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        db.add(VideoTask(
+            id=task_id,
+            batch_id=batch_id,
+            position=position,
+            title=title,
+            status="pending",
+            progress=0,
+            message="Aguardando início...",
+            predicted_seconds=predicted_seconds
+        ))
+        db.commit()
+    finally:
+        db.close()
     return task_id
 
-def update_task(task_id, status=None, progress=None, message=None, result=None):
-    if task_id in video_tasks:
-        if status:
-            video_tasks[task_id]["status"] = status
-        if progress is not None:
-            video_tasks[task_id]["progress"] = progress
-        if message:
-            video_tasks[task_id]["message"] = message
-        if result:
-            video_tasks[task_id]["result"] = result
+def update_task(task_id, status=None, progress=None, message=None, result=None, predicted_seconds=None):
+    fields = {}
+    if status:
+        fields["status"] = status
+        if status == "processing":
+            fields["started_at"] = datetime.datetime.now()
+    if progress is not None:
+        fields["progress"] = progress
+    if message:
+        fields["message"] = message
+    if result:
+        fields["result"] = result
+    if predicted_seconds is not None:
+        fields["predicted_seconds"] = predicted_seconds
+    if not fields:
+        return
+    # Assinantes SSE deste processo recebem na hora (o banco recebe de forma agrupada)
+    event_bus.publish(f"task:{task_id}", task_event(task_id, status, progress, message, result))
+
+    if status or result or predicted_seconds is not None:
+        # Mudança de estado: grava junto com o progresso pendente, sem atraso
+        with _write_lock:
+            with _lock:
+                fields = {**_pending.pop(task_id, {}), **fields}
+                _last_flush[task_id] = time.monotonic()
+                if status in ("completed", "failed"):
+                    _last_flush.pop(task_id, None)
+            _write(task_id, fields)
+        return
+
+    with _lock:
+        _pending.setdefault(task_id, {}).update(fields)
+        due = time.monotonic() - _last_flush.get(task_id, 0) >= FLUSH_SECONDS
+    if due:
+        flush(task_id)
+    else:
+        _ensure_flusher()
+
+def queue_task(task_id, payload):
+    """Entrega a tarefa à fila de renderização (job_queue.claim_next_task) com os parâmetros do render"""
+    _write(task_id, {"payload": json.dumps(payload, ensure_ascii=False, default=str), "message": "Na fila de renderização..."})
+
+
+def get_task_payload(task_id):
+    """(batch_id, payload) de uma tarefa da fila, ou (None, None)"""
+    db = SessionLocal()
+    try:
+        task = db.query(VideoTask.batch_id, VideoTask.payload).filter(VideoTask.id == task_id).first()
+        if not task or not task.payload:
+            return None, None
+        return task.batch_id, json.loads(task.payload)
+    finally:
+        db.close()
 
 def get_task(task_id):
-    return video_tasks.get(task_id)
+    db = SessionLocal()
+    try:
+        task = db.query(VideoTask).filter(VideoTask.id == task_id).first()
+        if not task:
+            return None
+        data = _task_dict(task)
+    finally:
+        db.close()
+    # Neste processo, o progresso mais recente pode ainda não ter sido gravado
+    with _lock:
+        data.update(_pending.get(task_id, {}))
+    return _with_eta(data)
+
+
+def create_batch(titles, predicted_seconds=None):
+    batch_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        db.add(VideoTaskBatch(id=batch_id, status="pending", message="Aguardando início..."))
+        db.commit()
+    finally:
+        db.close()
+    for position, title in enumerate(titles):
+        create_task(batch_id=batch_id, title=title, position=position,
+                    predicted_seconds=predicted_seconds[position] if predicted_seconds else None)
+    return batch_id
+
+def update_batch(batch_id, status=None, message=None):
+    fields = {}
+    if status:
+        fields["status"] = status
+    if message:
+        fields["message"] = message
+    if not fields:
+        return
+    db = SessionLocal()
+    try:
+        fields["updated_at"] = datetime.datetime.now()
+        db.query(VideoTaskBatch).filter(VideoTaskBatch.id == batch_id).update(fields, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def get_batch(batch_id):
+    """Retorna o lote com o status atual de cada item"""
+    db = SessionLocal()
+    try:
+        batch = db.query(VideoTaskBatch).filter(VideoTaskBatch.id == batch_id).first()
+        if not batch:
+            return None
+        tasks = db.query(VideoTask).filter(VideoTask.batch_id == batch_id).order_by(VideoTask.position.asc()).all()
+        items = [{"task_id": task.id, "title": task.title, **_task_dict(task)} for task in tasks]
+        status, message = batch.status, batch.message
+    finally:
+        db.close()
+    with _lock:
+        for item in items:
+            item.update(_pending.get(item["task_id"], {}))
+    items = [_with_eta(item) for item in items]
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "message": message,
+        "total": len(items),
+        "completed": sum(1 for i in items if i.get("status") == "completed"),
+        "failed": sum(1 for i in items if i.get("status") == "failed"),
+        "eta_seconds": _batch_eta(items),
+        "items": items
+    }
+
+
+def _render_concurrency():
+    """Renders simultâneos do pool de render da fila (onde rodam os itens de lote), para um vídeo padrão"""
+    # Import tardio: monitor_service importa este módulo
+    from app.services.monitor_service import monitor_service
+    return monitor_service.render_pool.concurrency(estimate_job_cost("video", {}))
+
+
+def _batch_eta(items):
+    """Tempo restante previsto do lote: itens em aberto divididos pelos renders simultâneos"""
+    open_items = [i["eta_seconds"] for i in items if i["eta_seconds"] is not None]
+    if not open_items:
+        return None
+    return round(sum(open_items) / min(_render_concurrency(), len(open_items)))
+
+
+def open_task_backlog_seconds():
+    """Trabalho previsto das tarefas sob demanda em aberto (base do controle de admissão)"""
+    db = SessionLocal()
+    try:
+        rows = db.query(VideoTask.status, VideoTask.progress, VideoTask.predicted_seconds, VideoTask.started_at).filter(
+            VideoTask.status.in_(["pending", "processing"])
+        ).all()
+    finally:
+        db.close()
+    return sum(remaining_seconds(r.predicted_seconds, r.started_at, r.progress) or 0 for r in rows)
+
+
+def admission_retry_after():
+    """Segundos até a espera prevista voltar ao limite, ou None se uma nova tarefa pode ser admitida"""
+    if not ADMISSION_MAX_WAIT_MINUTES:
+        return None
+    wait = open_task_backlog_seconds() / _render_concurrency()
+    excess = wait - ADMISSION_MAX_WAIT_MINUTES * 60
+    if excess <= 0:
+        return None
+    return max(30, round(excess))
+
+
+def cleanup_expired(ttl_hours=TASK_TTL_HOURS):
+    """Remove tarefas e lotes sem atualização há mais de ttl_hours (job periódico)"""
+    cutoff = datetime.datetime.now() - datetime.timedelta(hours=ttl_hours)
+    db = SessionLocal()
+    try:
+        # Lote com itens na fila ou renderizando não expira, mesmo sem atualização do próprio lote
+        open_batches = db.query(VideoTask.batch_id).filter(
+            VideoTask.batch_id != None,
+            VideoTask.status.in_(["pending", "processing"])
+        )
+        expired_batches = [b.id for b in db.query(VideoTaskBatch.id).filter(
+            VideoTaskBatch.updated_at < cutoff,
+            ~VideoTaskBatch.id.in_(open_batches)
+        ).all()]
+        removed = db.query(VideoTask).filter(
+            VideoTask.batch_id == None,
+            VideoTask.updated_at < cutoff
+        ).delete(synchronize_session=False)
+        if expired_batches:
+            # Itens de lote vivem enquanto o lote viver
+            removed += db.query(VideoTask).filter(VideoTask.batch_id.in_(expired_batches)).delete(synchronize_session=False)
+            db.query(VideoTaskBatch).filter(VideoTaskBatch.id.in_(expired_batches)).delete(synchronize_session=False)
+        db.commit()
+        if removed or expired_batches:
+            print(f"Tarefas expiradas removidas: {removed} tarefas, {len(expired_batches)} lotes.")
+    except Exception as e:
+        print(f"Erro ao limpar tarefas expiradas: {e}")
+    finally:
+        db.close()
@@ -0,0 +1,144 @@
+"""
+Renderizador de legendas sobre os quadros do vídeo.
+
+- Fontes carregadas uma única vez por processo (cache por tamanho).
+- Contorno nativo do Pillow (stroke_width) em vez de desenhar cada linha 5 vezes.
+- Fundo decodificado direto no tamanho alvo (draft/reducing_gap) e escurecido com NumPy.
+- Legenda renderizada em camada RGBA separada: o mesmo fundo recebe várias
+  legendas sem ser decodificado de novo.
+"""
+import os
+import textwrap
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_CANDIDATES = [
+    "arial.ttf",
+    "DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+]
+
+# Layout padrão (legenda no terço inferior)
+FONT_SIZE = 40
+LINE_HEIGHT = 50
+WRAP_WIDTH = 40
+MARGIN_BOTTOM = 150
+BACKGROUND_BRIGHTNESS = 0.4 # 40% do brilho original para legibilidade
+
+
+@lru_cache(maxsize=16)
+def get_font(size=FONT_SIZE):
+    """Carrega (uma vez por processo) a primeira fonte TrueType disponível"""
+    for candidate in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow < 10.1 não aceita tamanho na fonte padrão
+        return ImageFont.load_default()
+
+
+def solid_background(size, color):
+    """Fundo de cor sólida como array RGB (altura, largura, 3)"""
+    return np.full((size[1], size[0], 3), color, dtype=np.uint8)
+
+
+def gradient_background(size, seed=0):
+    """Fundo procedural (gradiente vertical) determinístico, usado quando não há imagem da cena"""
+    palettes = [
+        ((12, 18, 48), (70, 20, 90)),
+        ((8, 40, 60), (10, 110, 120)),
+        ((60, 12, 24), (150, 60, 30)),
+        ((16, 40, 16), (90, 120, 40)),
+    ]
+    top, bottom = (np.array(c, dtype=np.float32) for c in palettes[seed % len(palettes)])
+    ramp = np.linspace(0.0, 1.0, size[1], dtype=np.float32)[:, None]
+    column = (top + (bottom - top) * ramp).astype(np.uint8)
+    return np.broadcast_to(column[:, None, :], (size[1], size[0], 3)).copy()
+
+
+def fit_cover(img, size):
+    """Recorte central na proporção do alvo, redimensionado numa única passada"""
+    if img.size == tuple(size):
+        return img
+    img_ratio = img.width / img.height
+    target_ratio = size[0] / size[1]
+    if img_ratio > target_ratio:
+        crop_w = img.height * target_ratio
+        left = (img.width - crop_w) / 2
+        box = (left, 0, left + crop_w, img.height)
+    else:
+        crop_h = img.width / target_ratio
+        top = (img.height - crop_h) / 2
+        box = (0, top, img.width, top + crop_h)
+    return img.resize(size, Image.BILINEAR, box=box, reducing_gap=2.0)
+
+
+def load_background(path, size, brightness=BACKGROUND_BRIGHTNESS):
+    """Abre a imagem já reduzida para o tamanho alvo (cover + crop central) e escurecida.
+    Retorna array RGB uint8 ou None se não for possível ler o arquivo."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with Image.open(path) as img:
+            # JPEG: decodifica direto em escala reduzida (1/2, 1/4, 1/8) >= tamanho alvo
+            img.draft("RGB", size)
+            img = fit_cover(img.convert("RGB"), size)
+            frame = np.asarray(img, dtype=np.uint16)
+    except Exception as e:
+        print(f"Erro ao carregar imagem de fundo: {e}")
+        return None
+
+    # Escurecimento vetorizado (ponto fixo, sem float intermediário)
+    factor = int(round(brightness * 256))
+    return ((frame * factor) >> 8).astype(np.uint8)
+
+
+def render_caption_layer(text, size, text_color=(255, 255, 255), font_size=FONT_SIZE):
+    """Desenha a legenda numa camada RGBA transparente do tamanho do quadro"""
+    layer = Image.new("RGBA", size, (0, 0, 0, 0))
+    d = ImageDraw.Draw(layer)
+    font = get_font(font_size)
+
+    lines = textwrap.wrap(text, width=WRAP_WIDTH)
+    text_block_height = len(lines) * LINE_HEIGHT
+    # Base do texto fixa a MARGIN_BOTTOM px do fundo (estilo legenda)
+    y_text = size[1] - text_block_height - MARGIN_BOTTOM
+
+    for line in lines:
+        bbox = d.textbbox((0, 0), line, font=font, stroke_width=1)
+        text_width = bbox[2] - bbox[0]
+        x = (size[0] - text_width) / 2
+        # Contorno preto fino para legibilidade extra
+        d.text((x, y_text), line, font=font, fill=tuple(text_color) + (255,), stroke_width=1, stroke_fill=(0, 0, 0, 255))
+        y_text += LINE_HEIGHT
+
+    return layer
+
+
+def compose(background, layer):
+    """Aplica a camada RGBA sobre o fundo (array RGB). Não altera o fundo original."""
+    frame = background.copy()
+    bbox = layer.getbbox()
+    if not bbox:
+        return frame
+    left, top, right, bottom = bbox
+    region = np.asarray(layer.crop(bbox), dtype=np.uint16)
+    alpha = region[..., 3:4]
+    base = frame[top:bottom, left:right].astype(np.uint16)
+    frame[top:bottom, left:right] = ((region[..., :3] * alpha + base * (255 - alpha) + 127) // 255).astype(np.uint8)
+    return frame
+
+
+def render_frame(text, size, bg_color=(20, 20, 20), text_color=(255, 255, 255), bg_image_path=None, background=None):
+    """Quadro completo: fundo (array pronto, imagem ou cor sólida) + legenda"""
+    if background is None and bg_image_path:
+        background = load_background(bg_image_path, size)
+    if background is None:
+        background = solid_background(size, bg_color)
+    return compose(background, render_caption_layer(text, size, text_color))
@@ -0,0 +1,57 @@
+"""
+Pool de uploads para o YouTube.
+
+Os uploads rodavam um após o outro dentro de um único tick do agendador.
+Depois de uma parada, o backlog esvaziava um vídeo por vez. O despachante
+executa até UPLOAD_WORKERS uploads simultâneos. Todos os vídeos vão para a
+única conta conectada em Configurações (youtube_client), então o limite do
+pool é também o limite por canal. A ordem (mais atrasado primeiro) e a cota
+diária (youtube_quota) são decididas por quem chama try_submit, que recebe
+os vídeos já ordenados.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "3"))
+
+
+class UploadDispatcher:
+    def __init__(self, max_workers=None):
+        self.max_workers = max(1, max_workers or UPLOAD_WORKERS)
+        self.running = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def full(self):
+        with self._lock:
+            return len(self.running) >= self.max_workers
+
+    def try_submit(self, video_id, fn, on_done=None):
+        """Inicia fn() em um worker se há vaga no pool. on_done() roda ao terminar (sucesso ou erro)."""
+        with self._lock:
+            if video_id in self.running or len(self.running) >= self.max_workers:
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="youtube-upload")
+            self.running.add(video_id)
+        self._executor.submit(self._run, video_id, fn, on_done)
+        return True
+
+    def _run(self, video_id, fn, on_done):
+        try:
+            fn()
+        except Exception as e:
+            print(f"Erro no upload do vídeo {video_id}: {e}")
+        finally:
+            with self._lock:
+                self.running.discard(video_id)
+            if on_done:
+                on_done()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "running": sorted(self.running),
+            }
@@ -0,0 +1,234 @@
+"""
+Geração de vídeos em lote.
+
+Um lote compartilha tema, voz e clima musical: trilha, narração final e capa
+são resolvidas uma única vez e reaproveitadas por todos os vídeos do lote.
+
+process_video_batch só resolve os recursos compartilhados e entrega cada
+item à fila de renderização (job_queue), com os recursos no payload. Os
+itens são reservados pelo despachante da fila (MonitorService) e renderizados
+no mesmo pool de memória dos vídeos agendados, no worker que estiver livre.
+Um worker em outra máquina, sem os arquivos do payload, resolve os recursos
+de novo uma vez por lote.
+"""
+import os
+import gc
+import json
+import time
+import threading
+from app.services.ai_generator import AIContentGenerator
+from app.services.video_generator import VideoGenerator
+from app.services.task_manager import update_task, get_task, update_batch, get_batch, queue_task, get_task_payload
+from app.services.render_budget import RenderBudget
+from app.services.render_pool import estimate_job_cost
+from app.services import eta_model, workspace, media_catalog, job_queue
+from app.services.job_stages import PipelineStopped
+
+# Recursos compartilhados já resolvidos neste processo (com o cache de quadros do slide final)
+_shared_cache = {}
+_shared_lock = threading.Lock()
+SHARED_CACHE_BATCHES = 8
+
+
+def build_script_plan(ai_service, mode, title, content, duration=1):
+    """Monta o roteiro conforme o modo. Retorna (plano, aspect_ratio)."""
+    if mode == "manual":
+        script_plan = {
+            "title": title,
+            "scenes": [{"text": line} for line in content.split('\n') if line.strip()]
+        }
+        aspect_ratio = "16:9"
+    elif mode == "topic":
+        script_plan = ai_service.generate_motivational_script(content, duration)
+        script_plan["title"] = title
+        aspect_ratio = "16:9"
+    elif mode == "story":
+        script_plan = ai_service.generate_video_script(title, content, "story")
+        aspect_ratio = "16:9"
+    elif mode == "short":
+        # YouTube Short por prompt: um único prompt → roteiro curto → vídeo vertical 9:16
+        script_plan = ai_service.generate_short_script_from_prompt(content)
+        script_plan["title"] = title or script_plan.get("title", "Short")
+        aspect_ratio = "9:16"
+    else:
+        script_plan = ai_service.generate_video_script(title, content, "drama")
+        aspect_ratio = "16:9"
+    return script_plan, aspect_ratio
+
+
+def _task_status(task_id):
+    task = get_task(task_id)
+    return task.get("status") if task else None
+
+
+def _render_batch_item(task_id, item, shared_assets, theme, voice_style, voice_gender, owns_lease=lambda: True):
+    """Renderiza o item. owns_lease() falso (lease perdido, item devolvido à fila): interrompe e
+    descarta o resultado sem gravar o estado. Retorna False nesse caso."""
+    features = None
+    discarded = False
+    started = time.monotonic()
+    budget = RenderBudget()
+    try:
+        update_task(task_id, status="processing", progress=5, message="Estruturando roteiro com IA...")
+        ai_service = AIContentGenerator()
+        video_gen = VideoGenerator(ai_service=ai_service, work_dir=workspace.path(workspace.task_key(task_id)))
+
+        content = item["content"]
+        if theme and item.get("mode") in ("topic", "short"):
+            content = f"{content}. Tema: {theme}"
+        with budget.stage("script"):
+            script_plan, aspect_ratio = build_script_plan(ai_service, item.get("mode", "topic"), item["title"], content, item.get("duration", 1))
+        # O clima musical é do lote, não de cada roteiro
+        script_plan["music_mood"] = shared_assets.get("music_mood")
+        features = eta_model.plan_features(script_plan, eta_model.video_size_for("short" if aspect_ratio == "9:16" else "video"))
+        update_task(task_id, predicted_seconds=eta_model.eta_model.predict(features))
+
+        def progress_callback(progress, message):
+            if not owns_lease():
+                raise PipelineStopped(f"Item {task_id} do lote interrompido: lease perdido")
+            update_task(task_id, progress=10 + int(progress * 0.9), message=message)
+
+        result = video_gen.create_video_from_plan(
+            script_plan,
+            aspect_ratio=aspect_ratio,
+            progress_callback=progress_callback,
+            voice_style=voice_style,
+            voice_gender=voice_gender,
+            shared_assets=shared_assets,
+            budget=budget
+        )
+        if not owns_lease():
+            # Outro worker está renderizando o item de novo: não sobrescreve o estado dele
+            print(f"Item {task_id} do lote: lease perdido, resultado descartado ({result['video_url']}).")
+            discarded = True
+            return False
+        media_catalog.register(result["video_url"], "batch", task_id=task_id)
+        eta_model.record("batch", features, result.get("stage_timings"), time.monotonic() - started,
+                         task_id=task_id, duration_seconds=result.get("duration_seconds"))
+        update_task(task_id, status="completed", progress=100, message="Vídeo gerado com sucesso!",
+                    result={"video_url": result["video_url"], "music_credit": result.get("music_credit"), "title": script_plan.get("title"), "degradations": result.get("degradations")})
+    except Exception as e:
+        if not owns_lease():
+            print(f"Item {task_id} do lote: lease perdido ({e}).")
+            discarded = True
+            return False
+        print(f"Erro no item {task_id} do lote: {e}")
+        if features:
+            eta_model.record("batch", features, budget.timings(), time.monotonic() - started, status="failed", task_id=task_id)
+        update_task(task_id, status="failed", message=f"Erro: {str(e)}")
+    finally:
+        # A pasta do item pode estar em uso pelo novo dono; a limpeza periódica a remove depois
+        if not discarded:
+            workspace.remove(workspace.task_key(task_id))
+        gc.collect()
+
+
+def _prepare_shared_assets(batch_id, params):
+    # Narração final e capa do lote: pasta própria, removida quando todos os itens terminam
+    video_gen = VideoGenerator(ai_service=AIContentGenerator(), work_dir=workspace.path(workspace.batch_key(batch_id)))
+    return video_gen.prepare_shared_assets(
+        music_mood=params.get("music_mood") or "drama",
+        voice_style=params.get("voice_style"),
+        voice_gender=params.get("voice_gender"),
+        cover_image_url=params.get("cover_image_url")
+    )
+
+
+def _shared_assets(batch_id, payload):
+    """Recursos compartilhados do payload; se os arquivos não existem nesta máquina, resolve de novo (uma vez por lote)"""
+    with _shared_lock:
+        if batch_id in _shared_cache:
+            return _shared_cache[batch_id]
+        shared_assets = dict(payload.get("shared_assets") or {})
+        files = [shared_assets.get(key) for key in ("music_path", "outro_audio_path", "cover_image_path")]
+        if any(path and not os.path.exists(path) for path in files):
+            shared_assets = _prepare_shared_assets(batch_id, payload)
+        shared_assets["frames"] = {}
+        if len(_shared_cache) >= SHARED_CACHE_BATCHES:
+            _shared_cache.pop(next(iter(_shared_cache)))
+        _shared_cache[batch_id] = shared_assets
+        return shared_assets
+
+
+def estimate_task_cost(task):
+    """Custo estimado (MB) de um item de lote da fila"""
+    item = (json.loads(task.payload) if task.payload else {}).get("item", {})
+    return estimate_job_cost("short" if item.get("mode") == "short" else "video", {}, item.get("duration") or 1)
+
+
+def run_batch_task(task_id, owner=job_queue.WORKER_ID):
+    """Renderiza um item de lote já reservado pela fila (chamado pelo despachante do MonitorService)"""
+    batch_id, payload = get_task_payload(task_id)
+    if not payload:
+        return
+    heartbeat = job_queue.Heartbeat(task_id, owner, max_seconds=None, renew_lease=job_queue.renew_task).start()
+
+    def owns_lease():
+        return not heartbeat.lost and job_queue.is_task_owner(task_id, owner)
+
+    kept = True
+    try:
+        try:
+            shared_assets = _shared_assets(batch_id, payload)
+        except Exception as e:
+            print(f"Erro ao preparar recursos do lote {batch_id}: {e}")
+            kept = owns_lease()
+            if kept:
+                update_task(task_id, status="failed", message=f"Erro: {str(e)}")
+            return
+        kept = _render_batch_item(task_id, payload["item"], shared_assets, payload.get("theme"),
+                                  payload.get("voice_style"), payload.get("voice_gender"), owns_lease=owns_lease) is not False
+    finally:
+        heartbeat.stop()
+        # Sem o lease, o item voltou à fila: quem o renderizar de novo fecha o lote
+        if batch_id and kept:
+            _finish_batch(batch_id)
+
+
+def _finish_batch(batch_id):
+    """Fecha o lote quando todos os itens terminaram (quem terminar o último fecha)"""
+    batch = get_batch(batch_id)
+    if not batch or batch["status"] in ("completed", "failed"):
+        return
+    if any(item["status"] not in ("completed", "failed") for item in batch["items"]):
+        return
+    failed = batch["failed"]
+    if failed == batch["total"]:
+        update_batch(batch_id, status="failed", message="Todos os vídeos do lote falharam.")
+    else:
+        update_batch(batch_id, status="completed", message=f"Lote concluído ({batch['total'] - failed}/{batch['total']} vídeos).")
+    with _shared_lock:
+        _shared_cache.pop(batch_id, None)
+    workspace.remove(workspace.batch_key(batch_id))
+
+
+def process_video_batch(batch_id, items, theme="", voice_style=None, voice_gender=None, music_mood="drama", cover_image_url=None):
+    """Resolve os recursos compartilhados e entrega os vídeos do lote à fila de renderização"""
+    batch = get_batch(batch_id)
+    if not batch:
+        return
+    params = {
+        "theme": theme,
+        "voice_style": voice_style,
+        "voice_gender": voice_gender,
+        "music_mood": music_mood,
+        "cover_image_url": cover_image_url,
+    }
+    try:
+        update_batch(batch_id, status="processing", message="Preparando recursos compartilhados (trilha, narração final, capa)...")
+        shared_assets = _prepare_shared_assets(batch_id, params)
+        shared_assets.pop("frames", None)
+
+        for entry, item in zip(batch["items"], items):
+            queue_task(entry["task_id"], dict(params, item=item, shared_assets=shared_assets))
+        update_batch(batch_id, message=f"{len(items)} vídeos na fila de renderização...")
+        # Import tardio: monitor_service importa este módulo
+        from app.services.monitor_service import monitor_service
+        monitor_service.notify_queue()
+    except Exception as e:
+        print(f"Erro no lote {batch_id}: {e}")
+        update_batch(batch_id, status="failed", message=f"Erro: {str(e)}")
+        for entry in batch["items"]:
+            if _task_status(entry["task_id"]) in ("pending", None):
+                update_task(entry["task_id"], status="failed", message=f"Lote interrompido: {str(e)}")
+        workspace.remove(workspace.batch_key(batch_id))
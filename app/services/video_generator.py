@@ -1,132 +1,29 @@
 import os
 import uuid
-import requests
 import gc
 import threading
 import asyncio
 import re
 from gtts import gTTS
 from moviepy import ImageClip, concatenate_videoclips, AudioFileClip, CompositeAudioClip, concatenate_audioclips
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance
-import textwrap
-import numpy as np
+from app.services import text_overlay, image_fetcher, music_library, render_profile, workspace
+from app.services.render_budget import RenderBudget, StageTimeout, call_with_deadline, request_timeout
+
+OUTRO_NARRATION = "Inscreva-se no canal e ative o sininho."
 
 class VideoGenerator:
-    def __init__(self, output_dir="app/static/videos", ai_service=None):
+    def __init__(self, output_dir="app/static/videos", ai_service=None, work_dir=None):
         self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
-        self.music_dir = "app/static/music"
+        # Intermediários (narração, imagens baixadas) ficam na pasta do job, fora de static
+        self.work_dir = work_dir or workspace.path(workspace.ADHOC)
+        self.music_dir = music_library.LEGACY_MUSIC_DIR
         os.makedirs(self.music_dir, exist_ok=True)
         self.ai_service = ai_service
-        self.MUSIC_CREDITS = {
-            "drama": "Music: Impact Prelude by Kevin MacLeod\nFree download: https://filmmusic.io/song/3900-impact-prelude\nLicense (CC BY 4.0): https://filmmusic.io/standard-license",
-            "epic": "Music: Impact Andante by Kevin MacLeod\nFree download: https://filmmusic.io/song/3898-impact-andante\nLicense (CC BY 4.0): https://filmmusic.io/standard-license",
-            "happy": "Music: Carefree by Kevin MacLeod\nFree download: https://filmmusic.io/song/3476-carefree\nLicense (CC BY 4.0): https://filmmusic.io/standard-license"
-        }
-        # self._ensure_fallback_music() removido do init para evitar delay no startup
-
-    def _ensure_fallback_music(self):
-        """Baixa músicas de fallback se a pasta estiver vazia"""
-        try:
-            import glob
-            if not glob.glob(os.path.join(self.music_dir, "*.mp3")):
-                print("Baixando músicas de fallback...")
-                music_urls = {
-                    "drama.mp3": "https://incompetech.com/music/royalty-free/mp3-royaltyfree/Impact%20Prelude.mp3",
-                    "epic.mp3": "https://incompetech.com/music/royalty-free/mp3-royaltyfree/Impact%20Andante.mp3",
-                    "happy.mp3": "https://incompetech.com/music/royalty-free/mp3-royaltyfree/Carefree.mp3"
-                }
-                
-                for filename, url in music_urls.items():
-                    try:
-                        print(f"Baixando {filename}...")
-                        response = requests.get(url, timeout=30)
-                        if response.status_code == 200:
-                            with open(os.path.join(self.music_dir, filename), 'wb') as f:
-                                f.write(response.content)
-                    except Exception as e:
-                        print(f"Erro ao baixar {filename}: {e}")
-        except Exception as e:
-            print(f"Erro no setup de músicas: {e}")
 
     def create_text_image(self, text, size=(1080, 1920), bg_color=(20, 20, 20), text_color=(255, 255, 255), bg_image_path=None):
         """Cria uma imagem com texto centralizado usando Pillow, opcionalmente com imagem de fundo"""
-        
-        if bg_image_path and os.path.exists(bg_image_path):
-            try:
-                img = Image.open(bg_image_path).convert('RGB')
-                # Resize and crop to fill
-                img_ratio = img.width / img.height
-                target_ratio = size[0] / size[1]
-                
-                if img_ratio > target_ratio:
-                    # Imagem mais larga que o alvo, corta as laterais
-                    new_height = size[1]
-                    new_width = int(new_height * img_ratio)
-                    img = img.resize((new_width, new_height), Image.LANCZOS)
-                    left = (new_width - size[0]) / 2
-                    img = img.crop((left, 0, left + size[0], size[1]))
-                else:
-                    # Imagem mais alta que o alvo, corta topo/base
-                    new_width = size[0]
-                    new_height = int(new_width / img_ratio)
-                    img = img.resize((new_width, new_height), Image.LANCZOS)
-                    top = (new_height - size[1]) / 2
-                    img = img.crop((0, top, size[0], top + size[1]))
-                
-                # Escurecer a imagem para legibilidade do texto
-                enhancer = ImageEnhance.Brightness(img)
-                img = enhancer.enhance(0.4) # 40% de brilho original
-            except Exception as e:
-                print(f"Erro ao carregar imagem de fundo: {e}")
-                img = Image.new('RGB', size, color=bg_color)
-        else:
-            img = Image.new('RGB', size, color=bg_color)
-
-        d = ImageDraw.Draw(img)
-        
-        # Tenta carregar uma fonte padrão, senão usa padrão
-        try:
-            # Tenta arial ou outra fonte do sistema se possível
-            # Reduzido tamanho para 40 para ser mais elegante
-            font = ImageFont.truetype("arial.ttf", 40)
-        except:
-            font = ImageFont.load_default()
-
-        # Quebra o texto
-        # Aumentado width para 40 caracteres para ocupar menos altura
-        lines = textwrap.wrap(text, width=40) 
-        
-        # Calcula altura total do bloco de texto
-        line_height = 50 # Reduzido line height
-        text_block_height = len(lines) * line_height
-        
-        # Posiciona no terço inferior (Subtitle style), mas com limite
-        # Garante que não suba muito para o meio
-        # Fixamos a base do texto a 100px do fundo
-        margin_bottom = 150
-        y_text = size[1] - text_block_height - margin_bottom
-        
-        # Se o texto for muito longo e subir demais, cortamos o topo (fallback)
-        # Mas idealmente o texto deve ser curto.
-        # Vamos desenhar o fundo preto
-        
-        # Fundo transparente (background box removido)
-        
-        for line in lines:
-            bbox = d.textbbox((0, 0), line, font=font)
-            text_width = bbox[2] - bbox[0]
-            
-            x = (size[0] - text_width) / 2
-            # Desenha texto com leve sombra/outline para legibilidade extra
-            # Outline
-            for off in [(1,1), (-1,-1), (1,-1), (-1,1)]:
-                d.text((x+off[0], y_text+off[1]), line, font=font, fill=(0,0,0))
-                
-            d.text((x, y_text), line, font=font, fill=text_color)
-            y_text += line_height
-
-        return np.array(img)
+        return text_overlay.render_frame(text, size, bg_color=bg_color, text_color=text_color, bg_image_path=bg_image_path)
 
     def _clean_text(self, text):
         """Limpa o texto de metadados, instruções de roteiro e markdown"""
@@ -152,8 +49,9 @@ class VideoGenerator:
 
         return text.strip()
 
-    def generate_audio(self, text, lang='pt', voice_style=None, voice_gender=None):
-        """Gera arquivo de áudio usando OpenAI (Human-like), Edge-TTS (Natural Free) ou gTTS (Fallback)"""
+    def generate_audio(self, text, lang='pt', voice_style=None, voice_gender=None, budget=None):
+        """Gera arquivo de áudio usando OpenAI (Human-like), Edge-TTS (Natural Free) ou gTTS (Fallback).
+        Com budget (RenderBudget), esgotado o orçamento da etapa 'tts' vai direto para gTTS."""
         if not text.strip(): return None
         
         # Limpeza de segurança para evitar leitura de metadados
@@ -172,26 +70,31 @@ class VideoGenerator:
             openai_voice = "fable"
         elif style in ["robotic", "robotica", "robótica"]:
             openai_voice = None
+
+        degraded = budget is not None and budget.expired("tts")
+        if degraded:
+            budget.degrade("tts", "gtts")
         
         # 1. Tentar OpenAI TTS (Qualidade Humana Premium)
-        if openai_voice and self.ai_service and self.ai_service.api_key:
+        if not degraded and openai_voice and self.ai_service and self.ai_service.api_key:
             try:
-                audio_content = self.ai_service.generate_audio(clean_text, voice=openai_voice)
+                audio_content = self._run_stage(budget, "tts", self.ai_service.generate_audio, clean_text, voice=openai_voice)
                 if audio_content:
                     filename = f"{uuid.uuid4()}.mp3"
-                    path = os.path.join(self.output_dir, filename)
+                    path = os.path.join(self.work_dir, filename)
                     with open(path, "wb") as f:
                         f.write(audio_content)
                     return path
+            except StageTimeout as e:
+                budget.degrade("tts", "gtts", reason=str(e))
+                degraded = True
             except Exception as e:
                 print(f"OpenAI TTS falhou, tentando fallback: {e}")
 
         # 2. Edge TTS (Qualidade Natural Gratuita - Microsoft)
-        if style not in ["robotic", "robotica", "robótica"]:
+        if not degraded and style not in ["robotic", "robotica", "robótica"]:
             try:
                 import edge_tts
-                import asyncio
-                import threading
                 
                 if lang == 'pt':
                     if gender == "male":
@@ -205,95 +108,281 @@ class VideoGenerator:
                         voice = "en-US-JennyNeural"
 
                 filename = f"{uuid.uuid4()}.mp3"
-                path = os.path.join(self.output_dir, filename)
+                path = os.path.join(self.work_dir, filename)
 
                 async def _run_edge_tts():
                     communicate = edge_tts.Communicate(clean_text, voice)
                     await communicate.save(path)
                     
-                t = threading.Thread(target=lambda: asyncio.run(_run_edge_tts()))
-                t.start()
-                t.join()
+                # Sem loop ativo nesta thread (renders rodam fora do event loop); o prazo da etapa vira wait_for
+                self._run_stage(budget, "tts", lambda: asyncio.run(asyncio.wait_for(_run_edge_tts(), request_timeout())))
 
                 if os.path.exists(path) and os.path.getsize(path) > 0:
                     return path
                 else:
                     print("Edge TTS gerou arquivo vazio ou falhou.")
+            except StageTimeout as e:
+                budget.degrade("tts", "gtts", reason=str(e))
             except Exception as e:
                  print(f"Edge TTS falhou: {e}")
 
         # 3. Fallback gTTS (Robótico)
         try:
             print("Usando Fallback gTTS (Robótico)...")
-            tts = gTTS(text=clean_text, lang=lang)
+            tts = gTTS(text=clean_text, lang=lang, timeout=30)
             filename = f"{uuid.uuid4()}.mp3"
-            path = os.path.join(self.output_dir, filename)
+            path = os.path.join(self.work_dir, filename)
             tts.save(path)
             return path
         except Exception as e:
             print(f"Erro no TTS Final: {e}")
             return None
 
-    def download_image(self, url):
-        try:
-            response = requests.get(url, stream=True)
-            if response.status_code == 200:
-                filename = f"temp_{uuid.uuid4()}.png"
-                filepath = os.path.join(self.output_dir, filename)
-                with open(filepath, 'wb') as f:
-                    for chunk in response.iter_content(1024):
-                        f.write(chunk)
-                return filepath
-        except Exception as e:
-            print(f"Erro ao baixar imagem: {e}")
+    def download_image(self, url, size=None):
+        """Baixa a imagem da cena; com size já a entrega no tamanho de renderização"""
+        return image_fetcher.fetch_image(url, self.work_dir, target_size=size, timeout=request_timeout())
+
+    def _run_stage(self, budget, stage, fn, *args, **kwargs):
+        """Executa fn dentro do orçamento da etapa (sem budget: chamada direta, sem prazo)"""
+        if budget is not None:
+            return budget.run(stage, fn, *args, **kwargs)
+        return call_with_deadline(fn, None, *args, **kwargs)
+
+    def resolve_music(self, music_mood, budget=None):
+        """Escolhe a trilha de fundo no pool pré-gerado do mood (instantâneo, sem rede).
+        Retorna (path, crédito)."""
+        if budget is not None:
+            with budget.stage("music"):
+                return self.resolve_music(music_mood)
+        track = music_library.pick(music_mood)
+        if track:
+            return track["path"], track.get("credit")
+        # Biblioteca ainda vazia (primeiro boot): usa arquivos soltos em app/static/music
+        return self.resolve_local_music(music_mood)
+
+    def resolve_local_music(self, music_mood):
+        """Escolhe uma faixa já presente na biblioteca local (nunca acessa a rede)"""
+        music_path = None
+        local_path = os.path.join(self.music_dir, f"{music_mood}.mp3")
+        if os.path.exists(local_path):
+            music_path = local_path
+        else:
+            try:
+                import glob
+                mp3_files = glob.glob(os.path.join(self.music_dir, "*.mp3"))
+                if mp3_files:
+                    music_path = mp3_files[0]
+                    print(f"Usando música fallback genérica: {music_path}")
+            except Exception as e:
+                print(f"Erro ao procurar fallback de música: {e}")
+        return music_path, self._music_credit(music_path)
+
+    def _music_credit(self, music_path):
+        if not music_path or not os.path.exists(music_path):
+            return None
+        filename = os.path.basename(music_path).lower()
+        for key, seed in music_library.SEED_TRACKS.items():
+            if key in filename:
+                return seed["credit"]
         return None
 
-    def create_video_from_plan(self, plan, cover_image_path=None, aspect_ratio="9:16", progress_callback=None, voice_style=None, voice_gender=None):
-        """Gera vídeo complexo com áudio e cenas a partir do plano da IA"""
+    def prepare_shared_assets(self, music_mood="drama", voice_style=None, voice_gender=None, cover_image_path=None, cover_image_url=None):
+        """Resolve uma única vez os recursos comuns a vários vídeos de um lote:
+        trilha sonora, narração do slide final e capa."""
+        music_path, music_credit = self.resolve_music(music_mood)
+
+        if not cover_image_path and cover_image_url:
+            if cover_image_url.startswith("/static"):
+                cover_image_path = f"app{cover_image_url}"
+            else:
+                cover_image_path = self.download_image(cover_image_url)
+
+        return {
+            "music_mood": music_mood,
+            "music_path": music_path,
+            "music_credit": music_credit,
+            "outro_audio_path": self.generate_audio(OUTRO_NARRATION, voice_style=voice_style, voice_gender=voice_gender),
+            "cover_image_path": cover_image_path if cover_image_path and os.path.exists(cover_image_path) else None,
+            "frames": {},
+        }
+
+    def create_video_from_plan(self, plan, cover_image_path=None, aspect_ratio="9:16", progress_callback=None, voice_style=None, voice_gender=None, shared_assets=None, budget=None):
+        """Gera vídeo complexo com áudio e cenas a partir do plano da IA.
+
+        Executa em sequência as etapas images, tts, music e encode (os
+        agendados rodam as mesmas etapas em paralelo e com retentativas, ver
+        job_stages). shared_assets (opcional, ver prepare_shared_assets)
+        reaproveita trilha, narração final e capa já resolvidas para um lote de
+        vídeos. budget (RenderBudget) limita o tempo de cada etapa; as
+        degradações aplicadas voltam em result["degradations"]."""
+        if budget is None:
+            budget = RenderBudget()
         if progress_callback:
             progress_callback(0, "Iniciando composição do vídeo...")
-            
+
+        images, failed = self.generate_scene_images(plan, aspect_ratio, budget, progress_callback=progress_callback, progress_range=(5, 45))
+        if failed:
+            budget.degrade("images", "gradiente procedural", reason=f"provedor de imagem falhou em {len(failed)} cena(s)")
+        narration = self.generate_narration(plan, voice_style, voice_gender, budget, shared_assets, progress_callback=progress_callback, progress_range=(45, 80))
+        if shared_assets and shared_assets.get("music_path"):
+            music = (shared_assets["music_path"], shared_assets.get("music_credit"))
+        else:
+            music = self.resolve_music(plan.get('music_mood', 'drama'), budget=budget)
+        try:
+            return self.compose_video(plan, images, narration, music, cover_image_path, aspect_ratio, progress_callback, shared_assets, budget)
+        finally:
+            self.discard_files(images)
+
+    @staticmethod
+    def discard_files(paths):
+        """Remove imagens temporárias das cenas (depois do encode)"""
+        for path in paths or []:
+            if path and "temp_" in path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _plan_scenes(plan):
+        scenes = plan.get('scenes', [])
+        # Validação extra: Se 'scenes' não for lista, tenta corrigir ou usa lista vazia
+        if not isinstance(scenes, list):
+            print(f"ALERTA: 'scenes' não é lista. Tipo: {type(scenes)}. Valor: {scenes}")
+            if isinstance(scenes, str):
+                # Pode ser que a IA retornou uma string única como cena
+                scenes = [{"text": scenes, "image_prompt": ""}]
+            else:
+                scenes = []
+        return scenes
+
+    def _scene_parts(self, scene):
+        """(texto limpo, prompt de imagem) de uma cena do plano"""
+        if isinstance(scene, str):
+            text = scene
+            # Auto-generate prompt for text-only scenes to ensure visuals
+            image_prompt = f"Cinematic digital art representing: {text[:100]}"
+        else:
+            text = scene.get('text', '')
+            image_prompt = scene.get('image_prompt', '')
+        # Limpeza de segurança para evitar metadados no vídeo
+        return self._clean_text(text), image_prompt
+
+    @staticmethod
+    def _slide_title(plan):
+        # Limpeza do título para evitar mostrar créditos ou URLs
+        clean_title = plan.get('title', 'Vídeo Sem Título')
+        if "Music:" in clean_title:
+            clean_title = clean_title.split("Music:")[0].strip()
+        if "http" in clean_title:
+            clean_title = clean_title.split("http")[0].strip()
+        # Limita tamanho do título no slide
+        if len(clean_title) > 100:
+            clean_title = clean_title[:97] + "..."
+        return clean_title
+
+    @staticmethod
+    def frame_size(aspect_ratio):
+        # Resolução do perfil de render (720p no free tier para evitar OOM)
+        return render_profile.frame_size(aspect_ratio)
+
+    def generate_scene_images(self, plan, aspect_ratio="9:16", budget=None, existing=None, progress_callback=None, progress_range=(10, 80)):
+        """Etapa 'images': fundo de cada cena gerado por IA.
+
+        Retorna uma lista com o caminho da imagem de cada cena, ou None (fundo
+        procedural). existing reaproveita imagens de uma tentativa anterior: só
+        as cenas que faltam são buscadas. Cenas cujo provedor falhou voltam em
+        failed (índices) para que quem chamou decida entre tentar de novo ou degradar."""
+        if budget is None:
+            budget = RenderBudget()
+        scenes = self._plan_scenes(plan)
+        video_size = self.frame_size(aspect_ratio)
+        paths = list(existing or [])
+        paths += [None] * (len(scenes) - len(paths))
+        failed = []
+        start, end = progress_range
+        for i, scene in enumerate(scenes):
+            if progress_callback:
+                progress_callback(start + int((i / len(scenes)) * (end - start)), f"Gerando imagem da cena {i+1} de {len(scenes)}...")
+            _, image_prompt = self._scene_parts(scene)
+            if paths[i] and os.path.exists(paths[i]):
+                continue
+            paths[i] = None
+            if not (self.ai_service and image_prompt):
+                continue
+            if budget.expired("images"):
+                budget.degrade("images", "gradiente procedural")
+                continue
+            print(f"Gerando imagem para cena {i+1}...")
+            # Otimiza prompt para aspect ratio
+            prompt_suffix = f". Aspect ratio {aspect_ratio}."
+            try:
+                image_url = budget.run("images", self.ai_service.generate_image, image_prompt + prompt_suffix, size=video_size)
+                if image_url:
+                    paths[i] = budget.run("images", self.download_image, image_url, size=video_size)
+            except StageTimeout as e:
+                budget.degrade("images", "gradiente procedural", reason=str(e))
+                continue
+            except Exception as e:
+                print(f"Erro ao gerar imagem da cena {i+1}: {e}")
+            if not paths[i]:
+                failed.append(i)
+        return paths, failed
+
+    def generate_narration(self, plan, voice_style=None, voice_gender=None, budget=None, shared_assets=None, existing=None, progress_callback=None, progress_range=(10, 80)):
+        """Etapa 'tts': narração do título, de cada cena e do slide final.
+
+        Retorna {"title": caminho, "scenes": [caminhos], "outro": caminho}
+        (None = trecho sem narração). existing reaproveita os áudios já gerados."""
+        scenes = self._plan_scenes(plan)
+        existing = existing or {}
+
+        def reuse(path):
+            return path if path and os.path.exists(path) else None
+
+        title_audio = reuse(existing.get("title")) or self.generate_audio(self._slide_title(plan), voice_style=voice_style, voice_gender=voice_gender, budget=budget)
+        scene_audio = list(existing.get("scenes") or [])
+        scene_audio += [None] * (len(scenes) - len(scene_audio))
+        start, end = progress_range
+        for i, scene in enumerate(scenes):
+            if progress_callback:
+                progress_callback(start + int((i / len(scenes)) * (end - start)), f"Narrando cena {i+1} de {len(scenes)}...")
+            scene_audio[i] = reuse(scene_audio[i]) or self.generate_audio(self._scene_parts(scene)[0], voice_style=voice_style, voice_gender=voice_gender, budget=budget)
+
+        if shared_assets and shared_assets.get("outro_audio_path"):
+            outro_audio = shared_assets["outro_audio_path"]
+        else:
+            outro_audio = reuse(existing.get("outro")) or self.generate_audio(OUTRO_NARRATION, voice_style=voice_style, voice_gender=voice_gender, budget=budget)
+        return {"title": title_audio, "scenes": scene_audio, "outro": outro_audio}
+
+    def compose_video(self, plan, images, narration, music, cover_image_path=None, aspect_ratio="9:16", progress_callback=None, shared_assets=None, budget=None):
+        """Etapa 'encode': monta os slides a partir dos artefatos das etapas anteriores e grava o MP4.
+
+        music é (caminho, crédito) da trilha de fundo."""
+        if budget is None:
+            budget = RenderBudget()
         clips = []
         final_clip = None
         bg_music = None
-        
+
         try:
-            title = plan.get('title', 'Vídeo Sem Título')
-            scenes = plan.get('scenes', [])
-            
-            # Validação extra: Se 'scenes' não for lista, tenta corrigir ou usa lista vazia
-            if not isinstance(scenes, list):
-                print(f"ALERTA: 'scenes' não é lista. Tipo: {type(scenes)}. Valor: {scenes}")
-                if isinstance(scenes, str):
-                    # Pode ser que a IA retornou uma string única como cena
-                    scenes = [{"text": scenes, "image_prompt": ""}]
-                else:
-                    scenes = []
+            scenes = self._plan_scenes(plan)
+            video_size = self.frame_size(aspect_ratio)
 
-            # Otimização de memória: Reduzir resolução para 720p para evitar OOM em tiers gratuitos
-            if aspect_ratio == "16:9":
-                video_size = (1280, 720) # Antes: 1920, 1080
-            else:
-                video_size = (720, 1280) # Antes: 1080, 1920
+            if shared_assets and not cover_image_path:
+                cover_image_path = shared_assets.get("cover_image_path")
 
             # 1. Slide de Título (Com capa se disponível)
             if progress_callback:
-                progress_callback(5, "Criando slide de título...")
-                
-            # Limpeza do título para evitar mostrar créditos ou URLs
-            clean_title = title
-            if "Music:" in clean_title:
-                clean_title = clean_title.split("Music:")[0].strip()
-            if "http" in clean_title:
-                clean_title = clean_title.split("http")[0].strip()
-            # Limita tamanho do título no slide
-            if len(clean_title) > 100:
-                clean_title = clean_title[:97] + "..."
-
-            title_audio_path = self.generate_audio(clean_title, voice_style=voice_style, voice_gender=voice_gender)
+                progress_callback(80, "Criando slide de título...")
+
+            clean_title = self._slide_title(plan)
+            title_audio_path = narration.get("title")
             
-            start_bg_path = cover_image_path if cover_image_path and os.path.exists(cover_image_path) else None
-            img_title = self.create_text_image(clean_title, size=video_size, bg_color=(50, 0, 100), bg_image_path=start_bg_path)
+            # Capa decodificada uma única vez: serve de fundo para o título e para o slide final
+            cover_frame = text_overlay.load_background(cover_image_path, video_size) if cover_image_path else None
+            title_bg = cover_frame if cover_frame is not None else text_overlay.solid_background(video_size, (50, 0, 100))
+            img_title = text_overlay.compose(title_bg, text_overlay.render_caption_layer(clean_title, video_size))
             
             clip_title = ImageClip(img_title)
             
@@ -308,45 +397,23 @@ class VideoGenerator:
             clips.append(clip_title)
             
             # 2. Cenas
-            total_scenes = len(scenes)
             for i, scene in enumerate(scenes):
-                if progress_callback:
-                    # Progresso proporcional entre 10% e 80%
-                    scene_progress = 10 + int((i / total_scenes) * 70)
-                    progress_callback(scene_progress, f"Processando cena {i+1} de {total_scenes}...")
-                    
-                if isinstance(scene, str):
-                    text = scene
-                    # Auto-generate prompt for text-only scenes to ensure visuals
-                    image_prompt = f"Cinematic digital art representing: {text[:100]}"
-                else:
-                    text = scene.get('text', '')
-                    image_prompt = scene.get('image_prompt', '')
-
-                # Limpeza de segurança para evitar metadados no vídeo
-                clean_text = self._clean_text(text)
-                
-                # Tentar gerar imagem com IA
-                bg_image_path = None
-                if self.ai_service and image_prompt:
-                    print(f"Gerando imagem para cena {i+1}...")
-                    # Otimiza prompt para aspect ratio
-                    prompt_suffix = f". Aspect ratio {aspect_ratio}."
-                    image_url = self.ai_service.generate_image(image_prompt + prompt_suffix)
-                    if image_url:
-                        bg_image_path = self.download_image(image_url)
+                clean_text, image_prompt = self._scene_parts(scene)
+                bg_image_path = images[i] if i < len(images) else None
+                # Cena que pedia imagem e ficou sem: gradiente procedural
+                fallback_background = None
+                if not bg_image_path and self.ai_service and image_prompt:
+                    fallback_background = text_overlay.gradient_background(video_size, seed=i)
 
                 # Fallback colors
                 bg_colors = [(30, 30, 30), (0, 30, 60), (60, 0, 30), (30, 60, 0)]
                 bg_color = bg_colors[i % len(bg_colors)]
                 
-                # Gerar Audio da cena
-                audio_path = self.generate_audio(clean_text, voice_style=voice_style, voice_gender=voice_gender)
-                
                 # Gerar Imagem
-                img = self.create_text_image(clean_text, size=video_size, bg_color=bg_color, bg_image_path=bg_image_path)
+                img = text_overlay.render_frame(clean_text, video_size, bg_color=bg_color, bg_image_path=bg_image_path, background=fallback_background)
                 clip = ImageClip(img)
                 
+                audio_path = narration["scenes"][i] if i < len(narration.get("scenes", [])) else None
                 if audio_path:
                     audio_clip_scene = AudioFileClip(audio_path)
                     clip = clip.with_duration(audio_clip_scene.duration + 0.5)
@@ -356,13 +423,6 @@ class VideoGenerator:
                     
                 clips.append(clip)
                 
-                # Limpar imagem temporária se foi baixada
-                if bg_image_path and "temp_" in bg_image_path:
-                    try:
-                        os.remove(bg_image_path)
-                    except:
-                        pass
-                
                 # Forçar coleta de lixo a cada cena para evitar pico
                 gc.collect()
                 
@@ -371,10 +431,17 @@ class VideoGenerator:
                 progress_callback(85, "Criando slide final...")
                 
             end_text = "Inscreva-se no Canal!\nLink na Bio."
-            audio_end_path = self.generate_audio("Inscreva-se no canal e ative o sininho.", voice_style=voice_style, voice_gender=voice_gender)
+            audio_end_path = narration.get("outro")
             
-            end_bg_path = cover_image_path if cover_image_path and os.path.exists(cover_image_path) else None
-            img_end = self.create_text_image(end_text, size=video_size, bg_color=(0, 100, 50), bg_image_path=end_bg_path)
+            frames = shared_assets.get("frames") if shared_assets else None
+            frame_key = ("outro", video_size)
+            if frames is not None and frame_key in frames:
+                img_end = frames[frame_key]
+            else:
+                end_bg = cover_frame if cover_frame is not None else text_overlay.solid_background(video_size, (0, 100, 50))
+                img_end = text_overlay.compose(end_bg, text_overlay.render_caption_layer(end_text, video_size))
+                if frames is not None:
+                    frames[frame_key] = img_end
             
             clip_end = ImageClip(img_end)
             
@@ -394,45 +461,9 @@ class VideoGenerator:
             if progress_callback:
                 progress_callback(90, "Adicionando trilha sonora...")
                 
-            music_mood = plan.get('music_mood', 'drama')
-            music_path = None
-            used_music_credit = None
-            
-            # Tenta gerar música exclusiva com IA
-            if self.ai_service:
-                print(f"Gerando música exclusiva para mood: {music_mood}...")
-                music_content = self.ai_service.generate_music(f"{music_mood} style, inspired by {title}")
-                if music_content:
-                    filename = f"music_{uuid.uuid4()}.wav" 
-                    generated_music_path = os.path.join(self.output_dir, filename)
-                    with open(generated_music_path, "wb") as f:
-                        f.write(music_content)
-                    music_path = generated_music_path
-            
-            # Se falhou ou não tem IA, usa biblioteca local
-            if not music_path or not os.path.exists(music_path):
-                 self._ensure_fallback_music()
-                 local_path = os.path.join("app/static/music", f"{music_mood}.mp3")
-                 if os.path.exists(local_path):
-                     music_path = local_path
-                 else:
-                     try:
-                         import glob
-                         mp3_files = glob.glob("app/static/music/*.mp3")
-                         if mp3_files:
-                             music_path = mp3_files[0]
-                             print(f"Usando música fallback genérica: {music_path}")
-                     except Exception as e:
-                         print(f"Erro ao procurar fallback de música: {e}")
+            music_path, used_music_credit = music
             
             if music_path and os.path.exists(music_path):
-                if not used_music_credit:
-                    filename = os.path.basename(music_path).lower()
-                    for key, credit in self.MUSIC_CREDITS.items():
-                        if key in filename:
-                            used_music_credit = credit
-                            break
-
                 try:
                     bg_music = AudioFileClip(music_path)
                     
@@ -486,13 +517,19 @@ class VideoGenerator:
             logger_kw = {"logger": write_logger} if write_logger else {}
             
             # Escreve o arquivo
-            # threads=1 + preset ultrafast para reduzir memória e tempo (evita OOM no Render)
+            # Threads, preset e fps do perfil de render (free tier: threads=1 + ultrafast, evita OOM)
+            profile = render_profile.current()
             print(f"Renderizando vídeo para: {output_path}")
-            final_clip.write_videofile(
-                output_path, fps=24, codec="libx264", audio_codec="aac", threads=1,
-                ffmpeg_params=["-preset", "ultrafast"],
-                **logger_kw
-            )
+            with budget.stage("encode"):
+                # Áudio temporário do moviepy também na pasta do job (o padrão é o diretório atual)
+                final_clip.write_videofile(
+                    output_path, codec="libx264", audio_codec="aac", temp_audiofile_path=self.work_dir,
+                    **render_profile.write_params(profile),
+                    **logger_kw
+                )
+            if budget.expired("encode"):
+                # O encode não tem fallback: apenas registramos o estouro para ajustar o orçamento
+                budget.degrade("encode", "nenhum", reason=f"encode levou {budget.spent['encode']:.0f}s (orçamento {budget.budgets['encode']:.0f}s)")
             
             abs_path = os.path.abspath(output_path)
             print(f"Vídeo salvo com sucesso em: {abs_path} (Size: {os.path.getsize(output_path)} bytes)")
@@ -500,7 +537,15 @@ class VideoGenerator:
             if progress_callback:
                 progress_callback(100, "Vídeo renderizado com sucesso!")
             
-            return {"video_url": f"/static/videos/{filename}", "music_credit": used_music_credit}
+            return {
+                "video_url": f"/static/videos/{filename}",
+                "music_credit": used_music_credit,
+                "degradations": budget.degradations,
+                "stage_timings": budget.timings(),
+                "renderer": profile["renderer"],
+                "video_size": video_size,
+                "duration_seconds": round(final_clip.duration or 0, 2)
+            }
             
         except Exception as e:
             print(f"Erro na geração do vídeo: {e}")
@@ -530,7 +575,7 @@ class VideoGenerator:
         """Gera clipe (vídeo) com a música como áudio e cenas baseadas na letra. Sem TTS."""
         if not os.path.exists(music_path):
             raise FileNotFoundError(f"Arquivo de música não encontrado: {music_path}")
-        video_size = (720, 1280) if aspect_ratio == "9:16" else (1280, 720)
+        video_size = self.frame_size(aspect_ratio)
         clips = []
         try:
             audio_clip = AudioFileClip(music_path)
@@ -544,9 +589,9 @@ class VideoGenerator:
                 if self.ai_service and image_prompt:
                     try:
                         prompt_suffix = f". Aspect ratio {aspect_ratio}."
-                        image_url = self.ai_service.generate_image(image_prompt + prompt_suffix)
+                        image_url = self.ai_service.generate_image(image_prompt + prompt_suffix, size=video_size)
                         if image_url:
-                            bg_image_path = self.download_image(image_url)
+                            bg_image_path = self.download_image(image_url, size=video_size)
                     except Exception as e:
                         print(f"Erro ao gerar imagem cena {i+1}: {e}")
                 bg_colors = [(30, 30, 30), (0, 30, 60), (60, 0, 30)]
@@ -564,7 +609,7 @@ class VideoGenerator:
             final = final.with_audio(audio_clip)
             filename = f"clip_{uuid.uuid4().hex[:8]}.mp4"
             output_path = os.path.join(self.output_dir, filename)
-            final.write_videofile(output_path, fps=24, codec="libx264", audio_codec="aac", verbose=False, logger=None)
+            final.write_videofile(output_path, codec="libx264", audio_codec="aac", temp_audiofile_path=self.work_dir, logger=None, **render_profile.write_params())
             for c in clips:
                 try:
                     c.close()
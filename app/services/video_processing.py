@@ -1,83 +1,174 @@
 import json
 import os
 import gc
-import datetime
 from app.database import SessionLocal
 from app.models import ScheduledVideo
 from app.services.ai_generator import AIContentGenerator
 from app.services.video_generator import VideoGenerator
+from app.services.render_budget import RenderBudget, StageTimeout, fallback_script_plan
+from app.services.render_pool import resolve_duration
+from app.services import job_queue, job_stages, workspace, media_catalog
+from app.services.progress_reporter import ProgressReporter
+from app.services import eta_model
 
-def process_scheduled_video(video_id: int):
+def _release_lease(video):
+    video.lease_owner = None
+    video.lease_expires_at = None
+
+def _merge_degradations(video, budget, executed):
+    """Degradações desta execução + as registradas antes para etapas reaproveitadas"""
+    try:
+        prior = json.loads(video.degradations) if video.degradations else []
+    except (TypeError, ValueError):
+        prior = []
+    kept = [d for d in prior if d.get("stage") not in executed]
+    merged = kept + budget.degradations
+    return json.dumps(merged) if merged else None
+
+def _stage_handlers(video, budget, progress_callback):
+    """Funções das etapas do DAG (job_stages) de um vídeo agendado.
+
+    Cada uma recebe as saídas das etapas anteriores e devolve a sua (JSON).
+    Etapas já concluídas em execuções anteriores são reaproveitadas."""
+    ai_service = AIContentGenerator()
+    video_id = video.id
+    # Pasta do vídeo persiste entre execuções: as etapas concluídas reaproveitam os arquivos
+    video_service = VideoGenerator(ai_service=ai_service, work_dir=workspace.path(workspace.video_key(video_id)))
+    script_data = json.loads(video.script_data) if video.script_data else {}
+
+    topic = video.title
+    concept = video.description or ""
+    
+    # Limpar créditos de música antigos do conceito/descrição para não contaminar o prompt
+    if "Music:" in concept:
+        concept = concept.split("Music:")[0].strip()
+    if "http" in concept: # Remove URLs comuns em créditos
+        concept = concept.split("http")[0].strip()
+        
+    # Gerar roteiro detalhado
+    # Se for short, 1 min. Se video, 5 min (padrão solicitado pelo user antes)
+    # Prioridade: Duração solicitada > Tipo Short (1min) > Padrão (3min)
+    duration = resolve_duration(video.video_type, script_data)
+    ratio = "9:16" if video.video_type == 'short' else "16:9"
+    voice_style, voice_gender = video.voice_style, video.voice_gender
+
+    def run_script(outputs, previous, final_attempt):
+        progress_callback(5, "Gerando roteiro...")
+        print(f"Gerando script para video {video_id}: {topic}")
+        try:
+            plan = budget.run("script", ai_service.generate_motivational_script, f"{topic}. Conceito: {concept}", duration)
+        except StageTimeout as e:
+            budget.degrade("script", "roteiro local", reason=str(e))
+            plan = fallback_script_plan(topic, concept)
+        return {"plan": plan}
+
+    def run_images(outputs, previous, final_attempt):
+        plan = outputs["script"]["plan"]
+        paths, failed = video_service.generate_scene_images(
+            plan, ratio, budget, existing=(previous or {}).get("images"), progress_callback=progress_callback
+        )
+        output = {"images": paths, "files": [path for path in paths if path]}
+        if failed and not final_attempt:
+            raise job_stages.StageRetry(f"provedor de imagem falhou em {len(failed)} cena(s)", partial=output)
+        if failed:
+            budget.degrade("images", "gradiente procedural", reason=f"provedor de imagem falhou em {len(failed)} cena(s)")
+        return output
+
+    def run_tts(outputs, previous, final_attempt):
+        plan = outputs["script"]["plan"]
+        narration = video_service.generate_narration(
+            plan, voice_style, voice_gender, budget, existing=(previous or {}).get("narration"), progress_callback=progress_callback
+        )
+        paths = [narration["title"], narration["outro"]] + narration["scenes"]
+        output = {"narration": narration, "files": [path for path in paths if path]}
+        if None in paths and not final_attempt:
+            raise job_stages.StageRetry(f"narração falhou em {paths.count(None)} trecho(s)", partial=output)
+        if None in paths:
+            budget.degrade("tts", "sem narração", reason=f"narração falhou em {paths.count(None)} trecho(s)")
+        return output
+
+    def run_music(outputs, previous, final_attempt):
+        music_path, credit = video_service.resolve_music(outputs["script"]["plan"].get("music_mood", "drama"), budget=budget)
+        return {"path": music_path, "credit": credit, "refs": [music_path] if music_path else []}
+
+    def run_encode(outputs, previous, final_attempt):
+        print(f"Renderizando video {video_id}...")
+        music = outputs["music"]
+        result = video_service.compose_video(
+            outputs["script"]["plan"],
+            outputs["images"]["images"],
+            outputs["tts"]["narration"],
+            (music["path"], music["credit"]),
+            aspect_ratio=ratio,
+            progress_callback=progress_callback,
+            budget=budget
+        )
+        result["refs"] = [os.path.join(video_service.output_dir, os.path.basename(result["video_url"]))]
+        media_catalog.register(result["video_url"], "scheduled", video_id=video_id)
+        return result
+
+    return {"script": run_script, "images": run_images, "tts": run_tts, "music": run_music, "encode": run_encode}
+
+def _record_telemetry(db, video, outputs, status):
+    """Telemetria do render a partir da duração registrada de cada etapa (inclui etapas adiantadas)"""
+    seconds, total = job_stages.critical_path_seconds(job_stages.summary(db, video.id))
+    features = eta_model.plan_features(outputs["script"]["plan"], eta_model.video_size_for(video.video_type))
+    eta_model.record("scheduled", features, seconds, total, status=status, video_id=video.id,
+                     duration_seconds=(outputs.get("encode") or {}).get("duration_seconds"))
+
+def _fail_video(db, video, error_msg, degradations):
+    _release_lease(video)
+    video.status = "failed"
+    video.progress = 0
+    if degradations:
+        video.degradations = degradations
+    # Append error to description for visibility in UI
+    current_desc = video.description or ""
+    # Avoid duplicating error messages
+    if "[ERRO]" not in current_desc:
+        video.description = f"{current_desc}\n\n[ERRO]: {error_msg}"[:5000] # Increased limit for traceback
+    db.commit()
+
+def process_scheduled_video(video_id: int, lease_owner: str = None):
+    """Renderiza um vídeo agendado executando as etapas pendentes do seu DAG (job_stages).
+    lease_owner: dono do lease quando o despachante já reservou o vídeo.
+    Retorna True se o vídeo foi concluído. MemoryError é propagada (após marcar a falha) para o sandbox."""
     # Re-instanciar DB session pois estamos em thread separada
     db = SessionLocal()
     video = None
+    budget = None
+    heartbeat = None
+    owner = lease_owner or job_queue.WORKER_ID
+    pipeline = None
     try:
+        # Reserva atômica (evita que dois workers processem o mesmo vídeo)
+        if lease_owner is None and not job_queue.claim(db, video_id, owner, statuses=("queued", "prepared")):
+            print(f"Video {video_id} não está na fila ou já está sendo processado.")
+            return
+
         video = db.query(ScheduledVideo).filter(ScheduledVideo.id == video_id).first()
         if not video:
             return
-            
-        # Double-check status to avoid race conditions if called from multiple places
-        if video.status == "processing":
-            print(f"Video {video_id} já está sendo processado.")
-            return
-
-        video.status = "processing"
-        db.commit()
+        heartbeat = job_queue.Heartbeat(video_id, owner).start()
         
-        # Recuperar dados do script
+        # Orçamentos por etapa podem vir no plano ({"budgets": {"images": 120, ...}})
         script_data = json.loads(video.script_data)
+        budget = RenderBudget(script_data.get("budgets"))
         
-        ai_service = AIContentGenerator()
-        video_service = VideoGenerator(ai_service=ai_service)
-        
-        topic = video.title
-        concept = video.description or ""
-        
-        # Limpar créditos de música antigos do conceito/descrição para não contaminar o prompt
-        if "Music:" in concept:
-            concept = concept.split("Music:")[0].strip()
-        if "http" in concept: # Remove URLs comuns em créditos
-            concept = concept.split("http")[0].strip()
-            
-        # Gerar roteiro detalhado
-        # Se for short, 1 min. Se video, 5 min (padrão solicitado pelo user antes)
-        # Prioridade: Duração solicitada > Tipo Short (1min) > Padrão (3min)
-        duration = 3 # Padrão
-        
-        if script_data.get('duration'):
-             try:
-                 duration = int(script_data.get('duration'))
-             except:
-                 pass
-        elif video.video_type == 'short':
-             duration = 1
-        
-        print(f"Gerando script para video {video_id}: {topic}")
-        final_script = ai_service.generate_motivational_script(f"{topic}. Conceito: {concept}", duration)
-        
-        # Gerar vídeo
-        def progress_callback(p, m):
-            try:
-                # p is 0-100; nunca diminuir progresso (evita mostrar 95% -> 24% se o logger/enviar valor errado)
-                new_p = int(p)
-                if new_p >= (video.progress or 0):
-                    video.progress = new_p
-                    video.updated_at = datetime.datetime.now()
-                    db.commit()
-            except:
-                pass
-            
-        ratio = "9:16" if video.video_type == 'short' else "16:9"
-        
-        print(f"Renderizando video {video_id}...")
-        result = video_service.create_video_from_plan(
-            final_script, 
-            aspect_ratio=ratio, 
-            progress_callback=progress_callback,
-            voice_style=video.voice_style,
-            voice_gender=video.voice_gender
+        # Progresso agrupado em memória e gravado com UPDATE direcionado (não usa a sessão do job)
+        progress_callback = ProgressReporter(video_id, initial=video.progress)
+
+        pipeline = job_stages.StagePipeline(
+            video_id,
+            _stage_handlers(video, budget, progress_callback),
+            should_stop=lambda: heartbeat.lost
         )
+        outputs = pipeline.run()
+        progress_callback.close()
+        result = outputs["encode"]
         video_path = result["video_url"]
+        if "encode" in pipeline.executed:
+            _record_telemetry(db, video, outputs, "completed")
         
         # Adicionar créditos ao script_data se possível ou salvar na descrição do vídeo
         if result.get("music_credit"):
@@ -87,25 +178,90 @@ def process_scheduled_video(video_id: int):
             if credit not in video.description:
                 video.description += credit
         
+        if not job_queue.is_owner(db, video_id, owner):
+            # Lease perdido (timeout ou reclamado por outro worker): não sobrescreve o estado atual
+            print(f"Video {video_id}: lease perdido, resultado descartado ({video_path}).")
+            db.rollback()
+            return
+
+        video.degradations = _merge_degradations(video, budget, pipeline.executed)
+        _release_lease(video)
         video.status = "completed"
         video.progress = 100
         video.video_url = video_path # path relativo /static/videos/...
+        # Arquivo novo: uma sessão de upload aberta para o anterior não serve mais
+        video.upload_session_uri = None
+        video.upload_offset = None
+        video.upload_size = None
+        video.upload_started_at = None
         db.commit()
         print(f"Video {video_id} concluído: {video_path}")
+        return True
         
     except Exception as e:
         import traceback
         error_msg = f"{str(e)}\n{traceback.format_exc()}"
         print(f"Erro ao gerar video agendado {video_id}: {error_msg}")
-        if video:
-            video.status = "failed"
-            video.progress = 0
-            # Append error to description for visibility in UI
-            current_desc = video.description or ""
-            # Avoid duplicating error messages
-            if "[ERRO]" not in current_desc:
-                video.description = f"{current_desc}\n\n[ERRO]: {error_msg}"[:5000] # Increased limit for traceback
-            db.commit()
+        if pipeline and "encode" in pipeline.executed and "script" in pipeline.outputs:
+            _record_telemetry(db, video, pipeline.outputs, "failed")
+        if video and job_queue.is_owner(db, video_id, owner):
+            _fail_video(db, video, error_msg, _merge_degradations(video, budget, pipeline.executed) if budget and pipeline else None)
+        if isinstance(e, MemoryError):
+            raise
+        return False
+    finally:
+        if heartbeat:
+            heartbeat.stop()
+        db.close()
+        gc.collect()
+
+def prepare_scheduled_video(video_id: int, lease_owner: str = job_queue.WORKER_ID):
+    """Adianta as etapas de rede (roteiro, imagens, narração, música) de um vídeo já
+    reservado como 'preparing'. Ao final o vídeo fica 'prepared', aguardando só o encode.
+    Retorna True se a preparação terminou."""
+    db = SessionLocal()
+    video = None
+    budget = None
+    heartbeat = None
+    pipeline = None
+    try:
+        video = db.query(ScheduledVideo).filter(ScheduledVideo.id == video_id).first()
+        if not video:
+            return False
+        heartbeat = job_queue.Heartbeat(video_id, lease_owner).start()
+        script_data = json.loads(video.script_data) if video.script_data else {}
+        budget = RenderBudget(script_data.get("budgets"))
+        progress_callback = ProgressReporter(video_id, initial=video.progress, status="preparing")
+
+        pipeline = job_stages.StagePipeline(
+            video_id,
+            _stage_handlers(video, budget, progress_callback),
+            target=job_stages.PREP_STAGES,
+            should_stop=lambda: heartbeat.lost
+        )
+        pipeline.run()
+        progress_callback(80, "Recursos prontos. Aguardando encode...")
+        progress_callback.close()
+
+        db.refresh(video)
+        if not job_queue.is_owner(db, video_id, lease_owner):
+            return False
+        video.degradations = _merge_degradations(video, budget, pipeline.executed)
+        _release_lease(video)
+        video.status = "prepared"
+        db.commit()
+        print(f"Video {video_id} preparado: aguardando encode.")
+        return True
+
+    except Exception as e:
+        import traceback
+        error_msg = f"{str(e)}\n{traceback.format_exc()}"
+        print(f"Erro ao preparar video agendado {video_id}: {error_msg}")
+        if video and job_queue.is_owner(db, video_id, lease_owner):
+            _fail_video(db, video, error_msg, _merge_degradations(video, budget, pipeline.executed) if budget and pipeline else None)
+        return False
     finally:
+        if heartbeat:
+            heartbeat.stop()
         db.close()
         gc.collect()
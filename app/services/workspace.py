@@ -0,0 +1,241 @@
+"""
+Áreas de trabalho (scratch) dos jobs de render, fora de app/static.
+
+Narrações, imagens de cena baixadas e outros intermediários de um job ficam
+em WORKSPACE_DIR/<chave>, nunca no diretório servido publicamente. Exemplos
+de chave: video-12, task-<uuid>, batch-<uuid>. Em app/static ficam só o MP4
+final e as músicas geradas.
+
+- Jobs sob demanda (tarefas, lotes, clipes) usam `with workspace.job(chave)`:
+  a pasta é removida ao final, com sucesso ou falha.
+- Vídeos agendados mantêm video-<id> entre execuções, porque o DAG de
+  job_stages reaproveita os arquivos. A pasta é removida quando o vídeo é
+  publicado, excluído ou regerado.
+- reap() roda na inicialização e como job periódico do monitor. Remove as
+  pastas de jobs que não estão mais ativos (ex: o processo caiu no meio do
+  render) e as sobras antigas em app/static/videos. Acima de
+  WORKSPACE_DISK_BUDGET_MB, apaga os arquivos mais antigos que não pertencem
+  a jobs em andamento. Vídeos com cópia no armazenamento durável (storage)
+  saem só do disco e são restaurados quando pedidos.
+"""
+import os
+import glob
+import time
+import uuid
+import shutil
+import datetime
+from contextlib import contextmanager
+
+ROOT = os.getenv("WORKSPACE_DIR", "workspaces")
+# Teto de disco para intermediários + vídeos/músicas gerados (0 = sem teto)
+DISK_BUDGET_MB = int(os.getenv("WORKSPACE_DISK_BUDGET_MB", "2048"))
+REAP_MINUTES = int(os.getenv("WORKSPACE_REAP_MINUTES", "30"))
+# Tarefa 'processing' sem atualização há mais que isso morreu com o processo
+TASK_STALE_MINUTES = 30
+# Pastas sem registro no banco (requisições síncronas, adhoc) e sobras em static
+STALE_HOURS = 6
+# Pasta recém-criada ainda pode não ter a linha no banco
+GRACE_SECONDS = 600
+
+VIDEOS_DIR = os.path.join("app", "static", "videos")
+MUSIC_DIR = os.path.join("app", "static", "music")
+# Pasta de quem não informou um job (ex: VideoGenerator() avulso)
+ADHOC = "adhoc"
+
+
+def video_key(video_id):
+    return f"video-{video_id}"
+
+
+def task_key(task_id):
+    return f"task-{task_id}"
+
+
+def batch_key(batch_id):
+    return f"batch-{batch_id}"
+
+
+def request_key():
+    return f"request-{uuid.uuid4().hex}"
+
+
+def path(key):
+    """Pasta do job (criada se não existir)"""
+    directory = os.path.join(ROOT, key)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def remove(key):
+    directory = os.path.join(ROOT, key)
+    if os.path.isdir(directory):
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextmanager
+def job(key):
+    """Pasta de um job sob demanda, removida ao sair (sucesso ou erro)"""
+    try:
+        yield path(key)
+    finally:
+        remove(key)
+
+
+def _size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def _mtime(file_path):
+    try:
+        return os.path.getmtime(file_path)
+    except OSError:
+        return 0
+
+
+def _dir_size(directory):
+    total = 0
+    for base, _, files in os.walk(directory):
+        total += sum(_size(os.path.join(base, name)) for name in files)
+    return total
+
+
+def _dir_mtime(directory):
+    """Modificação mais recente da pasta ou de qualquer arquivo dela"""
+    latest = _mtime(directory)
+    for base, _, files in os.walk(directory):
+        for name in files:
+            latest = max(latest, _mtime(os.path.join(base, name)))
+    return latest
+
+
+def _remove_file(file_path):
+    try:
+        os.remove(file_path)
+        return True
+    except OSError as e:
+        print(f"Erro ao remover {file_path}: {e}")
+        return False
+
+
+def _job_keys(db, now):
+    """(ativas, retidas): pastas de jobs em andamento e de vídeos agendados ainda não publicados"""
+    from app.models import ScheduledVideo, VideoTask
+
+    active, retained = set(), set()
+    for video_id, status in db.query(ScheduledVideo.id, ScheduledVideo.status).filter(ScheduledVideo.uploaded_at == None).all():
+        if status in ("preparing", "prepared", "processing", "uploading"):
+            active.add(video_key(video_id))
+        else:
+            retained.add(video_key(video_id))
+
+    stale_before = now - datetime.timedelta(minutes=TASK_STALE_MINUTES)
+    tasks = db.query(VideoTask.id, VideoTask.batch_id).filter(
+        VideoTask.status.in_(["pending", "processing"]),
+        VideoTask.updated_at >= stale_before
+    ).all()
+    for task_id, batch_id in tasks:
+        active.add(task_key(task_id))
+        if batch_id:
+            # Recursos compartilhados do lote vivem enquanto algum item estiver em aberto
+            active.add(batch_key(batch_id))
+    return active, retained
+
+
+def _pending_video_files(db):
+    """MP4s de vídeos agendados ainda não publicados (nunca são removidos pelo teto de disco)"""
+    from app.models import ScheduledVideo
+
+    urls = db.query(ScheduledVideo.video_url).filter(
+        ScheduledVideo.uploaded_at == None,
+        ScheduledVideo.video_url != None
+    ).all()
+    return {os.path.basename(url) for (url,) in urls}
+
+
+def reap(db=None, now=None):
+    """Remove pastas órfãs e sobras antigas e aplica o teto de disco. Retorna o resumo da limpeza."""
+    from app.database import SessionLocal
+
+    own_session = db is None
+    db = db or SessionLocal()
+    now = now or datetime.datetime.now()
+    clock = time.time()
+    removed = {"workspaces": 0, "leftovers": 0, "evicted": 0}
+    try:
+        active, retained = _job_keys(db, now)
+        pending_videos = _pending_video_files(db)
+    except Exception as e:
+        print(f"Erro ao consultar jobs ativos para limpeza: {e}")
+        return removed
+    finally:
+        if own_session:
+            db.close()
+
+    # 1. Pastas de jobs que não existem mais ou morreram no meio do render
+    workspaces = {}
+    if os.path.isdir(ROOT):
+        for key in os.listdir(ROOT):
+            directory = os.path.join(ROOT, key)
+            if not os.path.isdir(directory) or key in active:
+                continue
+            age = clock - _dir_mtime(directory)
+            if key in retained:
+                workspaces[key] = directory
+                continue
+            tracked = key.startswith(("video-", "task-", "batch-"))
+            if age > (GRACE_SECONDS if tracked else STALE_HOURS * 3600):
+                shutil.rmtree(directory, ignore_errors=True)
+                removed["workspaces"] += 1
+
+    # 2. Sobras da época em que os intermediários iam para app/static/videos
+    for pattern in ("temp_*", "*.mp3"):
+        for file_path in glob.glob(os.path.join(VIDEOS_DIR, pattern)):
+            if clock - _mtime(file_path) > STALE_HOURS * 3600 and _remove_file(file_path):
+                removed["leftovers"] += 1
+
+    # 3. Teto de disco: do mais antigo para o mais novo, nunca o que está em uso
+    if DISK_BUDGET_MB:
+        candidates = [(_dir_mtime(d), _dir_size(d), "dir", d) for d in workspaces.values()]
+        for file_path in glob.glob(os.path.join(VIDEOS_DIR, "*.mp4")):
+            if os.path.basename(file_path) not in pending_videos:
+                candidates.append((_mtime(file_path), _size(file_path), "video", file_path))
+        for file_path in glob.glob(os.path.join(MUSIC_DIR, "song_*")):
+            candidates.append((_mtime(file_path), _size(file_path), "file", file_path))
+
+        in_use = _dir_size(ROOT) if os.path.isdir(ROOT) else 0
+        in_use += sum(_size(f) for f in glob.glob(os.path.join(VIDEOS_DIR, "*")))
+        in_use += sum(_size(f) for f in glob.glob(os.path.join(MUSIC_DIR, "song_*")))
+        budget = DISK_BUDGET_MB * 1024 * 1024
+        for _, size, kind, target in sorted(candidates):
+            if in_use <= budget:
+                break
+            if kind == "dir":
+                shutil.rmtree(target, ignore_errors=True)
+            elif kind == "video":
+                # Com cópia durável só sai do disco; sem ela sai também do catálogo de mídia
+                from app.services import media_catalog
+                media_catalog.evict_local(media_catalog.url_for(target))
+            elif not _remove_file(target):
+                continue
+            in_use -= size
+            removed["evicted"] += 1
+        if in_use > budget:
+            print(f"Teto de disco ({DISK_BUDGET_MB} MB) excedido só com arquivos em uso: {in_use / (1024 * 1024):.0f} MB.")
+
+    if any(removed.values()):
+        print(f"Limpeza de arquivos: {removed['workspaces']} pastas órfãs, {removed['leftovers']} sobras, "
+              f"{removed['evicted']} itens removidos pelo teto de disco.")
+    return removed
+
+
+def usage():
+    """Uso de disco atual (MB) por área"""
+    return {
+        "workspaces_mb": round(_dir_size(ROOT) / (1024 * 1024), 1) if os.path.isdir(ROOT) else 0,
+        "videos_mb": round(sum(_size(f) for f in glob.glob(os.path.join(VIDEOS_DIR, "*"))) / (1024 * 1024), 1),
+        "songs_mb": round(sum(_size(f) for f in glob.glob(os.path.join(MUSIC_DIR, "song_*"))) / (1024 * 1024), 1),
+        "budget_mb": DISK_BUDGET_MB or None,
+    }
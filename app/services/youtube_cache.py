@@ -0,0 +1,117 @@
+"""
+Cache das leituras da YouTube Data API (channels, playlistItems, videos, search).
+
+/youtube/stats, auto-analysis, monetization-status e o check_channel_status
+do monitor buscavam o mesmo canal e a mesma playlist a cada chamada, gastando
+cota. Cada resposta fica em memória pelo TTL do recurso (TTLS). Quando expira,
+a próxima leitura manda o ETag guardado em If-None-Match. Se o recurso não
+mudou, o YouTube responde 304 sem corpo e a resposta guardada ganha outro TTL.
+
+A chave é a URL da requisição (recurso e parâmetros) mais a geração das
+credenciais do youtube_client: trocar de conta não reaproveita dados da
+anterior. Escritas (upload de vídeo, atualização do canal) chamam
+invalidate() para os recursos que mudaram.
+
+Toda requisição que chega à API é cobrada pelo custo do recurso, inclusive a
+revalidação que volta 304. snapshot() separa as unidades gastas em leituras
+completas (miss_units) das gastas em revalidações (revalidated_units).
+"""
+import os
+import copy
+import time
+import threading
+from googleapiclient.errors import HttpError
+from app.services import youtube_quota
+from app.services.youtube_client import youtube_client
+
+# Segundos que uma resposta vale sem revalidar (YOUTUBE_CACHE_TTL_SCALE multiplica todos; 0 desliga o cache)
+TTL_SCALE = float(os.getenv("YOUTUBE_CACHE_TTL_SCALE", "1"))
+TTLS = {
+    "channels": 300,
+    "playlistItems": 120,
+    "videos": 300,
+    "search": 600,
+}
+MAX_ENTRIES = 256
+# Custo de uma leitura em unidades de cota (search.list custa 100)
+READ_COST = {"search": 100}
+
+
+class YouTubeCache:
+    def __init__(self):
+        self._entries = {}  # chave -> {"resource", "etag", "response", "expires_at"}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.miss_units = 0
+        self.revalidated_units = 0
+
+    def execute(self, request, resource, max_age=None):
+        """request.execute() com cache. max_age=0 revalida pelo ETag mesmo dentro do TTL."""
+        ttl = TTLS.get(resource, 60) * TTL_SCALE
+        if not ttl:
+            return request.execute()
+        key = (youtube_client.generation, request.method, request.uri)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                age_limit = entry["expires_at"] if max_age is None else entry["stored_at"] + max_age
+                if now < age_limit:
+                    self.hits += 1
+                    return copy.deepcopy(entry["response"])
+        if entry and entry["etag"]:
+            request.headers["If-None-Match"] = entry["etag"]
+
+        cost = READ_COST.get(resource, 1)
+        youtube_quota.charge_read(cost)
+        try:
+            response = request.execute()
+        except HttpError as e:
+            if e.resp.status != 304 or not entry:
+                with self._lock:
+                    self.miss_units += cost
+                raise
+            # Não mudou: a resposta guardada vale por mais um TTL
+            with self._lock:
+                entry["stored_at"] = now
+                entry["expires_at"] = now + ttl
+                self.revalidated += 1
+                self.revalidated_units += cost
+            return copy.deepcopy(entry["response"])
+
+        with self._lock:
+            self.misses += 1
+            self.miss_units += cost
+            if len(self._entries) >= MAX_ENTRIES and key not in self._entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k]["stored_at"])
+                self._entries.pop(oldest)
+            self._entries[key] = {
+                "resource": resource,
+                "etag": response.get("etag") if isinstance(response, dict) else None,
+                "response": response,
+                "stored_at": now,
+                "expires_at": now + ttl,
+            }
+        return copy.deepcopy(response)
+
+    def invalidate(self, *resources):
+        """Descarta as respostas dos recursos (sem argumentos: todas)"""
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if not resources or entry["resource"] in resources]:
+                self._entries.pop(key)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "miss_units": self.miss_units,
+                "revalidated_units": self.revalidated_units,
+            }
+
+
+youtube_cache = YouTubeCache()
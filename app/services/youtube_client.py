@@ -0,0 +1,151 @@
+"""
+Cliente da YouTube Data API compartilhado pelo processo.
+
+Cada YouTubeService() lia Settings no banco, podia renovar o token OAuth
+(com sleep de 1s entre tentativas) e chamava discovery.build. Rotas como
+/youtube/stats e os jobs do monitor faziam isso a cada chamada. O
+YouTubeClient guarda as credenciais e:
+
+- relê Settings no máximo a cada SETTINGS_CHECK_SECONDS, ou logo após
+  invalidate() (novo token salvo, Configurações alteradas);
+- renova o access token antes de expirar (REFRESH_MARGIN), com lock, sem
+  depender do 401 de uma requisição;
+- constrói o serviço com o documento de discovery embutido na biblioteca
+  (static_discovery, sem HTTP), um por thread, porque o httplib2 por baixo
+  do googleapiclient não é thread-safe. As threads reaproveitam o serviço
+  até as credenciais mudarem.
+"""
+import os
+import time
+import datetime
+import threading
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build
+from app.database import SessionLocal
+from app.models import Settings
+
+# Escopos necessários
+SCOPES = [
+    'https://www.googleapis.com/auth/youtube.upload',
+    'https://www.googleapis.com/auth/youtube.force-ssl',
+    'https://www.googleapis.com/auth/youtube.readonly'
+]
+
+SETTINGS_CHECK_SECONDS = 30
+# Renova o token quando faltar menos que isso para expirar (o token dura 1h)
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+# Depois de uma renovação que falhou, espera antes de tentar de novo (em vez de a cada requisição)
+FAILED_REFRESH_RETRY_SECONDS = 60
+
+
+def _utcnow():
+    # google-auth guarda expiry como UTC sem fuso
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class YouTubeClient:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._credentials = None
+        self._fingerprint = None
+        self._generation = 0
+        self._next_check = 0
+        self._local = threading.local()
+
+    @property
+    def generation(self):
+        """Muda sempre que as credenciais em uso mudam (outra conta, token revogado)"""
+        return self._generation
+
+    def invalidate(self):
+        """Força reler as credenciais na próxima chamada (chamar após salvar Settings)"""
+        with self._lock:
+            self._fingerprint = None
+            self._next_check = 0
+
+    def _read_source(self):
+        """(impressão digital, loader) das credenciais configuradas: banco ou token.json"""
+        try:
+            db = SessionLocal()
+            try:
+                settings = db.query(Settings).first()
+            finally:
+                db.close()
+            if settings and settings.youtube_refresh_token and settings.youtube_client_id and settings.youtube_client_secret:
+                info = {
+                    "client_id": settings.youtube_client_id,
+                    "client_secret": settings.youtube_client_secret,
+                    "refresh_token": settings.youtube_refresh_token,
+                    "token_uri": "https://oauth2.googleapis.com/token",
+                }
+                # Não passar SCOPES aqui para evitar erro de invalid_scope se o token tiver escopos diferentes
+                return ("db", info["client_id"], info["client_secret"], info["refresh_token"]), \
+                    lambda: Credentials.from_authorized_user_info(info, scopes=None)
+        except Exception as e:
+            print(f"Erro ao acessar banco de dados para credenciais: {e}")
+
+        # Fallback para arquivo local (Desenvolvimento)
+        if os.path.exists('token.json'):
+            return ("file", os.path.getmtime('token.json')), \
+                lambda: Credentials.from_authorized_user_file('token.json', SCOPES)
+        return None, None
+
+    def _reload(self):
+        fingerprint, loader = self._read_source()
+        self._next_check = time.monotonic() + SETTINGS_CHECK_SECONDS
+        if fingerprint == self._fingerprint:
+            return
+        self._fingerprint = fingerprint
+        self._generation += 1
+        self._credentials = None
+        if loader:
+            try:
+                self._credentials = loader()
+            except Exception as e:
+                print(f"Erro ao carregar credenciais do YouTube: {e}")
+
+    def _needs_refresh(self, credentials):
+        if not credentials.refresh_token:
+            return False
+        # Credenciais recém-criadas a partir do refresh token ainda não têm access token
+        return not credentials.token or (credentials.expiry is not None and credentials.expiry - _utcnow() <= REFRESH_MARGIN)
+
+    def _refresh(self, credentials):
+        for attempt in (1, 2):
+            try:
+                credentials.refresh(Request())
+                return True
+            except Exception as e:
+                print(f"Erro ao atualizar token do YouTube (tentativa {attempt}): {e}")
+                if attempt == 1:
+                    time.sleep(1)
+        print(f"ERRO FATAL ao atualizar token do YouTube. Desconectando; nova tentativa em {FAILED_REFRESH_RETRY_SECONDS}s.")
+        self._credentials = None
+        self._fingerprint = None
+        self._generation += 1
+        self._next_check = time.monotonic() + FAILED_REFRESH_RETRY_SECONDS
+        return False
+
+    def credentials(self):
+        """Credenciais válidas (renovadas se perto de expirar) ou None se o YouTube não está conectado"""
+        with self._lock:
+            if time.monotonic() >= self._next_check:
+                self._reload()
+            if self._credentials and self._needs_refresh(self._credentials):
+                self._refresh(self._credentials)
+            return self._credentials
+
+    def service(self):
+        """Serviço youtube v3 desta thread (None sem credenciais)"""
+        credentials = self.credentials()
+        if not credentials:
+            return None
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            local.service = build('youtube', 'v3', credentials=credentials, static_discovery=True, cache_discovery=False)
+            local.generation = self._generation
+        return local.service
+
+
+youtube_client = YouTubeClient()
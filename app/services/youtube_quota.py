@@ -0,0 +1,157 @@
+"""
+Cota diária da YouTube Data API.
+
+O projeto do Google Cloud tem YOUTUBE_DAILY_QUOTA unidades por dia (padrão
+10.000), zeradas à meia-noite do horário do Pacífico. Um videos.insert custa
+1.600 unidades, então um backlog grande esgota a cota em poucos uploads e
+os demais falham com quotaExceeded. O consumo fica na tabela api_quota_usage,
+compartilhada entre reinícios e processos. reserve() é atômico: só reserva se
+a soma cabe na cota, e dois workers não gastam a mesma sobra.
+
+Leituras (youtube_cache) custam 1 unidade cada e não passam por reserve():
+charge_read() só acumula em memória, e flush() grava o total em um único
+UPDATE a cada FLUSH_SECONDS, antes de reserve()/snapshot() e ao parar o
+monitor.
+"""
+import os
+import time
+import datetime
+import threading
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from app.database import SessionLocal
+from app.models import ApiQuotaUsage
+
+DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+INSERT_COST = 1600
+# Intervalo máximo entre gravações das leituras acumuladas por charge_read()
+FLUSH_SECONDS = float(os.getenv("YOUTUBE_QUOTA_FLUSH_SECONDS", "30"))
+
+_pending_lock = threading.Lock()
+_pending_units = 0
+_last_flush = time.monotonic()
+
+try:
+    from zoneinfo import ZoneInfo
+    PACIFIC = ZoneInfo("America/Los_Angeles")
+except Exception:
+    # Sem base de fusos (tzdata): horário padrão do Pacífico, sem horário de verão
+    PACIFIC = datetime.timezone(datetime.timedelta(hours=-8))
+
+
+def quota_day(now=None):
+    """Dia da cota (YYYY-MM-DD no horário do Pacífico)"""
+    now = now or datetime.datetime.now().astimezone()
+    return now.astimezone(PACIFIC).date().isoformat()
+
+
+def next_reset(now=None):
+    """Próxima renovação da cota, no horário local do servidor (naive, como o agendador)"""
+    now = now or datetime.datetime.now().astimezone()
+    pacific = now.astimezone(PACIFIC)
+    midnight = datetime.datetime.combine(pacific.date() + datetime.timedelta(days=1), datetime.time(), tzinfo=PACIFIC)
+    return midnight.astimezone().replace(tzinfo=None)
+
+
+def _ensure_row(db, day):
+    if db.query(ApiQuotaUsage.id).filter(ApiQuotaUsage.day == day).first():
+        return
+    try:
+        db.add(ApiQuotaUsage(day=day, units=0))
+        db.commit()
+    except IntegrityError:
+        # Outro processo criou a linha do dia ao mesmo tempo
+        db.rollback()
+
+
+def _update(units, limit=None):
+    db = SessionLocal()
+    try:
+        day = quota_day()
+        _ensure_row(db, day)
+        query = "UPDATE api_quota_usage SET units = units + :units, updated_at = :now WHERE day = :day"
+        if limit is not None:
+            query += " AND units + :units <= :limit"
+        result = db.execute(text(query), {"units": units, "now": datetime.datetime.now(), "day": day, "limit": limit})
+        db.commit()
+        return result.rowcount == 1
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _add(units, limit=None):
+    try:
+        return _update(units, limit)
+    except Exception as e:
+        print(f"Erro ao registrar cota do YouTube: {e}")
+        # Sem controle de cota não bloqueia o upload: o próprio YouTube recusa se faltar
+        return True
+
+
+def flush():
+    """Grava as leituras acumuladas por charge_read() (se falhar, ficam para a próxima vez)"""
+    global _pending_units, _last_flush
+    with _pending_lock:
+        units, _pending_units = _pending_units, 0
+        _last_flush = time.monotonic()
+    if not units:
+        return
+    try:
+        _update(units)
+    except Exception as e:
+        print(f"Erro ao registrar cota do YouTube: {e}")
+        with _pending_lock:
+            _pending_units += units
+
+
+def reserve(units):
+    """Reserva units da cota de hoje. False se não cabem (a cota renova em next_reset())."""
+    flush()
+    return _add(units, DAILY_QUOTA)
+
+
+def charge(units):
+    """Registra consumo já feito, mesmo acima da cota (ex: sessão de upload recriada)"""
+    _add(units)
+
+
+def charge_read(units):
+    """Registra uma leitura da API sem ir ao banco: o total vai em flush()"""
+    global _pending_units
+    with _pending_lock:
+        _pending_units += units
+        due = time.monotonic() - _last_flush >= FLUSH_SECONDS
+    if due:
+        flush()
+
+
+def refund(units):
+    """Devolve uma reserva que não chegou a chamar a API"""
+    _add(-units)
+
+
+def used(db=None):
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        row = db.query(ApiQuotaUsage).filter(ApiQuotaUsage.day == quota_day()).first()
+        return row.units if row else 0
+    finally:
+        if own_session:
+            db.close()
+
+
+def snapshot(db=None):
+    flush()
+    units = used(db)
+    return {
+        "day": quota_day(),
+        "used": units,
+        "limit": DAILY_QUOTA,
+        "remaining": max(0, DAILY_QUOTA - units),
+        "uploads_left": max(0, DAILY_QUOTA - units) // INSERT_COST,
+        "resets_at": next_reset(),
+    }
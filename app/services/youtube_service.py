@@ -1,79 +1,30 @@
 import os
 import json
-from google.oauth2.credentials import Credentials
+import time
+import random
+import httplib2
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 from googleapiclient.errors import HttpError
 from app.database import SessionLocal
 from app.models import Settings
-
-# Escopos necessários
-SCOPES = [
-    'https://www.googleapis.com/auth/youtube.upload',
-    'https://www.googleapis.com/auth/youtube.force-ssl',
-    'https://www.googleapis.com/auth/youtube.readonly'
-]
+from app.services.youtube_client import youtube_client, SCOPES
+from app.services.youtube_cache import youtube_cache
+
+# Upload resumível em blocos (múltiplos de 256 KB, exigência da API)
+UPLOAD_CHUNK_BYTES = max(1, int(float(os.getenv("YOUTUBE_UPLOAD_CHUNK_MB", "8")) * 4)) * 256 * 1024
+# Falhas transitórias seguidas (5xx, conexão) antes de desistir da tentativa
+UPLOAD_MAX_RETRIES = int(os.getenv("YOUTUBE_UPLOAD_MAX_RETRIES", "8"))
+UPLOAD_MAX_BACKOFF = 64
+RETRIABLE_STATUS = (500, 502, 503, 504)
+# OSError cobre ConnectionError, timeouts de socket e erros de SSL
+RETRIABLE_ERRORS = (httplib2.HttpLib2Error, OSError)
 
 class YouTubeService:
     def __init__(self):
-        self.credentials = None
-        self.service = None
-        self._load_credentials()
-
-    def _load_credentials(self):
-        """Carrega credenciais do banco ou arquivo"""
-        
-        # 1. Tentar carregar do Banco de Dados
-        try:
-            db = SessionLocal()
-            settings = db.query(Settings).first()
-            db.close()
-
-            if settings and settings.youtube_refresh_token and settings.youtube_client_id and settings.youtube_client_secret:
-                try:
-                    info = {
-                        "client_id": settings.youtube_client_id,
-                        "client_secret": settings.youtube_client_secret,
-                        "refresh_token": settings.youtube_refresh_token,
-                        "token_uri": "https://oauth2.googleapis.com/token",
-                    }
-                    # Não passar SCOPES aqui para evitar erro de invalid_scope se o token tiver escopos diferentes
-                    self.credentials = Credentials.from_authorized_user_info(info, scopes=None)
-                except Exception as e:
-                    print(f"Erro ao carregar credenciais do YouTube do banco: {e}")
-        except Exception as e:
-            print(f"Erro ao acessar banco de dados para credenciais: {e}")
-            settings = None
-
-        # 2. Fallback para arquivo local (Desenvolvimento)
-        if not self.credentials and os.path.exists('token.json'):
-            try:
-                self.credentials = Credentials.from_authorized_user_file('token.json', SCOPES)
-            except Exception as e:
-                print(f"Erro ao carregar token.json: {e}")
-            
-        # 3. Atualizar token se expirado
-        if self.credentials and self.credentials.expired and self.credentials.refresh_token:
-            print("Token expirado. Tentando atualizar...")
-            try:
-                self.credentials.refresh(Request())
-                print("Token atualizado com sucesso.")
-            except Exception as e:
-                print(f"Erro ao atualizar token (tentativa 1): {e}")
-                # Retry once
-                try:
-                    import time
-                    time.sleep(1)
-                    self.credentials.refresh(Request())
-                    print("Token atualizado com sucesso na tentativa 2.")
-                except Exception as e2:
-                    print(f"ERRO FATAL ao atualizar token (tentativa 2): {e2}. Desconectando.")
-                    self.credentials = None
-
-        if self.credentials:
-            self.service = build('youtube', 'v3', credentials=self.credentials)
+        # Credenciais e serviço vêm do cliente compartilhado pelo processo (sem discovery nem refresh a cada instância)
+        self.credentials = youtube_client.credentials()
+        self.service = youtube_client.service() if self.credentials else None
 
     def get_auth_url(self):
         """Gera URL para o usuário autorizar (Fluxo simplificado)"""
@@ -179,6 +130,7 @@ class YouTubeService:
                 print("AVISO: client_secret não encontrado. Configure em Configurações.")
                 
             db.commit()
+            youtube_client.invalidate()
             print("Credenciais do YouTube salvas no banco com sucesso.")
         except Exception as e:
             print(f"Erro ao salvar credenciais no banco: {e}")
@@ -186,8 +138,8 @@ class YouTubeService:
             db.close()
 
 
-    def _get_my_channel(self):
-        """Helper para buscar o canal autenticado"""
+    def _get_my_channel(self, fresh=False):
+        """Helper para buscar o canal autenticado (do youtube_cache; fresh=True revalida pelo ETag)"""
         if not self.service:
             return None
             
@@ -196,7 +148,7 @@ class YouTubeService:
                 part="snippet,statistics,brandingSettings,contentDetails",
                 mine=True
             )
-            response = request.execute()
+            response = youtube_cache.execute(request, "channels", max_age=0 if fresh else None)
             
             if response['items']:
                 return response['items'][0]
@@ -219,11 +171,11 @@ class YouTubeService:
             uploads_playlist_id = channel['contentDetails']['relatedPlaylists']['uploads']
             
             # 2. Get Videos from Playlist
-            playlist_items = self.service.playlistItems().list(
+            playlist_items = youtube_cache.execute(self.service.playlistItems().list(
                 part="snippet,contentDetails",
                 playlistId=uploads_playlist_id,
                 maxResults=limit
-            ).execute()
+            ), "playlistItems")
             
             if not playlist_items.get('items'):
                 return []
@@ -231,10 +183,10 @@ class YouTubeService:
             video_ids = [item['contentDetails']['videoId'] for item in playlist_items['items']]
             
             # 3. Get Video Stats
-            videos_response = self.service.videos().list(
+            videos_response = youtube_cache.execute(self.service.videos().list(
                 part="statistics,snippet",
                 id=','.join(video_ids)
-            ).execute()
+            ), "videos")
             
             videos = []
             for item in videos_response['items']:
@@ -290,8 +242,13 @@ class YouTubeService:
         except Exception as e:
             return {"connected": False, "error": f"Erro ao buscar canal: {str(e)}"}
 
-    def upload_video(self, file_path, title, description, tags=[], category_id="27"): # 27 = Education
-        """Faz upload de um vídeo para o YouTube"""
+    def upload_video(self, file_path, title, description, tags=[], category_id="27", session_uri=None, on_progress=None): # 27 = Education
+        """Faz upload de um vídeo para o YouTube em blocos de UPLOAD_CHUNK_BYTES.
+
+        session_uri: sessão resumível de uma tentativa anterior; o envio continua do último byte
+        que o YouTube confirmou. on_progress(session_uri, offset) é chamado ao abrir a sessão e a
+        cada bloco enviado, para o chamador persistir o ponto de retomada.
+        """
         if not self.service:
             print("[MOCK] Upload de vídeo simulado (Sem credenciais)")
             return {"id": "mock_video_id", "status": "uploaded_mock"}
@@ -310,25 +267,76 @@ class YouTubeService:
                 }
             }
 
-            media = MediaFileUpload(file_path, chunksize=-1, resumable=True)
+            media = MediaFileUpload(file_path, chunksize=UPLOAD_CHUNK_BYTES, resumable=True)
 
             request = self.service.videos().insert(
                 part=','.join(body.keys()),
                 body=body,
                 media_body=media
             )
+            if session_uri:
+                # Em "estado de erro" o próximo next_chunk pergunta ao YouTube quantos bytes já chegaram
+                request.resumable_uri = session_uri
+                request._in_error_state = True
+                print(f"Retomando upload resumível de {file_path}...")
 
             response = None
+            failures = 0
+            saved = {"uri": session_uri, "offset": None}
+
+            def checkpoint():
+                # A sessão nasce dentro do primeiro next_chunk: salva assim que existir, mesmo se o bloco falhar
+                if on_progress and request.resumable_uri and (request.resumable_uri, request.resumable_progress) != (saved["uri"], saved["offset"]):
+                    saved["uri"], saved["offset"] = request.resumable_uri, request.resumable_progress
+                    on_progress(request.resumable_uri, request.resumable_progress)
+
             while response is None:
-                status, response = request.next_chunk()
+                try:
+                    status, response = request.next_chunk()
+                    failures = 0
+                except HttpError as e:
+                    if session_uri and request.resumable_uri == session_uri and e.resp.status in (404, 410):
+                        # Sessão expirada ou inexistente: recomeça do zero com uma nova
+                        print(f"Sessão de upload expirada ({e.resp.status}). Reiniciando o envio.")
+                        session_uri = None
+                        request.resumable_uri = None
+                        request.resumable_progress = 0
+                        request._in_error_state = False
+                        if on_progress:
+                            on_progress(None, 0)
+                        continue
+                    checkpoint()
+                    if e.resp.status not in RETRIABLE_STATUS:
+                        raise
+                    failures = self._upload_backoff(failures, e)
+                    continue
+                except RETRIABLE_ERRORS as e:
+                    checkpoint()
+                    failures = self._upload_backoff(failures, e)
+                    continue
+
+                if response is None:
+                    checkpoint()
                 if status:
                     print(f"Upload progresso: {int(status.progress() * 100)}%")
 
+            # Contagem de vídeos do canal e playlist de uploads mudaram
+            youtube_cache.invalidate("channels", "playlistItems")
             return response
         except Exception as e:
             print(f"Erro no upload para YouTube: {e}")
             return {"error": str(e)}
 
+    def _upload_backoff(self, failures, error):
+        """Espera exponencial com jitter entre tentativas do mesmo bloco. Retorna o novo total de falhas."""
+        failures += 1
+        if failures > UPLOAD_MAX_RETRIES:
+            raise error
+        delay = min(2 ** failures, UPLOAD_MAX_BACKOFF) + random.random()
+        print(f"Falha transitória no upload ({error}). Tentativa {failures}/{UPLOAD_MAX_RETRIES} em {delay:.1f}s...")
+        time.sleep(delay)
+        return failures
+
     def optimize_channel(self, ai_service):
         """Analisa e otimiza o canal usando IA"""
         stats = self.get_channel_stats()
@@ -367,6 +375,7 @@ class YouTubeService:
                 media_body=media
             )
             response = request.execute()
+            youtube_cache.invalidate("channels")
             print(f"Banner enviado. URL: {response.get('url')}")
             return response.get('url')
         except Exception as e:
@@ -379,8 +388,8 @@ class YouTubeService:
             return {"error": "Canal não conectado. Vá em Configurações > YouTube e conecte seu canal primeiro."}
         
         try:
-            # 1. Get current channel info using helper
-            item = self._get_my_channel()
+            # 1. Get current channel info using helper (revalidado: o update reescreve brandingSettings inteiro)
+            item = self._get_my_channel(fresh=True)
             if not item:
                 return {"error": "Channel not found"}
                 
@@ -435,6 +444,7 @@ class YouTubeService:
                 body=body
             )
             update_response = update_request.execute()
+            youtube_cache.invalidate("channels")
             return update_response
 
         except Exception as e:
@@ -466,7 +476,7 @@ class YouTubeService:
                     order="date",
                     type="video"
                 )
-                search_res = search_req.execute()
+                search_res = youtube_cache.execute(search_req, "search")
                 items = search_res.get("items", [])
                 videos = []
                 for item in items:
@@ -486,7 +496,7 @@ class YouTubeService:
                 playlistId=uploads_playlist_id,
                 maxResults=max_results
             )
-            playlist_items_res = playlist_items_req.execute()
+            playlist_items_res = youtube_cache.execute(playlist_items_req, "playlistItems")
             items = playlist_items_res.get("items", [])
 
             video_ids = [it["contentDetails"]["videoId"] for it in items if it.get("contentDetails")]
@@ -497,7 +507,7 @@ class YouTubeService:
                 part="snippet,statistics",
                 id=",".join(video_ids)
             )
-            videos_res = videos_req.execute()
+            videos_res = youtube_cache.execute(videos_req, "videos")
             videos = []
             for item in videos_res.get("items", []):
                 snippet = item.get("snippet", {})
@@ -0,0 +1,75 @@
+"""
+Worker de renderização independente do processo web.
+
+    python -m app.worker                          # só renderiza (padrão, escala horizontalmente)
+    python -m app.worker --roles uploads,monitor  # agendador: uploads + monitoramento
+
+Com o worker rodando à parte, defina EMBEDDED_WORKER=false no processo web:
+a API apenas enfileira e os renders (write_videofile pesado) não disputam
+CPU e memória com as requisições. Vários workers podem drenar a mesma fila
+(reserva com lease em job_queue). Uploads e monitoramento (relatórios do
+canal, músicas, limpeza) rodam em um único processo agendador (entrada
+scheduler do Procfile); cada upload ainda é reservado por UPDATE condicional
+antes de começar, então um segundo agendador não envia o mesmo vídeo duas vezes.
+"""
+import os
+import time
+import signal
+import argparse
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.database import engine, Base
+from app.migrations import run_migrations
+from app.services import job_queue
+from app.services.monitor_service import monitor_service, ALL_ROLES
+
+# Enfileirar na API acorda o worker pela versão em queue_signals (ver job_queue.signal_changed);
+# a varredura periódica fica como rede de segurança
+POLL_SECONDS = int(os.getenv("WORKER_POLL_SECONDS", "30"))
+# Tempo para renders em andamento terminarem ao receber SIGTERM (o lease cobre o resto)
+SHUTDOWN_GRACE_SECONDS = int(os.getenv("WORKER_SHUTDOWN_GRACE_SECONDS", "25"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de renderização e uploads")
+    parser.add_argument("--roles", default=os.getenv("WORKER_ROLES", "queue"),
+                        help=f"Loops a executar, separados por vírgula ({', '.join(ALL_ROLES)})")
+    args = parser.parse_args()
+    roles = [r.strip() for r in args.roles.split(",") if r.strip()]
+    unknown = set(roles) - set(ALL_ROLES)
+    if unknown:
+        parser.error(f"roles desconhecidos: {', '.join(sorted(unknown))}")
+
+    print(f"Iniciando worker {job_queue.WORKER_ID} (roles: {', '.join(roles)})...")
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        print(f"Worker recebeu sinal {signum}, encerrando...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    monitor_service.start(roles=roles, poll_seconds=POLL_SECONDS)
+    try:
+        while not stop.wait(1):
+            pass
+    finally:
+        monitor_service.stop()
+        deadline = time.monotonic() + SHUTDOWN_GRACE_SECONDS
+        while monitor_service.render_pool.snapshot()["running"] and time.monotonic() < deadline:
+            time.sleep(1)
+        running = monitor_service.render_pool.snapshot()["running"]
+        if running:
+            print(f"Worker encerrado com renders em andamento {sorted(running)}; serão retomados quando o lease expirar.")
+        print("Worker encerrado.")
+
+
+if __name__ == "__main__":
+    main()